@@ -0,0 +1,50 @@
+# Measures DynamoDB request throughput for different connection pool sizes at a fixed request concurrency.
+# Requires a running DynamoDB endpoint, e.g. LocalStack: docker run -p 4566:4566 localstack/localstack
+# Usage: DYNAMODB_ENDPOINT_URL=http://localhost:4566 PYTHONPATH=src python -m benchmarks.client_pool_size
+import asyncio
+import dataclasses
+import os
+import time
+import uuid
+
+from adapters.dynamodb import DynamoDBClientConfig, DynamoDBClientFactory, create_table
+
+CONCURRENCY = 200
+REQUESTS = 5_000
+POOL_SIZES = (10, 25, 50, 100, 200)
+
+
+async def measure(config: DynamoDBClientConfig, table_name: str) -> None:
+    async with DynamoDBClientFactory(config) as client:
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def get_item(n: int) -> None:
+            async with semaphore:
+                await client.get_item(TableName=table_name, Key={"PK": {"S": f"ITEM#{n}"}})
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*[get_item(n) for n in range(REQUESTS)])
+        elapsed = time.perf_counter() - started_at
+    print(f"max_pool_connections={config.max_pool_connections:<5} {REQUESTS / elapsed:10.0f} req/s")  # noqa: T201
+
+
+async def main() -> None:
+    base_config = DynamoDBClientConfig(
+        endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL", "http://localhost:4566"),
+        region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID", "testing"),
+        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY", "testing"),
+    )
+    table_name = f"benchmark-client-pool-size-{uuid.uuid4()}"
+    async with DynamoDBClientFactory(base_config) as client:
+        await create_table(client, table_name, with_range_key=False)
+    try:
+        for pool_size in POOL_SIZES:
+            await measure(dataclasses.replace(base_config, max_pool_connections=pool_size), table_name)
+    finally:
+        async with DynamoDBClientFactory(base_config) as client:
+            await client.delete_table(TableName=table_name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+# Measures per-item encode/decode time of the payment intent DTOs:
+# boto3 TypeSerializer/TypeDeserializer with pydantic round-trips against the generated DTO codec.
+# Usage: PYTHONPATH=src python -m benchmarks.dto_codec
+import time
+from typing import Callable
+
+import boto3.dynamodb.types
+
+from optimistic_payments.domain import PaymentIntent
+from optimistic_payments.repository.dynamodb import PaymentIntentDTO
+
+ITERATIONS = 20_000
+REPEATS = 5
+
+BOTO3_DESERIALIZER = boto3.dynamodb.types.TypeDeserializer()
+BOTO3_SERIALIZER = boto3.dynamodb.types.TypeSerializer()
+
+
+def measure(name: str, operation: Callable[[], object]) -> None:
+    best = float("inf")
+    for _ in range(REPEATS):
+        started_at = time.perf_counter()
+        for _ in range(ITERATIONS):
+            operation()
+        best = min(best, time.perf_counter() - started_at)
+    print(f"{name:<40} {best / ITERATIONS * 1_000_000:8.2f} us/op")  # noqa: T201
+
+
+def main() -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    payment_intent.request_charge()
+    dto = PaymentIntentDTO.from_entity(payment_intent)
+    item = dto.to_dynamodb_item()
+
+    measure("encode boto3+pydantic", lambda: {k: BOTO3_SERIALIZER.serialize(v) for k, v in dto.model_dump().items()})
+    measure("encode codec", dto.to_dynamodb_item)
+    measure(
+        "decode boto3+pydantic",
+        lambda: PaymentIntentDTO(**{k: BOTO3_DESERIALIZER.deserialize(v) for k, v in item.items()}),
+    )
+    measure("decode codec", lambda: PaymentIntentDTO.from_dynamodb_item(item))
+    measure("decode codec without validation", lambda: PaymentIntentDTO.from_dynamodb_item(item, validate=False))
+
+
+if __name__ == "__main__":
+    main()
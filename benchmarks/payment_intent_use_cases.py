@@ -0,0 +1,78 @@
+# Measures per-operation time of the payment intent use cases end-to-end through the repositories,
+# against the in-memory DynamoDB client, so no containers are needed and network latency doesn't hide the code's cost.
+# Usage: PYTHONPATH=src python -m benchmarks.payment_intent_use_cases
+import asyncio
+import time
+from typing import Awaitable, Callable, cast
+
+from types_aiobotocore_dynamodb import DynamoDBClient
+
+import optimistic_payments.use_cases
+import pessimistic_payments.use_cases
+from adapters.dynamodb import create_table
+from adapters.in_memory_dynamodb import InMemoryDynamoDBClient
+from optimistic_payments.repository import DynamoDBPaymentIntentRepository as OptimisticPaymentIntentRepository
+from pessimistic_payments.repository import DynamoDBPaymentIntentRepository as PessimisticPaymentIntentRepository
+
+ITERATIONS = 10_000
+REPEATS = 5
+
+
+async def measure(name: str, operation: Callable[[int], Awaitable[object]]) -> None:
+    best = float("inf")
+    for _ in range(REPEATS):
+        started_at = time.perf_counter()
+        for n in range(ITERATIONS):
+            await operation(n)
+        best = min(best, time.perf_counter() - started_at)
+    print(f"{name:<40} {best / ITERATIONS * 1_000_000:8.2f} us/op")  # noqa: T201
+
+
+async def main() -> None:
+    client = cast(DynamoDBClient, InMemoryDynamoDBClient())
+    await create_table(client, "optimistic", with_range_key=True)
+    await create_table(client, "pessimistic", with_range_key=True)
+
+    optimistic_repository = OptimisticPaymentIntentRepository(client, "optimistic")
+    optimistic_payment_intent = await optimistic_payments.use_cases.create_payment_intent(
+        "cust_123456", 100, "USD", optimistic_repository
+    )
+    await measure(
+        "optimistic create_payment_intent",
+        lambda n: optimistic_payments.use_cases.create_payment_intent("cust_123456", n, "USD", optimistic_repository),
+    )
+    await measure(
+        "optimistic get_payment_intent",
+        lambda n: optimistic_payments.use_cases.get_payment_intent(optimistic_payment_intent.id, optimistic_repository),
+    )
+    await measure(
+        "optimistic change_payment_intent_amount",
+        lambda n: optimistic_payments.use_cases.change_payment_intent_amount(
+            optimistic_payment_intent.id, n, optimistic_repository
+        ),
+    )
+
+    pessimistic_repository = PessimisticPaymentIntentRepository(client, "pessimistic")
+    pessimistic_payment_intent = await pessimistic_payments.use_cases.create_payment_intent(
+        "cust_123456", 100, "USD", pessimistic_repository
+    )
+    await measure(
+        "pessimistic create_payment_intent",
+        lambda n: pessimistic_payments.use_cases.create_payment_intent("cust_123456", n, "USD", pessimistic_repository),
+    )
+    await measure(
+        "pessimistic get_payment_intent",
+        lambda n: pessimistic_payments.use_cases.get_payment_intent(
+            pessimistic_payment_intent.id, pessimistic_repository
+        ),
+    )
+    await measure(
+        "pessimistic change_payment_intent_amount",
+        lambda n: pessimistic_payments.use_cases.change_payment_intent_amount(
+            pessimistic_payment_intent.id, n, pessimistic_repository
+        ),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+# Measures CPU overhead of DynamoDBPessimisticLock per acquire/release, excluding network round-trips.
+# Usage: PYTHONPATH=src python -m benchmarks.pessimistic_lock
+import asyncio
+import datetime
+import time
+from typing import Any, cast
+
+from types_aiobotocore_dynamodb import DynamoDBClient
+
+from database_locks import DynamoDBPessimisticLock
+
+ITERATIONS = 20_000
+REPEATS = 5
+
+
+class NoopDynamoDBClient:
+    class exceptions:  # noqa: N801
+        class ConditionalCheckFailedException(Exception):  # noqa: N818
+            pass
+
+    async def update_item(self, **kwargs: Any) -> dict:  # noqa: ANN401
+        return {"Attributes": {}}
+
+
+async def measure(name: str, lock: DynamoDBPessimisticLock) -> None:
+    key: dict = {"PK": {"S": "PAYMENT_INTENT#pi_123456"}, "SK": {"S": "#PAYMENT_INTENT"}}
+    best = float("inf")
+    for _ in range(REPEATS):
+        started_at = time.perf_counter()
+        for _ in range(ITERATIONS):
+            async with lock(key):
+                pass
+        best = min(best, time.perf_counter() - started_at)
+    print(f"{name:<40} {best / ITERATIONS * 1_000_000:8.2f} us/op")  # noqa: T201
+
+
+async def main() -> None:
+    client = cast(DynamoDBClient, NoopDynamoDBClient())
+    lock_timeout = datetime.timedelta(seconds=30)
+    await measure("default", DynamoDBPessimisticLock(client, "table"))
+    await measure("lock_timeout", DynamoDBPessimisticLock(client, "table", lock_timeout=lock_timeout))
+    await measure(
+        "lock_timeout+numeric_timestamps",
+        DynamoDBPessimisticLock(client, "table", lock_timeout=lock_timeout, numeric_timestamps=True),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
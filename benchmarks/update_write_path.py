@@ -0,0 +1,68 @@
+# Compares latency and consumed write capacity of the same version checked payment intent update
+# written with a plain UpdateItem and with a single item TransactWriteItems.
+# Requires a running DynamoDB endpoint, e.g. LocalStack: docker run -p 4566:4566 localstack/localstack
+# Usage: DYNAMODB_ENDPOINT_URL=http://localhost:4566 PYTHONPATH=src python -m benchmarks.update_write_path
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from adapters.dynamodb import DynamoDBClientConfig, DynamoDBClientFactory, create_table
+from optimistic_payments.domain import PaymentIntent
+from optimistic_payments.repository.dynamodb import PaymentIntentDTO
+
+ITERATIONS = 500
+
+
+async def measure(name: str, write: Callable[[PaymentIntentDTO], Awaitable[Any]], dto: PaymentIntentDTO) -> None:
+    latencies = []
+    capacity_units = 0.0
+    for _ in range(ITERATIONS):
+        started_at = time.perf_counter()
+        response = await write(dto)
+        latencies.append(time.perf_counter() - started_at)
+        consumed_capacity = response.get("ConsumedCapacity")
+        if isinstance(consumed_capacity, list):
+            capacity_units += sum(c.get("CapacityUnits", 0.0) for c in consumed_capacity)
+        elif consumed_capacity:
+            capacity_units += consumed_capacity.get("CapacityUnits", 0.0)
+        dto = dto.model_copy(update={"Version": dto.Version + 1})
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(  # noqa: T201
+        f"{name:<20} p50={quantiles[49] * 1000:7.2f}ms p99={quantiles[98] * 1000:7.2f}ms "
+        f"WCU/op={capacity_units / ITERATIONS:5.2f}"
+    )
+
+
+async def main() -> None:
+    config = DynamoDBClientConfig(
+        endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL", "http://localhost:4566"),
+        region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID", "testing"),
+        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY", "testing"),
+    )
+    table_name = f"benchmark-update-write-path-{uuid.uuid4()}"
+    async with DynamoDBClientFactory(config) as client:
+        await create_table(client, table_name, with_range_key=True)
+        try:
+
+            async def update_item(dto: PaymentIntentDTO) -> Any:
+                update = dto.update_item_request(table_name, {"amount"})["Update"]
+                return await client.update_item(**update, ReturnConsumedCapacity="TOTAL")
+
+            async def transact_write_items(dto: PaymentIntentDTO) -> Any:
+                update = dto.update_item_request(table_name, {"amount"})
+                return await client.transact_write_items(TransactItems=[update], ReturnConsumedCapacity="TOTAL")
+
+            for name, write in (("update_item", update_item), ("transact_write_items", transact_write_items)):
+                dto = PaymentIntentDTO.from_entity(PaymentIntent.create("cust_123456", 100, "USD"))
+                await client.put_item(TableName=table_name, Item=dto.to_dynamodb_item())
+                await measure(name, write, dto)
+        finally:
+            await client.delete_table(TableName=table_name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,183 @@
-from contextlib import suppress
+import asyncio
+import datetime
+from contextlib import AsyncExitStack, suppress
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any, Literal, Mapping
 
+from aiobotocore.config import AioConfig
+from aiobotocore.session import AioSession, get_session
 from types_aiobotocore_dynamodb import DynamoDBClient
-from types_aiobotocore_dynamodb.type_defs import AttributeDefinitionTypeDef, KeySchemaElementTypeDef
+from types_aiobotocore_dynamodb.type_defs import AttributeDefinitionTypeDef, KeySchemaElementTypeDef, PutTypeDef
 
+TRANSACT_WRITE_ITEMS_LIMIT = 100
 
-async def create_table(client: DynamoDBClient, table_name: str, *, with_range_key: bool) -> None:
+
+@dataclass(frozen=True, kw_only=True)
+class DynamoDBClientConfig:
+    endpoint_url: str | None = None
+    region_name: str | None = None
+    aws_access_key_id: str | None = None
+    aws_secret_access_key: str | None = None
+    # botocore's default of 10 pooled connections caps the number of concurrent requests per process
+    max_pool_connections: int = 100
+    keepalive_timeout: float = 60.0
+    connect_timeout: float = 1.0
+    read_timeout: float = 5.0
+    retry_mode: Literal["legacy", "standard", "adaptive"] = "standard"
+    total_max_attempts: int = 3
+
+    def aio_config(self) -> AioConfig:
+        return AioConfig(
+            max_pool_connections=self.max_pool_connections,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            retries={"mode": self.retry_mode, "total_max_attempts": self.total_max_attempts},
+            connector_args={"keepalive_timeout": self.keepalive_timeout},
+        )
+
+
+class DynamoDBClientFactory:
+    def __init__(self, config: DynamoDBClientConfig | None = None, *, session: AioSession | None = None) -> None:
+        self._config = config or DynamoDBClientConfig()
+        self._session = session or get_session()
+        self._exit_stack = AsyncExitStack()
+        self._client: DynamoDBClient | None = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self) -> DynamoDBClient:
+        return await self.get_client()
+
+    async def __aexit__(
+        self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        await self.close()
+
+    async def get_client(self) -> DynamoDBClient:
+        # A single client per process shares its connection pool between repositories and locks
+        async with self._lock:
+            if self._client is None:
+                self._client = await self._exit_stack.enter_async_context(
+                    self._session.create_client(
+                        "dynamodb",
+                        endpoint_url=self._config.endpoint_url,
+                        region_name=self._config.region_name,
+                        aws_access_key_id=self._config.aws_access_key_id,
+                        aws_secret_access_key=self._config.aws_secret_access_key,
+                        config=self._config.aio_config(),
+                    )
+                )
+            return self._client
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._exit_stack.aclose()
+            self._client = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class GroupCommitConfig:
+    max_delay: datetime.timedelta = datetime.timedelta(milliseconds=2)
+    max_items: int = 25
+    key_attributes: tuple[str, ...] = ("PK", "SK")
+
+    def __post_init__(self) -> None:
+        if not 1 <= self.max_items <= TRANSACT_WRITE_ITEMS_LIMIT:
+            raise ValueError(f"max_items must be between 1 and {TRANSACT_WRITE_ITEMS_LIMIT}")
+
+
+class DynamoDBGroupCommitWriter:
+    def __init__(self, client: DynamoDBClient, config: GroupCommitConfig | None = None) -> None:
+        self._client = client
+        self._config = config or GroupCommitConfig()
+        self._batch: list[tuple[PutTypeDef, asyncio.Future[None]]] = []
+        self._batch_keys: set[tuple[str, str]] = set()
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._commit_tasks: set[asyncio.Task] = set()
+
+    async def put_item(self, put: PutTypeDef) -> None:
+        key = (put["TableName"], repr([put["Item"].get(name) for name in self._config.key_attributes]))
+        if key in self._batch_keys:
+            # TransactWriteItems rejects two operations on the same item, so the second one goes to the next batch
+            self._flush()
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[None] = loop.create_future()
+        self._batch.append((put, future))
+        self._batch_keys.add(key)
+        if len(self._batch) >= self._config.max_items:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._config.max_delay.total_seconds(), self._flush)
+        # A cancelled caller must not cancel the commit of the other items in the same batch
+        await asyncio.shield(future)
+
+    async def flush(self) -> None:
+        self._flush()
+        await asyncio.gather(*self._commit_tasks, return_exceptions=True)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._batch:
+            return
+        batch, self._batch, self._batch_keys = self._batch, [], set()
+        task = asyncio.create_task(self._commit(batch))
+        self._commit_tasks.add(task)
+        task.add_done_callback(self._commit_tasks.discard)
+
+    async def _commit(self, batch: list[tuple[PutTypeDef, asyncio.Future[None]]]) -> None:
+        while batch:
+            try:
+                if len(batch) == 1:
+                    await self._client.put_item(**batch[0][0])
+                else:
+                    await self._client.transact_write_items(TransactItems=[{"Put": put} for put, _ in batch])
+            except self._client.exceptions.TransactionCanceledException as e:
+                reasons = e.response.get("CancellationReasons", [])
+                codes = {reason.get("Code") for reason in reasons}
+                if len(reasons) != len(batch) or not codes <= {"None", "ConditionalCheckFailed"}:
+                    self._set_exception(batch, e)
+                    return
+                # Nothing was written, so only the items whose condition failed are rejected and the rest are retried
+                remaining = []
+                for (put, future), reason in zip(batch, reasons):
+                    if reason.get("Code") == "ConditionalCheckFailed":
+                        if not future.done():
+                            future.set_exception(self._conditional_check_failed(reason))
+                    else:
+                        remaining.append((put, future))
+                batch = remaining
+            except Exception as e:  # noqa: BLE001
+                # Callers only await their futures, so a failure of any type must reach them instead of leaving them
+                # waiting forever on a commit task that died
+                self._set_exception(batch, e)
+                return
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+                return
+
+    def _conditional_check_failed(self, reason: Mapping[str, Any]) -> Exception:
+        # Raised as if the item was written with PutItem, so that callers don't depend on the batching
+        error_response: Any = {
+            "Error": {"Code": "ConditionalCheckFailedException", "Message": reason.get("Message", "")},
+            **({"Item": reason["Item"]} if "Item" in reason else {}),
+        }
+        return self._client.exceptions.ConditionalCheckFailedException(error_response, "PutItem")
+
+    @staticmethod
+    def _set_exception(batch: list[tuple[PutTypeDef, asyncio.Future[None]]], exception: Exception) -> None:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exception)
+
+
+async def create_table(
+    client: DynamoDBClient, table_name: str, *, with_range_key: bool, time_to_live_attribute: str | None = None
+) -> None:
     with suppress(client.exceptions.ResourceInUseException):
         attribute_definitions: list[AttributeDefinitionTypeDef] = [{"AttributeName": "PK", "AttributeType": "S"}]
         key_schema: list[KeySchemaElementTypeDef] = [{"AttributeName": "PK", "KeyType": "HASH"}]
@@ -19,3 +192,9 @@ async def create_table(client: DynamoDBClient, table_name: str, *, with_range_ke
             KeySchema=key_schema,
             BillingMode="PAY_PER_REQUEST",
         )
+
+        if time_to_live_attribute:
+            await client.update_time_to_live(
+                TableName=table_name,
+                TimeToLiveSpecification={"Enabled": True, "AttributeName": time_to_live_attribute},
+            )
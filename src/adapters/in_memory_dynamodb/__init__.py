@@ -0,0 +1,5 @@
+from .client import InMemoryDynamoDBClient
+
+__all__ = [
+    "InMemoryDynamoDBClient",
+]
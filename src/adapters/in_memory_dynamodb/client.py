@@ -0,0 +1,687 @@
+import asyncio
+import collections
+import datetime
+from dataclasses import dataclass, field
+from decimal import Decimal
+from types import TracebackType
+from typing import Any, Self
+
+from botocore.exceptions import ClientError
+
+from .expressions import (
+    AttributeValue,
+    Comparison,
+    ConditionExpression,
+    ExpressionError,
+    Item,
+    Path,
+    Value,
+    parse_condition,
+    parse_projection,
+    parse_update,
+)
+
+TRANSACT_ITEMS_LIMIT = 100
+BATCH_GET_ITEMS_LIMIT = 100
+BATCH_WRITE_ITEMS_LIMIT = 25
+
+KeyId = tuple[Any, Any]
+
+
+class InMemoryDynamoDBError(ClientError):
+    code = ""
+
+    @classmethod
+    def create(cls, operation_name: str, message: str, **response: Any) -> Self:
+        # Constructed like botocore's modeled exceptions, so that callers can raise them the same way
+        error_response: Any = {"Error": {"Code": cls.code, "Message": message}, "Message": message, **response}
+        return cls(error_response, operation_name)
+
+
+class ConditionalCheckFailedException(InMemoryDynamoDBError):
+    code = "ConditionalCheckFailedException"
+
+
+class TransactionCanceledException(InMemoryDynamoDBError):
+    code = "TransactionCanceledException"
+
+
+class ResourceInUseException(InMemoryDynamoDBError):
+    code = "ResourceInUseException"
+
+
+class ResourceNotFoundException(InMemoryDynamoDBError):
+    code = "ResourceNotFoundException"
+
+
+class ValidationException(InMemoryDynamoDBError):
+    code = "ValidationException"
+
+
+class InMemoryDynamoDBClientExceptions:
+    ClientError = ClientError
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    TransactionCanceledException = TransactionCanceledException
+    ResourceInUseException = ResourceInUseException
+    ResourceNotFoundException = ResourceNotFoundException
+
+
+@dataclass
+class _Table:
+    name: str
+    key_schema: list[dict[str, str]]
+    attribute_definitions: list[dict[str, str]]
+    created_at: datetime.datetime
+    time_to_live_attribute: str | None = None
+    partitions: dict[Any, dict[Any, Item]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.hash_key = next(k["AttributeName"] for k in self.key_schema if k["KeyType"] == "HASH")
+        self.range_key = next((k["AttributeName"] for k in self.key_schema if k["KeyType"] == "RANGE"), None)
+        self.key_types = {d["AttributeName"]: d["AttributeType"] for d in self.attribute_definitions}
+
+    @property
+    def key_attributes(self) -> tuple[str, ...]:
+        return (self.hash_key, self.range_key) if self.range_key else (self.hash_key,)
+
+    def key_id(self, operation_name: str, item: Item, *, exact: bool = False) -> KeyId:
+        if exact and len(item) != len(self.key_attributes):
+            raise ValidationException.create(operation_name, "The provided key element does not match the schema")
+        hash_id = self._key_value_id(operation_name, item, self.hash_key)
+        range_id = self._key_value_id(operation_name, item, self.range_key) if self.range_key else None
+        return hash_id, range_id
+
+    def hash_id(self, operation_name: str, value: AttributeValue) -> Any:
+        return self._key_value_id(operation_name, {self.hash_key: value}, self.hash_key)
+
+    def _key_value_id(self, operation_name: str, item: Item, attribute: str) -> Any:
+        value = item.get(attribute)
+        if value is None or self.key_types[attribute] not in value:
+            raise ValidationException.create(operation_name, "The provided key element does not match the schema")
+        data = value[self.key_types[attribute]]
+        return Decimal(data) if self.key_types[attribute] == "N" else data
+
+    def get(self, key_id: KeyId) -> Item | None:
+        if partition := self.partitions.get(key_id[0]):
+            return partition.get(key_id[1])
+        return None
+
+    def put(self, key_id: KeyId, item: Item) -> None:
+        self.partitions.setdefault(key_id[0], {})[key_id[1]] = item
+
+    def delete(self, key_id: KeyId) -> None:
+        if (partition := self.partitions.get(key_id[0])) is not None:
+            partition.pop(key_id[1], None)
+            if not partition:
+                del self.partitions[key_id[0]]
+
+    def item_count(self) -> int:
+        return sum(len(partition) for partition in self.partitions.values())
+
+
+@dataclass
+class _Write:
+    operation_name: str
+    table: _Table
+    key_id: KeyId
+    item: Item | None
+    condition: ConditionExpression | None = None
+    names: dict[str, str] = field(default_factory=dict)
+    values: dict[str, AttributeValue] = field(default_factory=dict)
+    condition_check_only: bool = False
+
+
+class InMemoryDynamoDBClient:
+    exceptions = InMemoryDynamoDBClientExceptions
+
+    def __init__(self, *, latency: datetime.timedelta = datetime.timedelta(0)) -> None:
+        self._tables: dict[str, _Table] = {}
+        self._latency = latency.total_seconds()
+        self.request_counts: collections.Counter[str] = collections.Counter()
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        pass
+
+    async def create_table(
+        self,
+        *,
+        TableName: str,
+        KeySchema: list[dict[str, str]],
+        AttributeDefinitions: list[dict[str, str]],
+        BillingMode: str = "PROVISIONED",
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        await self._round_trip("CreateTable")
+        if TableName in self._tables:
+            raise ResourceInUseException.create("CreateTable", f"Table already exists: {TableName}")
+        table = _Table(TableName, KeySchema, AttributeDefinitions, created_at=datetime.datetime.now(tz=datetime.UTC))
+        self._tables[TableName] = table
+        return {"TableDescription": self._describe(table)}
+
+    async def delete_table(self, *, TableName: str) -> dict[str, Any]:
+        await self._round_trip("DeleteTable")
+        table = self._table("DeleteTable", TableName)
+        del self._tables[TableName]
+        return {"TableDescription": self._describe(table)}
+
+    async def describe_table(self, *, TableName: str) -> dict[str, Any]:
+        await self._round_trip("DescribeTable")
+        return {"Table": self._describe(self._table("DescribeTable", TableName))}
+
+    async def update_time_to_live(self, *, TableName: str, TimeToLiveSpecification: dict[str, Any]) -> dict[str, Any]:
+        # Expired items are not removed - DynamoDB doesn't guarantee when the removal happens either
+        await self._round_trip("UpdateTimeToLive")
+        table = self._table("UpdateTimeToLive", TableName)
+        table.time_to_live_attribute = (
+            TimeToLiveSpecification["AttributeName"] if TimeToLiveSpecification["Enabled"] else None
+        )
+        return {"TimeToLiveSpecification": TimeToLiveSpecification}
+
+    async def describe_time_to_live(self, *, TableName: str) -> dict[str, Any]:
+        await self._round_trip("DescribeTimeToLive")
+        table = self._table("DescribeTimeToLive", TableName)
+        if table.time_to_live_attribute is None:
+            return {"TimeToLiveDescription": {"TimeToLiveStatus": "DISABLED"}}
+        return {"TimeToLiveDescription": {"TimeToLiveStatus": "ENABLED", "AttributeName": table.time_to_live_attribute}}
+
+    async def get_item(
+        self,
+        *,
+        TableName: str,
+        Key: Item,
+        ProjectionExpression: str | None = None,
+        ExpressionAttributeNames: dict[str, str] | None = None,
+        ConsistentRead: bool = False,
+    ) -> dict[str, Any]:
+        await self._round_trip("GetItem")
+        item = self._get_item("GetItem", TableName, Key, ProjectionExpression, ExpressionAttributeNames)
+        return {"Item": item} if item is not None else {}
+
+    async def put_item(
+        self,
+        *,
+        TableName: str,
+        Item: Item,
+        ConditionExpression: str | None = None,
+        ExpressionAttributeNames: dict[str, str] | None = None,
+        ExpressionAttributeValues: dict[str, AttributeValue] | None = None,
+        ReturnValues: str = "NONE",
+        ReturnValuesOnConditionCheckFailure: str = "NONE",
+    ) -> dict[str, Any]:
+        await self._round_trip("PutItem")
+        write = self._put_write(
+            "PutItem", TableName, Item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues
+        )
+        old_item = write.table.get(write.key_id)
+        self._check_condition_or_raise("PutItem", write, old_item, ReturnValuesOnConditionCheckFailure)
+        self._commit(write)
+        return self._return_values("PutItem", ReturnValues, old_item, write.item, [])
+
+    async def update_item(
+        self,
+        *,
+        TableName: str,
+        Key: Item,
+        UpdateExpression: str,
+        ConditionExpression: str | None = None,
+        ExpressionAttributeNames: dict[str, str] | None = None,
+        ExpressionAttributeValues: dict[str, AttributeValue] | None = None,
+        ReturnValues: str = "NONE",
+        ReturnValuesOnConditionCheckFailure: str = "NONE",
+    ) -> dict[str, Any]:
+        await self._round_trip("UpdateItem")
+        write, updated_attributes = self._update_write(
+            "UpdateItem",
+            TableName,
+            Key,
+            UpdateExpression,
+            ConditionExpression,
+            ExpressionAttributeNames,
+            ExpressionAttributeValues,
+        )
+        old_item = write.table.get(write.key_id)
+        self._check_condition_or_raise("UpdateItem", write, old_item, ReturnValuesOnConditionCheckFailure)
+        self._commit(write)
+        return self._return_values("UpdateItem", ReturnValues, old_item, write.item, updated_attributes)
+
+    async def delete_item(
+        self,
+        *,
+        TableName: str,
+        Key: Item,
+        ConditionExpression: str | None = None,
+        ExpressionAttributeNames: dict[str, str] | None = None,
+        ExpressionAttributeValues: dict[str, AttributeValue] | None = None,
+        ReturnValues: str = "NONE",
+        ReturnValuesOnConditionCheckFailure: str = "NONE",
+    ) -> dict[str, Any]:
+        await self._round_trip("DeleteItem")
+        write = self._delete_write(
+            "DeleteItem", TableName, Key, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues
+        )
+        old_item = write.table.get(write.key_id)
+        self._check_condition_or_raise("DeleteItem", write, old_item, ReturnValuesOnConditionCheckFailure)
+        self._commit(write)
+        return self._return_values("DeleteItem", ReturnValues, old_item, None, [])
+
+    async def transact_write_items(self, *, TransactItems: list[dict[str, Any]]) -> dict[str, Any]:
+        await self._round_trip("TransactWriteItems")
+        if not 0 < len(TransactItems) <= TRANSACT_ITEMS_LIMIT:
+            raise ValidationException.create(
+                "TransactWriteItems", f"Member must have length between 1 and {TRANSACT_ITEMS_LIMIT}"
+            )
+
+        writes: list[tuple[_Write, str]] = []
+        for transact_item in TransactItems:
+            ((action, request),) = transact_item.items()
+            writes.append((self._transact_write(action, request), request.get("ReturnValuesOnConditionCheckFailure")))
+        key_ids = [(id(write.table), write.key_id) for write, _ in writes]
+        if len(set(key_ids)) != len(key_ids):
+            raise ValidationException.create(
+                "TransactWriteItems", "Transaction request cannot include multiple operations on one item"
+            )
+
+        # Every condition is checked before anything is written, so that the transaction is all-or-nothing
+        reasons: list[dict[str, Any]] = []
+        for write, return_values_on_condition_check_failure in writes:
+            old_item = write.table.get(write.key_id)
+            if self._check_condition(write, old_item):
+                reasons.append({"Code": "None"})
+            else:
+                reasons.append(
+                    {
+                        "Code": "ConditionalCheckFailed",
+                        "Message": "The conditional request failed",
+                        **self._item_on_condition_check_failure(old_item, return_values_on_condition_check_failure),
+                    }
+                )
+        if any(reason["Code"] != "None" for reason in reasons):
+            codes = ", ".join(reason["Code"] for reason in reasons)
+            raise TransactionCanceledException.create(
+                "TransactWriteItems",
+                f"Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]",
+                CancellationReasons=reasons,
+            )
+        for write, _ in writes:
+            if not write.condition_check_only:
+                self._commit(write)
+        return {}
+
+    async def transact_get_items(self, *, TransactItems: list[dict[str, Any]]) -> dict[str, Any]:
+        await self._round_trip("TransactGetItems")
+        if not 0 < len(TransactItems) <= TRANSACT_ITEMS_LIMIT:
+            raise ValidationException.create(
+                "TransactGetItems", f"Member must have length between 1 and {TRANSACT_ITEMS_LIMIT}"
+            )
+        responses: list[dict[str, Any]] = []
+        for transact_item in TransactItems:
+            request = transact_item["Get"]
+            item = self._get_item(
+                "TransactGetItems",
+                request["TableName"],
+                request["Key"],
+                request.get("ProjectionExpression"),
+                request.get("ExpressionAttributeNames"),
+            )
+            responses.append({"Item": item} if item is not None else {})
+        return {"Responses": responses}
+
+    async def batch_get_item(self, *, RequestItems: dict[str, dict[str, Any]]) -> dict[str, Any]:
+        await self._round_trip("BatchGetItem")
+        if not 0 < sum(len(request["Keys"]) for request in RequestItems.values()) <= BATCH_GET_ITEMS_LIMIT:
+            raise ValidationException.create("BatchGetItem", "Too many items requested for the BatchGetItem call")
+        responses: dict[str, list[Item]] = {}
+        for table_name, request in RequestItems.items():
+            table = self._table("BatchGetItem", table_name)
+            key_ids = [table.key_id("BatchGetItem", key, exact=True) for key in request["Keys"]]
+            if len(set(key_ids)) != len(key_ids):
+                raise ValidationException.create("BatchGetItem", "Provided list of item keys contains duplicates")
+            responses[table_name] = [
+                item
+                for key in request["Keys"]
+                if (
+                    item := self._get_item(
+                        "BatchGetItem",
+                        table_name,
+                        key,
+                        request.get("ProjectionExpression"),
+                        request.get("ExpressionAttributeNames"),
+                    )
+                )
+                is not None
+            ]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    async def batch_write_item(self, *, RequestItems: dict[str, list[dict[str, Any]]]) -> dict[str, Any]:
+        await self._round_trip("BatchWriteItem")
+        if not 0 < sum(len(requests) for requests in RequestItems.values()) <= BATCH_WRITE_ITEMS_LIMIT:
+            raise ValidationException.create(
+                "BatchWriteItem", f"Member must have length between 1 and {BATCH_WRITE_ITEMS_LIMIT}"
+            )
+        writes: list[_Write] = []
+        for table_name, requests in RequestItems.items():
+            for request in requests:
+                if "PutRequest" in request:
+                    writes.append(self._put_write("BatchWriteItem", table_name, request["PutRequest"]["Item"]))
+                else:
+                    writes.append(self._delete_write("BatchWriteItem", table_name, request["DeleteRequest"]["Key"]))
+        key_ids = [(id(write.table), write.key_id) for write in writes]
+        if len(set(key_ids)) != len(key_ids):
+            raise ValidationException.create("BatchWriteItem", "Provided list of item keys contains duplicates")
+        for write in writes:
+            self._commit(write)
+        return {"UnprocessedItems": {}}
+
+    async def query(
+        self,
+        *,
+        TableName: str,
+        KeyConditionExpression: str,
+        FilterExpression: str | None = None,
+        ProjectionExpression: str | None = None,
+        ExpressionAttributeNames: dict[str, str] | None = None,
+        ExpressionAttributeValues: dict[str, AttributeValue] | None = None,
+        ScanIndexForward: bool = True,
+        Limit: int | None = None,
+        ExclusiveStartKey: Item | None = None,
+        ConsistentRead: bool = False,
+    ) -> dict[str, Any]:
+        await self._round_trip("Query")
+        table = self._table("Query", TableName)
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        key_condition = self._parse("Query", parse_condition, KeyConditionExpression)
+        filter_condition = self._parse("Query", parse_condition, FilterExpression) if FilterExpression else None
+        projection = self._parse("Query", parse_projection, ProjectionExpression) if ProjectionExpression else None
+        self._validate_placeholders("Query", [key_condition, filter_condition, projection], names, values)
+        hash_value = self._partition_key_value(table, key_condition, names, values)
+
+        partition = table.partitions.get(table.hash_id("Query", hash_value), {})
+        range_ids = sorted(partition, reverse=not ScanIndexForward) if table.range_key else list(partition)
+        if ExclusiveStartKey is not None:
+            start_range_id = table.key_id("Query", ExclusiveStartKey, exact=True)[1]
+            range_ids = [
+                range_id
+                for range_id in range_ids
+                if (range_id > start_range_id if ScanIndexForward else range_id < start_range_id)
+            ]
+
+        items: list[Item] = []
+        scanned_count = 0
+        last_evaluated_key: Item | None = None
+        for range_id in range_ids:
+            item = partition[range_id]
+            if not self._evaluate("Query", key_condition, item, names, values):
+                continue
+            scanned_count += 1
+            if filter_condition is None or self._evaluate("Query", filter_condition, item, names, values):
+                items.append(_copy_item(projection.project(item, names) if projection else item))
+            if Limit is not None and scanned_count == Limit:
+                last_evaluated_key = {attribute: _copy_value(item[attribute]) for attribute in table.key_attributes}
+                break
+
+        response: dict[str, Any] = {"Items": items, "Count": len(items), "ScannedCount": scanned_count}
+        if last_evaluated_key is not None:
+            response["LastEvaluatedKey"] = last_evaluated_key
+        return response
+
+    async def _round_trip(self, operation_name: str) -> None:
+        self.request_counts[operation_name] += 1
+        # Yielding to the event loop lets concurrent requests interleave as they would over the network
+        await asyncio.sleep(self._latency)
+
+    def _table(self, operation_name: str, table_name: str) -> _Table:
+        if (table := self._tables.get(table_name)) is None:
+            raise ResourceNotFoundException.create(operation_name, "Requested resource not found")
+        return table
+
+    def _describe(self, table: _Table) -> dict[str, Any]:
+        return {
+            "TableName": table.name,
+            "TableStatus": "ACTIVE",
+            "KeySchema": table.key_schema,
+            "AttributeDefinitions": table.attribute_definitions,
+            "CreationDateTime": table.created_at,
+            "ItemCount": table.item_count(),
+        }
+
+    def _get_item(
+        self,
+        operation_name: str,
+        table_name: str,
+        key: Item,
+        projection_expression: str | None,
+        names: dict[str, str] | None,
+    ) -> Item | None:
+        table = self._table(operation_name, table_name)
+        projection = (
+            self._parse(operation_name, parse_projection, projection_expression) if projection_expression else None
+        )
+        self._validate_placeholders(operation_name, [projection], names or {}, {})
+        if (item := table.get(table.key_id(operation_name, key, exact=True))) is None:
+            return None
+        return _copy_item(projection.project(item, names or {}) if projection else item)
+
+    def _put_write(
+        self,
+        operation_name: str,
+        table_name: str,
+        item: Item,
+        condition_expression: str | None = None,
+        names: dict[str, str] | None = None,
+        values: dict[str, AttributeValue] | None = None,
+    ) -> _Write:
+        table = self._table(operation_name, table_name)
+        condition = self._parse(operation_name, parse_condition, condition_expression) if condition_expression else None
+        self._validate_placeholders(operation_name, [condition], names or {}, values or {})
+        key_id = table.key_id(operation_name, item)
+        return _Write(operation_name, table, key_id, _copy_item(item), condition, names or {}, values or {})
+
+    def _update_write(
+        self,
+        operation_name: str,
+        table_name: str,
+        key: Item,
+        update_expression: str,
+        condition_expression: str | None = None,
+        names: dict[str, str] | None = None,
+        values: dict[str, AttributeValue] | None = None,
+    ) -> tuple[_Write, list[str]]:
+        table = self._table(operation_name, table_name)
+        key_id = table.key_id(operation_name, key, exact=True)
+        update = self._parse(operation_name, parse_update, update_expression)
+        condition = self._parse(operation_name, parse_condition, condition_expression) if condition_expression else None
+        names = names or {}
+        values = values or {}
+        self._validate_placeholders(operation_name, [update, condition], names, values)
+
+        old_item = table.get(key_id) or _copy_item(key)
+        try:
+            new_item, updated_attributes = update.apply(old_item, names, values)
+        except ExpressionError as e:
+            # DynamoDB checks the condition first, so an update that can't be applied fails on a failed condition
+            if condition and not self._evaluate(operation_name, condition, table.get(key_id) or {}, names, values):
+                return _Write(operation_name, table, key_id, None, condition, names, values), []
+            raise ValidationException.create(operation_name, str(e)) from e
+        if key_attribute := next((a for a in updated_attributes if a in table.key_attributes), None):
+            raise ValidationException.create(
+                operation_name, f"Cannot update attribute {key_attribute}. This attribute is part of the key"
+            )
+        return (
+            _Write(operation_name, table, key_id, _copy_item(new_item), condition, names, values),
+            updated_attributes,
+        )
+
+    def _delete_write(
+        self,
+        operation_name: str,
+        table_name: str,
+        key: Item,
+        condition_expression: str | None = None,
+        names: dict[str, str] | None = None,
+        values: dict[str, AttributeValue] | None = None,
+    ) -> _Write:
+        table = self._table(operation_name, table_name)
+        condition = self._parse(operation_name, parse_condition, condition_expression) if condition_expression else None
+        self._validate_placeholders(operation_name, [condition], names or {}, values or {})
+        key_id = table.key_id(operation_name, key, exact=True)
+        return _Write(operation_name, table, key_id, None, condition, names or {}, values or {})
+
+    def _transact_write(self, action: str, request: dict[str, Any]) -> _Write:
+        operation_name = "TransactWriteItems"
+        names = request.get("ExpressionAttributeNames")
+        values = request.get("ExpressionAttributeValues")
+        condition_expression = request.get("ConditionExpression")
+        if action == "Put":
+            return self._put_write(
+                operation_name, request["TableName"], request["Item"], condition_expression, names, values
+            )
+        if action == "Update":
+            write, _ = self._update_write(
+                operation_name,
+                request["TableName"],
+                request["Key"],
+                request["UpdateExpression"],
+                condition_expression,
+                names,
+                values,
+            )
+            return write
+        if action == "Delete":
+            return self._delete_write(
+                operation_name, request["TableName"], request["Key"], condition_expression, names, values
+            )
+        if action == "ConditionCheck":
+            write = self._delete_write(
+                operation_name, request["TableName"], request["Key"], condition_expression, names, values
+            )
+            write.condition_check_only = True
+            return write
+        raise ValidationException.create(operation_name, f"Unsupported transaction action: {action}")
+
+    def _check_condition(self, write: _Write, old_item: Item | None) -> bool:
+        if write.condition is None:
+            return True
+        return self._evaluate(write.operation_name, write.condition, old_item or {}, write.names, write.values)
+
+    def _check_condition_or_raise(
+        self, operation_name: str, write: _Write, old_item: Item | None, return_values_on_condition_check_failure: str
+    ) -> None:
+        if not self._check_condition(write, old_item):
+            raise ConditionalCheckFailedException.create(
+                operation_name,
+                "The conditional request failed",
+                **self._item_on_condition_check_failure(old_item, return_values_on_condition_check_failure),
+            )
+
+    @staticmethod
+    def _item_on_condition_check_failure(old_item: Item | None, return_values: str | None) -> dict[str, Any]:
+        if return_values == "ALL_OLD" and old_item is not None:
+            return {"Item": _copy_item(old_item)}
+        return {}
+
+    @staticmethod
+    def _commit(write: _Write) -> None:
+        if write.item is None:
+            write.table.delete(write.key_id)
+        else:
+            write.table.put(write.key_id, write.item)
+
+    @staticmethod
+    def _return_values(
+        operation_name: str,
+        return_values: str,
+        old_item: Item | None,
+        new_item: Item | None,
+        updated_attributes: list[str],
+    ) -> dict[str, Any]:
+        if return_values == "NONE":
+            return {}
+        if return_values == "ALL_OLD":
+            attributes = old_item
+        elif return_values == "ALL_NEW" and operation_name == "UpdateItem":
+            attributes = new_item
+        elif return_values == "UPDATED_OLD" and operation_name == "UpdateItem":
+            attributes = {a: old_item[a] for a in updated_attributes if old_item and a in old_item}
+        elif return_values == "UPDATED_NEW" and operation_name == "UpdateItem":
+            attributes = {a: new_item[a] for a in updated_attributes if new_item and a in new_item}
+        else:
+            raise ValidationException.create(operation_name, f"Return values set to invalid value: {return_values}")
+        return {"Attributes": _copy_item(attributes)} if attributes else {}
+
+    @staticmethod
+    def _parse(operation_name: str, parse: Any, expression: str) -> Any:
+        try:
+            return parse(expression)
+        except ExpressionError as e:
+            raise ValidationException.create(operation_name, str(e)) from e
+
+    @staticmethod
+    def _evaluate(
+        operation_name: str,
+        condition: ConditionExpression,
+        item: Item,
+        names: dict[str, str],
+        values: dict[str, AttributeValue],
+    ) -> bool:
+        try:
+            return condition.evaluate(item, names, values)
+        except ExpressionError as e:
+            raise ValidationException.create(operation_name, str(e)) from e
+
+    @staticmethod
+    def _validate_placeholders(
+        operation_name: str, expressions: list[Any], names: dict[str, str], values: dict[str, AttributeValue]
+    ) -> None:
+        # Same as DynamoDB - both undefined and unused placeholders are rejected
+        used_names = set().union(*(e.names for e in expressions if e is not None))
+        used_values = set().union(*(e.values for e in expressions if e is not None))
+        if undefined := sorted((used_names - names.keys()) | (used_values - values.keys())):
+            raise ValidationException.create(
+                operation_name,
+                f"An expression attribute name or value used in an expression is not defined: {undefined}",
+            )
+        if unused := sorted((names.keys() - used_names) | (values.keys() - used_values)):
+            raise ValidationException.create(
+                operation_name,
+                f"Value provided in ExpressionAttributeNames or ExpressionAttributeValues unused in expressions: {unused}",
+            )
+
+    @staticmethod
+    def _partition_key_value(
+        table: _Table, key_condition: ConditionExpression, names: dict[str, str], values: dict[str, AttributeValue]
+    ) -> AttributeValue:
+        for condition in key_condition.conjuncts():
+            if (
+                isinstance(condition, Comparison)
+                and condition.operator == "="
+                and isinstance(condition.left, Path)
+                and isinstance(condition.right, Value)
+                and condition.left.resolve(names) == table.hash_key
+            ):
+                return values[condition.right.name]
+        raise ValidationException.create("Query", "Query condition missed key schema element: " + table.hash_key)
+
+
+def _copy_item(item: Item) -> Item:
+    return {attribute: _copy_value(value) for attribute, value in item.items()}
+
+
+def _copy_value(value: AttributeValue) -> AttributeValue:
+    # Callers own the returned items, so stored items are never shared with them
+    ((type_, data),) = value.items()
+    if type_ == "M":
+        return {"M": _copy_item(data)}
+    if type_ == "L":
+        return {"L": [_copy_value(v) for v in data]}
+    if isinstance(data, list):
+        return {type_: list(data)}
+    return {type_: data}
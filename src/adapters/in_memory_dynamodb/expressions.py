@@ -0,0 +1,584 @@
+import functools
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Protocol
+
+AttributeValue = dict[str, Any]
+Item = dict[str, AttributeValue]
+Names = dict[str, str]
+Values = dict[str, AttributeValue]
+
+_TOKEN_PATTERN = re.compile(
+    r"\s*(?:(?P<name>#[A-Za-z0-9_]+)|(?P<value>:[A-Za-z0-9_]+)|(?P<word>[A-Za-z_][A-Za-z0-9_]*)"
+    r"|(?P<operator><>|<=|>=|[=<>(),+\-.\[\]]))"
+)
+_COMPARISON_OPERATORS = frozenset({"=", "<>", "<", "<=", ">", ">="})
+_CONDITION_FUNCTIONS = frozenset(
+    {"attribute_exists", "attribute_not_exists", "attribute_type", "begins_with", "contains"}
+)
+_UPDATE_CLAUSES = frozenset({"SET", "REMOVE", "ADD", "DELETE"})
+
+
+class ExpressionError(Exception):
+    pass
+
+
+class Operand(Protocol):
+    def evaluate(self, item: Item, names: Names, values: Values) -> AttributeValue | None: ...  # pragma: no cover
+
+
+class Condition(Protocol):
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool: ...  # pragma: no cover
+
+
+@dataclass(frozen=True, slots=True)
+class Path:
+    name: str
+
+    def resolve(self, names: Names) -> str:
+        return names[self.name] if self.name.startswith("#") else self.name
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> AttributeValue | None:
+        return item.get(self.resolve(names))
+
+
+@dataclass(frozen=True, slots=True)
+class Value:
+    name: str
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> AttributeValue | None:
+        return values[self.name]
+
+
+@dataclass(frozen=True, slots=True)
+class Size:
+    path: Path
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> AttributeValue | None:
+        if (value := self.path.evaluate(item, names, values)) is None:
+            return None
+        ((type_, data),) = value.items()
+        if type_ in {"S", "B", "SS", "NS", "BS", "L", "M"}:
+            return {"N": str(len(data))}
+        raise ExpressionError(
+            f"Incorrect operand type for operator or function; operator or function: size, operand type: {type_}"
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class IfNotExists:
+    path: Path
+    default: Operand
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> AttributeValue | None:
+        if (value := self.path.evaluate(item, names, values)) is not None:
+            return value
+        return self.default.evaluate(item, names, values)
+
+
+@dataclass(frozen=True, slots=True)
+class ListAppend:
+    left: Operand
+    right: Operand
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> AttributeValue | None:
+        left = _required(self.left.evaluate(item, names, values))
+        right = _required(self.right.evaluate(item, names, values))
+        if "L" not in left or "L" not in right:
+            raise ExpressionError("Incorrect operand type for operator or function; operator or function: list_append")
+        return {"L": [*left["L"], *right["L"]]}
+
+
+@dataclass(frozen=True, slots=True)
+class Arithmetic:
+    operator: str
+    left: Operand
+    right: Operand
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> AttributeValue | None:
+        left = _number(_required(self.left.evaluate(item, names, values)))
+        right = _number(_required(self.right.evaluate(item, names, values)))
+        return {"N": format_number(left + right if self.operator == "+" else left - right)}
+
+
+@dataclass(frozen=True, slots=True)
+class Comparison:
+    operator: str
+    left: Operand
+    right: Operand
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        left = self.left.evaluate(item, names, values)
+        right = self.right.evaluate(item, names, values)
+        if left is None or right is None:
+            return False
+        if self.operator == "=":
+            return equals(left, right)
+        if self.operator == "<>":
+            return not equals(left, right)
+        if (ordered := _ordered(left, right)) is None:
+            return False
+        left_key, right_key = ordered
+        if self.operator == "<":
+            return left_key < right_key
+        if self.operator == "<=":
+            return left_key <= right_key
+        if self.operator == ">":
+            return left_key > right_key
+        return left_key >= right_key
+
+
+@dataclass(frozen=True, slots=True)
+class Between:
+    operand: Operand
+    low: Operand
+    high: Operand
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        return Comparison(">=", self.operand, self.low).evaluate(item, names, values) and Comparison(
+            "<=", self.operand, self.high
+        ).evaluate(item, names, values)
+
+
+@dataclass(frozen=True, slots=True)
+class In:
+    operand: Operand
+    options: tuple[Operand, ...]
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        if (value := self.operand.evaluate(item, names, values)) is None:
+            return False
+        return any(
+            (option_value := option.evaluate(item, names, values)) is not None and equals(value, option_value)
+            for option in self.options
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Function:
+    name: str
+    path: Path
+    operand: Operand | None = None
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        value = self.path.evaluate(item, names, values)
+        if self.name == "attribute_exists":
+            return value is not None
+        if self.name == "attribute_not_exists":
+            return value is None
+        argument = _required(self.operand.evaluate(item, names, values) if self.operand else None)
+        if value is None:
+            return False
+        if self.name == "attribute_type":
+            return argument.get("S") in value
+        if self.name == "begins_with":
+            return _begins_with(value, argument)
+        return _contains(value, argument)
+
+
+@dataclass(frozen=True, slots=True)
+class And:
+    left: Condition
+    right: Condition
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        return self.left.evaluate(item, names, values) and self.right.evaluate(item, names, values)
+
+
+@dataclass(frozen=True, slots=True)
+class Or:
+    left: Condition
+    right: Condition
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        return self.left.evaluate(item, names, values) or self.right.evaluate(item, names, values)
+
+
+@dataclass(frozen=True, slots=True)
+class Not:
+    condition: Condition
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        return not self.condition.evaluate(item, names, values)
+
+
+@dataclass(frozen=True, slots=True)
+class UpdateAction:
+    clause: str
+    path: Path
+    operand: Operand | None = None
+
+
+@dataclass(frozen=True)
+class Expression:
+    names: frozenset[str]
+    values: frozenset[str]
+
+
+@dataclass(frozen=True)
+class ConditionExpression(Expression):
+    condition: Condition
+
+    def evaluate(self, item: Item, names: Names, values: Values) -> bool:
+        return self.condition.evaluate(item, names, values)
+
+    def conjuncts(self) -> list[Condition]:
+        conditions: list[Condition] = []
+        pending: list[Condition] = [self.condition]
+        while pending:
+            if isinstance(condition := pending.pop(0), And):
+                pending[:0] = [condition.left, condition.right]
+            else:
+                conditions.append(condition)
+        return conditions
+
+
+@dataclass(frozen=True)
+class UpdateExpression(Expression):
+    actions: tuple[UpdateAction, ...]
+
+    def apply(self, item: Item, names: Names, values: Values) -> tuple[Item, list[str]]:
+        # All operands are evaluated against the item as it was before the update
+        changes: list[tuple[str, AttributeValue | None]] = []
+        for action in self.actions:
+            attribute = action.path.resolve(names)
+            current = item.get(attribute)
+            if action.clause == "SET":
+                changes.append((attribute, _required(action.operand.evaluate(item, names, values))))  # type: ignore
+            elif action.clause == "REMOVE":
+                changes.append((attribute, None))
+            elif action.clause == "ADD":
+                changes.append((attribute, _add(current, values[action.operand.name])))  # type: ignore
+            else:
+                changes.append((attribute, _delete(current, values[action.operand.name])))  # type: ignore
+
+        updated_attributes = [attribute for attribute, _ in changes]
+        if len(set(updated_attributes)) != len(updated_attributes):
+            raise ExpressionError(
+                "Two document paths overlap with each other; must remove or rewrite one of these paths"
+            )
+        new_item = dict(item)
+        for attribute, value in changes:
+            if value is None:
+                new_item.pop(attribute, None)
+            else:
+                new_item[attribute] = value
+        return new_item, updated_attributes
+
+
+@dataclass(frozen=True)
+class ProjectionExpression(Expression):
+    paths: tuple[Path, ...]
+
+    def project(self, item: Item, names: Names) -> Item:
+        return {attribute: item[attribute] for path in self.paths if (attribute := path.resolve(names)) in item}
+
+
+@dataclass
+class _Parser:
+    expression: str
+    tokens: list[tuple[str, str]] = field(init=False)
+    position: int = 0
+    names: set[str] = field(default_factory=set)
+    values: set[str] = field(default_factory=set)
+
+    def __post_init__(self) -> None:
+        self.tokens = _tokenize(self.expression)
+
+    def peek(self, offset: int = 0) -> tuple[str, str] | None:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def peek_keyword(self) -> str | None:
+        token = self.peek()
+        return token[1].upper() if token and token[0] == "word" else None
+
+    def next(self) -> tuple[str, str]:
+        if (token := self.peek()) is None:
+            raise ExpressionError(f'Invalid expression: unexpected end of expression "{self.expression}"')
+        self.position += 1
+        return token
+
+    def expect(self, text: str) -> None:
+        if (token := self.next())[1].upper() != text:
+            raise ExpressionError(f'Invalid expression: expected "{text}", got "{token[1]}" in "{self.expression}"')
+
+    def end(self) -> None:
+        if (token := self.peek()) is not None:
+            raise ExpressionError(f'Invalid expression: unexpected token "{token[1]}" in "{self.expression}"')
+
+    def path(self) -> Path:
+        kind, text = self.next()
+        if kind == "name":
+            self.names.add(text)
+        elif kind != "word":
+            raise ExpressionError(
+                f'Invalid expression: expected an attribute name, got "{text}" in "{self.expression}"'
+            )
+        if (token := self.peek()) and token[1] in {".", "["}:
+            raise ExpressionError("Nested document paths are not supported by the in-memory DynamoDB client")
+        return Path(text)
+
+    def value(self) -> Value:
+        kind, text = self.next()
+        if kind != "value":
+            raise ExpressionError(
+                f'Invalid expression: expected an attribute value, got "{text}" in "{self.expression}"'
+            )
+        self.values.add(text)
+        return Value(text)
+
+    def operand(self) -> Operand:
+        token = self.peek()
+        if token and token[0] == "value":
+            return self.value()
+        if token and token[0] == "word" and token[1] == "size" and self.is_call():
+            self.next()
+            self.expect("(")
+            path = self.path()
+            self.expect(")")
+            return Size(path)
+        return self.path()
+
+    def is_call(self) -> bool:
+        return (token := self.peek(1)) is not None and token[1] == "("
+
+    def condition(self) -> Condition:
+        condition = self.and_condition()
+        while self.peek_keyword() == "OR":
+            self.next()
+            condition = Or(condition, self.and_condition())
+        return condition
+
+    def and_condition(self) -> Condition:
+        condition = self.not_condition()
+        while self.peek_keyword() == "AND":
+            self.next()
+            condition = And(condition, self.not_condition())
+        return condition
+
+    def not_condition(self) -> Condition:
+        if self.peek_keyword() == "NOT":
+            self.next()
+            return Not(self.not_condition())
+        return self.primary_condition()
+
+    def primary_condition(self) -> Condition:
+        token = self.peek()
+        if token and token[1] == "(":
+            self.next()
+            condition = self.condition()
+            self.expect(")")
+            return condition
+        if token and token[0] == "word" and token[1] in _CONDITION_FUNCTIONS and self.is_call():
+            return self.function()
+
+        operand = self.operand()
+        if self.peek_keyword() == "BETWEEN":
+            self.next()
+            low = self.operand()
+            self.expect("AND")
+            return Between(operand, low, self.operand())
+        if self.peek_keyword() == "IN":
+            self.next()
+            self.expect("(")
+            options = [self.operand()]
+            while self.peek() and self.peek()[1] == ",":  # type: ignore
+                self.next()
+                options.append(self.operand())
+            self.expect(")")
+            return In(operand, tuple(options))
+        operator = self.next()[1]
+        if operator not in _COMPARISON_OPERATORS:
+            raise ExpressionError(f'Invalid expression: unexpected token "{operator}" in "{self.expression}"')
+        return Comparison(operator, operand, self.operand())
+
+    def function(self) -> Function:
+        name = self.next()[1]
+        self.expect("(")
+        path = self.path()
+        operand: Operand | None = None
+        if name not in {"attribute_exists", "attribute_not_exists"}:
+            self.expect(",")
+            operand = self.operand()
+        self.expect(")")
+        return Function(name, path, operand)
+
+    def update_actions(self) -> tuple[UpdateAction, ...]:
+        actions: list[UpdateAction] = []
+        clauses: set[str] = set()
+        while self.peek() is not None:
+            clause = self.next()[1].upper()
+            if clause not in _UPDATE_CLAUSES:
+                raise ExpressionError(f'Invalid UpdateExpression: unexpected token "{clause}" in "{self.expression}"')
+            if clause in clauses:
+                raise ExpressionError(f'Invalid UpdateExpression: The "{clause}" section can only be used once')
+            clauses.add(clause)
+            actions.append(self.update_action(clause))
+            while self.peek() and self.peek()[1] == ",":  # type: ignore
+                self.next()
+                actions.append(self.update_action(clause))
+        if not actions:
+            raise ExpressionError("Invalid UpdateExpression: The expression can not be empty")
+        return tuple(actions)
+
+    def update_action(self, clause: str) -> UpdateAction:
+        path = self.path()
+        if clause == "REMOVE":
+            return UpdateAction(clause, path)
+        if clause in {"ADD", "DELETE"}:
+            return UpdateAction(clause, path, self.value())
+        self.expect("=")
+        operand = self.set_operand()
+        if (token := self.peek()) and token[1] in {"+", "-"}:
+            self.next()
+            operand = Arithmetic(token[1], operand, self.set_operand())
+        return UpdateAction(clause, path, operand)
+
+    def set_operand(self) -> Operand:
+        token = self.peek()
+        if token and token[0] == "word" and token[1] in {"if_not_exists", "list_append"} and self.is_call():
+            self.next()
+            self.expect("(")
+            if token[1] == "if_not_exists":
+                path = self.path()
+                self.expect(",")
+                operand: Operand = IfNotExists(path, self.set_operand())
+            else:
+                left = self.set_operand()
+                self.expect(",")
+                operand = ListAppend(left, self.set_operand())
+            self.expect(")")
+            return operand
+        if token and token[0] == "value":
+            return self.value()
+        return self.path()
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_condition(expression: str) -> ConditionExpression:
+    parser = _Parser(expression)
+    condition = parser.condition()
+    parser.end()
+    return ConditionExpression(frozenset(parser.names), frozenset(parser.values), condition)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_update(expression: str) -> UpdateExpression:
+    parser = _Parser(expression)
+    actions = parser.update_actions()
+    return UpdateExpression(frozenset(parser.names), frozenset(parser.values), actions)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_projection(expression: str) -> ProjectionExpression:
+    parser = _Parser(expression)
+    paths = [parser.path()]
+    while parser.peek() is not None:
+        parser.expect(",")
+        paths.append(parser.path())
+    return ProjectionExpression(frozenset(parser.names), frozenset(parser.values), tuple(paths))
+
+
+def equals(left: AttributeValue, right: AttributeValue) -> bool:
+    ((left_type, left_data),) = left.items()
+    ((right_type, right_data),) = right.items()
+    if left_type != right_type:
+        return False
+    if left_type == "N":
+        return Decimal(left_data) == Decimal(right_data)
+    if left_type == "NS":
+        return {Decimal(v) for v in left_data} == {Decimal(v) for v in right_data}
+    if left_type in {"SS", "BS"}:
+        return set(left_data) == set(right_data)
+    if left_type == "L":
+        return len(left_data) == len(right_data) and all(equals(a, b) for a, b in zip(left_data, right_data))
+    if left_type == "M":
+        return left_data.keys() == right_data.keys() and all(equals(v, right_data[k]) for k, v in left_data.items())
+    return bool(left_data == right_data)
+
+
+def format_number(value: Decimal) -> str:
+    return format(value.normalize(), "f")
+
+
+def _tokenize(expression: str) -> list[tuple[str, str]]:
+    tokens: list[tuple[str, str]] = []
+    position = 0
+    while position < len(expression):
+        if not expression[position:].strip():
+            break
+        if (match := _TOKEN_PATTERN.match(expression, position)) is None:
+            raise ExpressionError(f'Invalid expression: syntax error at "{expression[position:]}"')
+        kind = match.lastgroup
+        assert kind is not None  # nosec B101
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+def _required(value: AttributeValue | None) -> AttributeValue:
+    if value is None:
+        raise ExpressionError("The provided expression refers to an attribute that does not exist in the item")
+    return value
+
+
+def _number(value: AttributeValue) -> Decimal:
+    if "N" not in value:
+        raise ExpressionError("An operand in the update expression has an incorrect data type")
+    return Decimal(value["N"])
+
+
+def _ordered(left: AttributeValue, right: AttributeValue) -> tuple[Any, Any] | None:
+    ((left_type, left_data),) = left.items()
+    ((right_type, right_data),) = right.items()
+    if left_type != right_type or left_type not in {"N", "S", "B"}:
+        return None
+    if left_type == "N":
+        return Decimal(left_data), Decimal(right_data)
+    return left_data, right_data
+
+
+def _begins_with(value: AttributeValue, prefix: AttributeValue) -> bool:
+    for type_ in ("S", "B"):
+        if type_ in value and type_ in prefix:
+            return bool(value[type_].startswith(prefix[type_]))
+    return False
+
+
+def _contains(value: AttributeValue, element: AttributeValue) -> bool:
+    ((type_, data),) = value.items()
+    if type_ in {"S", "B"}:
+        return type_ in element and element[type_] in data
+    if type_ in {"SS", "NS", "BS"}:
+        member_type = type_[0]
+        return member_type in element and any(equals({member_type: v}, element) for v in data)
+    if type_ == "L":
+        return any(equals(v, element) for v in data)
+    return False
+
+
+def _add(current: AttributeValue | None, value: AttributeValue) -> AttributeValue:
+    ((type_, data),) = value.items()
+    if type_ not in {"N", "SS", "NS", "BS"}:
+        raise ExpressionError("Incorrect operand type for operator or function; operator: ADD")
+    if current is None:
+        return value
+    if type_ not in current:
+        raise ExpressionError("An operand in the update expression has an incorrect data type")
+    if type_ == "N":
+        return {"N": format_number(Decimal(current["N"]) + Decimal(data))}
+    return {type_: [*current[type_], *(v for v in data if not _contains(current, {type_[0]: v}))]}
+
+
+def _delete(current: AttributeValue | None, value: AttributeValue) -> AttributeValue | None:
+    ((type_, _),) = value.items()
+    if type_ not in {"SS", "NS", "BS"}:
+        raise ExpressionError("Incorrect operand type for operator or function; operator: DELETE")
+    if current is None:
+        return None
+    if type_ not in current:
+        raise ExpressionError("An operand in the update expression has an incorrect data type")
+    remaining = [v for v in current[type_] if not _contains(value, {type_[0]: v})]
+    return {type_: remaining} if remaining else None
@@ -0,0 +1,39 @@
+import datetime
+import random
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, kw_only=True)
+class RetryPolicy:
+    wait_timeout: datetime.timedelta | None = None
+    max_attempts: int | None = None
+    base_delay: datetime.timedelta = datetime.timedelta(milliseconds=20)
+    max_delay: datetime.timedelta = datetime.timedelta(seconds=1)
+
+    def __post_init__(self) -> None:
+        if self.max_attempts is not None and self.max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+    @property
+    def max_wait(self) -> datetime.timedelta:
+        if self.wait_timeout is not None:
+            return self.wait_timeout
+        if self.max_attempts is not None:
+            # Without a wait timeout, waiting is bounded by the attempt limit only
+            return self.max_delay * (self.max_attempts - 1)
+        return datetime.timedelta(0)
+
+    def can_retry(self, attempt: int, elapsed: float) -> bool:
+        if self.max_attempts is not None and attempt >= self.max_attempts:
+            return False
+        if self.wait_timeout is None:
+            return self.max_attempts is not None
+        return elapsed < self.wait_timeout.total_seconds()
+
+    def backoff(self, attempt: int, elapsed: float) -> float:
+        # Exponential backoff with "full jitter" spreads out contenders that failed at the same time
+        cap = min(self.max_delay.total_seconds(), self.base_delay.total_seconds() * 2 ** (attempt - 1))
+        delay = random.uniform(0, cap)  # nosec B311
+        if self.wait_timeout is None:
+            return delay
+        return min(delay, self.wait_timeout.total_seconds() - elapsed)
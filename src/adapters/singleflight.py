@@ -0,0 +1,24 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    def __init__(self) -> None:
+        self._calls: dict[K, asyncio.Future[V]] = {}
+
+    async def do(self, key: K, call: Callable[[], Awaitable[V]]) -> V:
+        # Callers arriving while a call for the same key is in flight share its result instead of making their own
+        if (future := self._calls.get(key)) is None:
+            future = self._calls[key] = asyncio.ensure_future(call())
+            future.add_done_callback(lambda f: self._forget(key, f))
+        # A cancelled caller must not cancel the call for the other callers waiting for it
+        return await asyncio.shield(future)
+
+    def _forget(self, key: K, future: asyncio.Future[V]) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()  # Retrieved here too, in case every caller was cancelled
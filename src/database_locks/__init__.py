@@ -1,7 +1,32 @@
-from .pessimistic_lock import DynamoDBPessimisticLock, PessimisticLockAcquisitionError, PessimisticLockItemNotFoundError
+from adapters.retry import RetryPolicy
+
+from .metrics import (
+    Histogram,
+    InMemoryPessimisticLockMetrics,
+    NoopPessimisticLockMetrics,
+    PessimisticLockMetrics,
+)
+from .pessimistic_lock import (
+    CommitUpdate,
+    DynamoDBPessimisticLock,
+    PessimisticLockAcquisitionError,
+    PessimisticLockCommitConditionFailedError,
+    PessimisticLockItemNotFoundError,
+    PessimisticLockLease,
+    PessimisticLockLostError,
+)
 
 __all__ = [
+    "CommitUpdate",
     "DynamoDBPessimisticLock",
+    "Histogram",
+    "InMemoryPessimisticLockMetrics",
+    "NoopPessimisticLockMetrics",
     "PessimisticLockAcquisitionError",
+    "PessimisticLockCommitConditionFailedError",
     "PessimisticLockItemNotFoundError",
+    "PessimisticLockLease",
+    "PessimisticLockLostError",
+    "PessimisticLockMetrics",
+    "RetryPolicy",
 ]
@@ -0,0 +1,92 @@
+import bisect
+import collections
+from dataclasses import dataclass, field
+from typing import Protocol
+
+from types_aiobotocore_dynamodb.type_defs import UniversalAttributeValueTypeDef
+
+LockKey = dict[str, UniversalAttributeValueTypeDef]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class PessimisticLockMetrics(Protocol):
+    def acquired(self, key: LockKey, *, attempts: int, wait_time: float) -> None: ...  # pragma: no cover
+
+    def acquisition_failed(self, key: LockKey, *, attempts: int, wait_time: float) -> None: ...  # pragma: no cover
+
+    def contended(self, key: LockKey) -> None: ...  # pragma: no cover
+
+    def stolen(self, key: LockKey) -> None: ...  # pragma: no cover
+
+    def released(self, key: LockKey, *, hold_time: float, lost: bool) -> None: ...  # pragma: no cover
+
+
+class NoopPessimisticLockMetrics:
+    def acquired(self, key: LockKey, *, attempts: int, wait_time: float) -> None:
+        pass
+
+    def acquisition_failed(self, key: LockKey, *, attempts: int, wait_time: float) -> None:
+        pass
+
+    def contended(self, key: LockKey) -> None:
+        pass
+
+    def stolen(self, key: LockKey) -> None:
+        pass
+
+    def released(self, key: LockKey, *, hold_time: float, lost: bool) -> None:
+        pass
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    counts: collections.Counter[float] = field(default_factory=collections.Counter)
+    count: int = 0
+    total: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[self.buckets[bisect.bisect_left(self.buckets, value)]] += 1
+        self.count += 1
+        self.total += value
+
+
+@dataclass
+class InMemoryPessimisticLockMetrics:
+    acquire_latency: Histogram = field(default_factory=Histogram)
+    hold_duration: Histogram = field(default_factory=Histogram)
+    acquisitions: int = 0
+    acquisition_failures: int = 0
+    attempts: collections.Counter[int] = field(default_factory=collections.Counter)
+    lost: int = 0
+    stolen_locks: int = 0
+    contention: collections.Counter[str] = field(default_factory=collections.Counter)
+
+    def acquired(self, key: LockKey, *, attempts: int, wait_time: float) -> None:
+        self.acquire_latency.observe(wait_time)
+        self.acquisitions += 1
+        self.attempts[attempts] += 1
+
+    def acquisition_failed(self, key: LockKey, *, attempts: int, wait_time: float) -> None:
+        self.acquisition_failures += 1
+        self.attempts[attempts] += 1
+
+    def contended(self, key: LockKey) -> None:
+        self.contention[key_prefix(key)] += 1
+
+    def stolen(self, key: LockKey) -> None:
+        self.stolen_locks += 1  # Expired lock of another client, e.g. one that crashed, was taken over
+
+    def released(self, key: LockKey, *, hold_time: float, lost: bool) -> None:
+        self.hold_duration.observe(hold_time)
+        if lost:
+            self.lost += 1  # Lock expired and was taken over by another client
+
+
+def key_prefix(key: LockKey) -> str:
+    # Partition key values are prefixed with the entity type, e.g. "PAYMENT_INTENT#pi_123456" -> "PAYMENT_INTENT"
+    partition_key = next(iter(key.values()))
+    if isinstance(partition_key, dict):
+        partition_key = next(iter(partition_key.values()))
+    return str(partition_key).partition("#")[0]
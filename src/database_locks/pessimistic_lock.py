@@ -1,12 +1,44 @@
+import asyncio
+import collections
 import datetime
-from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+import json
+import re
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import AsyncGenerator, Awaitable, Callable, NoReturn, Required, TypedDict, TypeVar, cast
 
+from botocore.exceptions import BotoCoreError, ClientError
 from types_aiobotocore_dynamodb import DynamoDBClient
-from types_aiobotocore_dynamodb.type_defs import UniversalAttributeValueTypeDef
+from types_aiobotocore_dynamodb.literals import ReturnValueType
+from types_aiobotocore_dynamodb.type_defs import (
+    AttributeValueTypeDef,
+    TransactWriteItemTypeDef,
+    UniversalAttributeValueTypeDef,
+    UpdateTypeDef,
+)
 
+from adapters.retry import RetryPolicy
+
+from .metrics import NoopPessimisticLockMetrics, PessimisticLockMetrics
 from .time import now
 
+TRANSACT_WRITE_ITEMS_LIMIT = 100
+
+READERS_GENERATION_HELD_EXPRESSION = "#Readers > :Zero AND #ReadersGeneration = :ReadersGeneration"
+
+REMOVE_CLAUSE = re.compile(r"(?<![#:\w])REMOVE\s+", re.IGNORECASE)
+
+T = TypeVar("T")
+
+
+class CommitUpdate(TypedDict, total=False):
+    UpdateExpression: Required[str]
+    ExpressionAttributeNames: dict[str, str]
+    ExpressionAttributeValues: dict[str, UniversalAttributeValueTypeDef]
+    ConditionExpression: str
+
 
 class PessimisticLockAcquisitionError(Exception):
     pass
@@ -16,6 +48,65 @@ class PessimisticLockItemNotFoundError(Exception):
     pass
 
 
+class PessimisticLockLostError(Exception):
+    pass
+
+
+class PessimisticLockCommitConditionFailedError(Exception):
+    pass
+
+
+@dataclass
+class PessimisticLockLease:
+    key: dict[str, UniversalAttributeValueTypeDef]
+    locked_at: str
+    shared: bool = False
+    readers_generation: str | None = None
+    fencing_token: int | None = None
+    item: dict[str, AttributeValueTypeDef] = field(default_factory=dict)
+    lost: bool = False
+    released: bool = False
+    _heartbeat: asyncio.Task | None = field(default=None, repr=False, compare=False)
+    _heartbeat_stopped: asyncio.Event = field(default_factory=asyncio.Event, repr=False, compare=False)
+
+    @property
+    def held(self) -> bool:
+        return not self.lost and not self.released
+
+
+class _LocalQueue:
+    def __init__(self) -> None:
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._users: collections.Counter[str] = collections.Counter()
+
+    @asynccontextmanager
+    async def __call__(
+        self, keys: list[dict[str, UniversalAttributeValueTypeDef]], timeout: float
+    ) -> AsyncGenerator[None, None]:
+        async with AsyncExitStack() as stack:
+            try:
+                # With zero timeout, waiting is never started and a key held by another local task fails immediately
+                async with asyncio.timeout(max(timeout, 0)):
+                    for key in keys:
+                        await stack.enter_async_context(self._hold(json.dumps(key, sort_keys=True)))
+            except TimeoutError as e:
+                raise PessimisticLockAcquisitionError(keys[0] if len(keys) == 1 else keys) from e
+            yield
+
+    @asynccontextmanager
+    async def _hold(self, key_id: str) -> AsyncGenerator[None, None]:
+        lock = self._locks.setdefault(key_id, asyncio.Lock())
+        self._users[key_id] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key_id] -= 1
+            if not self._users[key_id]:
+                del self._users[key_id]
+                del self._locks[key_id]
+
+
 class DynamoDBPessimisticLock:
     def __init__(
         self,
@@ -24,60 +115,843 @@ class DynamoDBPessimisticLock:
         *,
         lock_timeout: datetime.timedelta | None = None,
         lock_attribute: str = "__LockedAt",
+        retry_policy: RetryPolicy | None = None,
+        heartbeat_interval: datetime.timedelta | None = None,
+        fencing_token_attribute: str | None = None,
+        local_queue: bool = False,
+        readers_attribute: str = "__LockReaders",
+        readers_generation_attribute: str = "__LockReadersGeneration",
+        writer_waiting_attribute: str = "__LockWriterWaitingUntil",
+        numeric_timestamps: bool = False,
+        lock_table_name: str | None = None,
+        time_to_live_attribute: str = "__LockTimeToLive",
+        metrics: PessimisticLockMetrics | None = None,
     ) -> None:
+        if heartbeat_interval and (not lock_timeout or heartbeat_interval >= lock_timeout):
+            raise ValueError("heartbeat_interval must be shorter than lock_timeout")
+        if fencing_token_attribute and lock_table_name and lock_timeout:
+            # Expired lock items are deleted by TTL together with their fencing token counter, which would restart at 1
+            raise ValueError("fencing_token_attribute can't be used with a lock_timeout in a dedicated lock table")
+
         self._client = client
         self._table_name = table_name
         self._lock_timeout = lock_timeout
         self._lock_attribute = lock_attribute
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._heartbeat_interval = heartbeat_interval
+        self._fencing_token_attribute = fencing_token_attribute
+        # Tasks of this process contending for the same key wait in FIFO order instead of all hitting DynamoDB
+        self._local_queue = _LocalQueue() if local_queue else None
+        self._readers_attribute = readers_attribute
+        # Identifies an uninterrupted shared hold, so that an expired reader can't release the readers that came after
+        self._readers_generation_attribute = readers_generation_attribute
+        self._writer_waiting_attribute = writer_waiting_attribute
+        self._numeric_timestamps = numeric_timestamps
+        # Locks kept in a separate table of small items, so lock writes don't rewrite the (large) locked item
+        self._lock_table_name = lock_table_name or table_name
+        self._dedicated_lock_table = lock_table_name is not None
+        self._time_to_live_attribute = time_to_live_attribute
+        self._item_exists_expressions: dict[tuple[str, ...], str] = {}
+        self._metrics: PessimisticLockMetrics = metrics if metrics is not None else NoopPessimisticLockMetrics()
 
     @asynccontextmanager
-    async def __call__(self, key: dict[str, UniversalAttributeValueTypeDef]) -> AsyncGenerator[None, None]:
-        lock_acquired = False
+    async def __call__(
+        self, key: dict[str, UniversalAttributeValueTypeDef], *, return_item: bool = False
+    ) -> AsyncGenerator[PessimisticLockLease, None]:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        async with self._queue_locally([key], started_at):
+            lease = await self._acquire_lock(key, return_item=return_item, started_at=started_at)
+            acquired_at = loop.time()
+            self._start_heartbeat(lease)
+            try:
+                yield lease
+            finally:
+                await self._stop_heartbeat(lease)
+                if lease.held:
+                    await self._release_lock(lease)
+                self._metrics.released(key, hold_time=loop.time() - acquired_at, lost=lease.lost)
+            if lease.lost:
+                raise PessimisticLockLostError(key)
+
+    @asynccontextmanager
+    async def acquire_many(
+        self, keys: list[dict[str, UniversalAttributeValueTypeDef]]
+    ) -> AsyncGenerator[list[PessimisticLockLease], None]:
+        if not keys:
+            raise ValueError("Cannot acquire an empty list of locks")
+        if len(keys) > TRANSACT_WRITE_ITEMS_LIMIT:
+            raise ValueError(f"Cannot acquire more than {TRANSACT_WRITE_ITEMS_LIMIT} locks in a single transaction")
+        # Deterministic order, so that concurrent acquire_many calls over the same keys contend in the same way
+        key_ids = [json.dumps(key, sort_keys=True) for key in keys]
+        if len(set(key_ids)) != len(key_ids):
+            raise ValueError("Cannot acquire the same lock more than once")
+        keys = [key for _, key in sorted(zip(key_ids, keys, strict=True), key=lambda pair: pair[0])]
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        async with self._queue_locally(keys, started_at):
+            leases = await self._acquire_with_retry(lambda: self._try_acquire_locks(keys), keys, started_at)
+            acquired_at = loop.time()
+            for lease in leases:
+                self._start_heartbeat(lease)
+            try:
+                yield leases
+            finally:
+                for lease in leases:
+                    await self._stop_heartbeat(lease)
+                if held_leases := [lease for lease in leases if lease.held]:
+                    await self._release_locks(held_leases)
+                for lease in leases:
+                    self._metrics.released(lease.key, hold_time=loop.time() - acquired_at, lost=lease.lost)
+            if lost_keys := [lease.key for lease in leases if lease.lost]:
+                raise PessimisticLockLostError(lost_keys)
+
+    @asynccontextmanager
+    async def shared(
+        self, key: dict[str, UniversalAttributeValueTypeDef]
+    ) -> AsyncGenerator[PessimisticLockLease, None]:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        lease = await self._acquire_with_retry(lambda: self._try_acquire_shared_lock(key), [key], started_at)
+        acquired_at = loop.time()
+        self._start_heartbeat(lease)
         try:
-            await self._acquire_lock(key)
-            lock_acquired = True
-            yield
+            yield lease
         finally:
-            if lock_acquired:
-                await self._release_lock(key)
+            await self._stop_heartbeat(lease)
+            if lease.held:
+                await self._release_shared_lock(lease)
+            self._metrics.released(key, hold_time=loop.time() - acquired_at, lost=lease.lost)
+        if lease.lost:
+            raise PessimisticLockLostError(key)
 
-    async def _acquire_lock(self, key: dict[str, UniversalAttributeValueTypeDef]) -> None:
+    @asynccontextmanager
+    async def _queue_locally(
+        self, keys: list[dict[str, UniversalAttributeValueTypeDef]], started_at: float
+    ) -> AsyncGenerator[None, None]:
+        if self._local_queue is None:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        timeout = self._retry_policy.max_wait.total_seconds() - (loop.time() - started_at)
+        async with AsyncExitStack() as stack:
+            try:
+                await stack.enter_async_context(self._local_queue(keys, timeout=timeout))
+            except PessimisticLockAcquisitionError:
+                # Gave up waiting behind another task of this process, without a single request to DynamoDB
+                self._acquisition_failed(keys, attempts=0, wait_time=loop.time() - started_at)
+                raise
+            yield
+
+    async def _acquire_lock(
+        self, key: dict[str, UniversalAttributeValueTypeDef], *, return_item: bool, started_at: float
+    ) -> PessimisticLockLease:
+        max_wait = self._retry_policy.max_wait
+        wait_until = self._timestamp(now() + max_wait) if max_wait else ""
         try:
+            return await self._acquire_with_retry(
+                lambda: self._try_acquire_lock(key, return_item=return_item, wait_until=wait_until), [key], started_at
+            )
+        except PessimisticLockAcquisitionError:
+            if wait_until:
+                await self._withdraw_waiting_writer(key, wait_until)
+            raise
+
+    async def _acquire_with_retry(
+        self,
+        try_acquire: Callable[[], Awaitable[T]],
+        keys: list[dict[str, UniversalAttributeValueTypeDef]],
+        started_at: float,
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = await try_acquire()
+            except PessimisticLockAcquisitionError:
+                elapsed = loop.time() - started_at
+                if not self._retry_policy.can_retry(attempt, elapsed):
+                    self._acquisition_failed(keys, attempts=attempt, wait_time=elapsed)
+                    raise
+                await asyncio.sleep(self._retry_policy.backoff(attempt, elapsed))
+            else:
+                wait_time = loop.time() - started_at
+                for key in keys:
+                    self._metrics.acquired(key, attempts=attempt, wait_time=wait_time)
+                return result
+
+    def _acquisition_failed(
+        self, keys: list[dict[str, UniversalAttributeValueTypeDef]], *, attempts: int, wait_time: float
+    ) -> None:
+        for key in keys:
+            self._metrics.acquisition_failed(key, attempts=attempts, wait_time=wait_time)
+
+    async def _try_acquire_lock(
+        self, key: dict[str, UniversalAttributeValueTypeDef], *, return_item: bool, wait_until: str
+    ) -> PessimisticLockLease:
+        current_time = now()
+        locked_at = self._timestamp(current_time)
+        try:
+            response = await self._client.update_item(
+                **self._acquire_lock_request(key, current_time, locked_at),
+                ReturnValues=self._acquire_lock_return_values(return_item=return_item),
+            )
+        except self._client.exceptions.ConditionalCheckFailedException as e:
+            self._metrics.contended(key)
+            if wait_until and self._readers_attribute in cast(dict, e.response.get("Item", {})):
+                await self._announce_waiting_writer(key, wait_until)
+            raise PessimisticLockAcquisitionError(key) from e
+        old_item = response.get("Attributes", {})
+        if self._lock_attribute in old_item:
+            # Releases remove the lock attribute, so it's only still set on an expired lock that was taken over
+            self._metrics.stolen(key)
+        fencing_token = self._fencing_token(old_item)
+        lease = PessimisticLockLease(
+            key=key,
+            locked_at=locked_at,
+            fencing_token=fencing_token,
+            item=(
+                self._locked_item(old_item, locked_at, fencing_token)
+                if return_item and not self._dedicated_lock_table
+                else {}
+            ),
+        )
+        if return_item and self._dedicated_lock_table:
+            lease.item = await self._get_locked_item(lease)
+        return lease
+
+    async def _get_locked_item(self, lease: PessimisticLockLease) -> dict[str, AttributeValueTypeDef]:
+        response = await self._client.get_item(TableName=self._table_name, Key=lease.key, ConsistentRead=True)
+        if item := response.get("Item"):
+            return item
+        # Same outcome as with the lock attribute on the item - a not existing item can't be locked
+        await self._release_lock(lease)
+        raise PessimisticLockAcquisitionError(lease.key)
+
+    def _acquire_lock_return_values(self, *, return_item: bool) -> ReturnValueType:
+        # Old values tell whether an expired lock was taken over, and the new ones follow from them
+        if return_item and not self._dedicated_lock_table:
+            return "ALL_OLD"  # Saves a separate read of the locked item
+        return "UPDATED_OLD"
+
+    def _locked_item(
+        self, old_item: dict[str, AttributeValueTypeDef], locked_at: str, fencing_token: int | None
+    ) -> dict[str, AttributeValueTypeDef]:
+        # Same changes as made by the acquisition update expression
+        removed_attributes = {
+            self._readers_attribute,
+            self._readers_generation_attribute,
+            self._writer_waiting_attribute,
+        }
+        item = {name: value for name, value in old_item.items() if name not in removed_attributes}
+        item[self._lock_attribute] = cast(AttributeValueTypeDef, self._timestamp_value(locked_at))
+        if self._fencing_token_attribute:
+            item[self._fencing_token_attribute] = {"N": str(fencing_token)}
+        return item
+
+    async def _try_acquire_locks(
+        self, keys: list[dict[str, UniversalAttributeValueTypeDef]]
+    ) -> list[PessimisticLockLease]:
+        current_time = now()
+        locked_at = self._timestamp(current_time)
+        transact_items: list[TransactWriteItemTypeDef] = [
+            {"Update": self._acquire_lock_request(key, current_time, locked_at)} for key in keys
+        ]
+        try:
+            await self._client.transact_write_items(TransactItems=transact_items)
+        except self._client.exceptions.TransactionCanceledException as e:
+            contended_keys = [
+                key
+                for key, reason in zip(keys, e.response["CancellationReasons"], strict=True)
+                if reason.get("Code") in {"ConditionalCheckFailed", "TransactionConflict"}
+            ]
+            if not contended_keys:
+                raise
+            for key in contended_keys:
+                self._metrics.contended(key)
+            raise PessimisticLockAcquisitionError(keys) from e
+        # Transactions can't return the old lock attributes, so taking over expired locks here isn't counted as stolen
+        fencing_tokens = await self._get_fencing_tokens(keys)
+        return [
+            PessimisticLockLease(key=key, locked_at=locked_at, fencing_token=fencing_token)
+            for key, fencing_token in zip(keys, fencing_tokens, strict=True)
+        ]
+
+    def _acquire_lock_request(
+        self, key: dict[str, UniversalAttributeValueTypeDef], current_time: datetime.datetime, locked_at: str
+    ) -> UpdateTypeDef:
+        return {
+            "TableName": self._lock_table_name,
+            "Key": key,
+            "UpdateExpression": self._acquire_lock_update_expression,
+            "ExpressionAttributeNames": self._acquire_lock_attribute_names,
+            "ExpressionAttributeValues": {
+                ":LockAttribute": self._timestamp_value(locked_at),
+                **self._lock_expires_at_attribute_value(current_time),
+                **self._time_to_live_attribute_value(current_time),
+                **self._fencing_token_attribute_value,
+            },
+            "ConditionExpression": self._lock_available_expression(key, self._lock_not_acquired_expression),
+            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        }
+
+    async def _announce_waiting_writer(self, key: dict[str, UniversalAttributeValueTypeDef], wait_until: str) -> None:
+        # Writer preference - new readers are turned away until the waiting writer acquires the lock or gives up.
+        # Acquiring the lock removes the announcement, and a writer giving up withdraws it
+        with suppress(self._client.exceptions.ConditionalCheckFailedException):
             await self._client.update_item(
-                TableName=self._table_name,
+                TableName=self._lock_table_name,
+                Key=key,
+                UpdateExpression="SET #WriterWaiting = :WaitUntil",
+                ExpressionAttributeNames={
+                    "#Readers": self._readers_attribute,
+                    "#WriterWaiting": self._writer_waiting_attribute,
+                },
+                ExpressionAttributeValues={":WaitUntil": self._timestamp_value(wait_until), ":Zero": {"N": "0"}},
+                ConditionExpression="#Readers > :Zero AND (attribute_not_exists(#WriterWaiting) OR #WriterWaiting < :WaitUntil)",
+            )
+
+    async def _withdraw_waiting_writer(self, key: dict[str, UniversalAttributeValueTypeDef], wait_until: str) -> None:
+        # Only its own announcement, a writer waiting longer may have replaced it
+        with suppress(self._client.exceptions.ConditionalCheckFailedException):
+            await self._client.update_item(
+                TableName=self._lock_table_name,
+                Key=key,
+                UpdateExpression="REMOVE #WriterWaiting",
+                ExpressionAttributeNames={"#WriterWaiting": self._writer_waiting_attribute},
+                ExpressionAttributeValues={":WaitUntil": self._timestamp_value(wait_until)},
+                ConditionExpression="#WriterWaiting = :WaitUntil",
+            )
+
+    async def _try_acquire_shared_lock(self, key: dict[str, UniversalAttributeValueTypeDef]) -> PessimisticLockLease:
+        current_time = now()
+        locked_at = self._timestamp(current_time)
+        readers_generation: AttributeValueTypeDef = {"S": str(uuid.uuid4())}
+        try:
+            response = await self._client.update_item(
+                TableName=self._lock_table_name,
                 Key=key,
-                UpdateExpression="SET #LockAttribute = :LockAttribute",
-                ExpressionAttributeNames={"#LockAttribute": self._lock_attribute},
+                UpdateExpression=(
+                    "SET #LockAttribute = :LockAttribute, #ReadersGeneration = if_not_exists(#ReadersGeneration,"
+                    f" :ReadersGeneration){self._time_to_live_update_expression} ADD #Readers :One"
+                ),
+                ExpressionAttributeNames={
+                    "#LockAttribute": self._lock_attribute,
+                    "#Readers": self._readers_attribute,
+                    "#ReadersGeneration": self._readers_generation_attribute,
+                    "#WriterWaiting": self._writer_waiting_attribute,
+                    **self._time_to_live_attribute_name,
+                },
                 ExpressionAttributeValues={
-                    ":LockAttribute": {"S": now().isoformat()},
-                    **self._lock_expires_at_attribute_value(),
+                    ":LockAttribute": self._timestamp_value(locked_at),
+                    ":ReadersGeneration": readers_generation,
+                    ":One": {"N": "1"},
+                    ":Zero": {"N": "0"},
+                    **self._lock_expires_at_attribute_value(current_time),
+                    **self._time_to_live_attribute_value(current_time),
                 },
-                ConditionExpression=f"{self._item_exists_expression(key)} AND {self._lock_not_acquired_expression()}",
+                ConditionExpression=self._lock_available_expression(
+                    key,
+                    f"({self._lock_not_acquired_expression} OR #Readers > :Zero)"
+                    " AND (attribute_not_exists(#WriterWaiting) OR :LockAttribute > #WriterWaiting)",
+                ),
+                ReturnValues="UPDATED_OLD",
             )
         except self._client.exceptions.ConditionalCheckFailedException as e:
+            self._metrics.contended(key)
             raise PessimisticLockAcquisitionError(key) from e
+        old_attributes = response.get("Attributes", {})
+        if self._lock_attribute in old_attributes and not int(
+            old_attributes.get(self._readers_attribute, {"N": "0"})["N"]
+        ):
+            # Expired exclusive lock was taken over, instead of joining other readers
+            self._metrics.stolen(key)
+        return PessimisticLockLease(
+            key=key,
+            locked_at=locked_at,
+            shared=True,
+            readers_generation=old_attributes.get(self._readers_generation_attribute, readers_generation)["S"],
+        )
 
-    async def _release_lock(self, key: dict[str, UniversalAttributeValueTypeDef]) -> None:
+    async def _get_fencing_tokens(self, keys: list[dict[str, UniversalAttributeValueTypeDef]]) -> list[int | None]:
+        # Transactions can't return updated values, so the incremented tokens are read back in a second request
+        if not self._fencing_token_attribute:
+            return [None] * len(keys)
+        response = await self._client.transact_get_items(
+            TransactItems=[
+                {
+                    "Get": {
+                        "TableName": self._lock_table_name,
+                        "Key": key,
+                        "ProjectionExpression": "#FencingToken",
+                        "ExpressionAttributeNames": {"#FencingToken": self._fencing_token_attribute},
+                    }
+                }
+                for key in keys
+            ]
+        )
+        return [int(item["Item"][self._fencing_token_attribute]["N"]) for item in response["Responses"]]
+
+    async def commit(self, lease: PessimisticLockLease, update: CommitUpdate) -> None:
+        if lease.shared:
+            raise ValueError("Cannot commit an update under a shared lock")
+        if not lease.held:
+            raise PessimisticLockLostError(lease.key)
+        await self._stop_heartbeat(lease)
+        if self._dedicated_lock_table:
+            await self._commit_with_lock_table(lease, update)
+            return
         try:
             await self._client.update_item(
                 TableName=self._table_name,
-                Key=key,
-                UpdateExpression="REMOVE #LockAttribute",
-                ExpressionAttributeNames={"#LockAttribute": self._lock_attribute},
-                ConditionExpression=self._item_exists_expression(key),
+                Key=lease.key,
+                UpdateExpression=self._remove_lock_attribute_expression(update["UpdateExpression"]),
+                ExpressionAttributeNames={
+                    **update.get("ExpressionAttributeNames", {}),
+                    "#LockAttribute": self._lock_attribute,
+                    **self._fencing_token_attribute_name,
+                },
+                ExpressionAttributeValues={
+                    **update.get("ExpressionAttributeValues", {}),
+                    ":LockedAt": self._timestamp_value(lease.locked_at),
+                    **self._fencing_token_condition_attribute_value(lease),
+                },
+                ConditionExpression=" AND ".join(
+                    [
+                        *([f"({update['ConditionExpression']})"] if "ConditionExpression" in update else []),
+                        self._item_exists_expression(lease.key),
+                        self._lock_owned_expression,
+                    ]
+                ),
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+        except self._client.exceptions.ConditionalCheckFailedException as e:
+            if not (item := e.response.get("Item")):
+                raise PessimisticLockItemNotFoundError(lease.key) from e
+            if self._lock_owned(lease, cast(dict[str, AttributeValueTypeDef], item)):
+                self._resume_heartbeat(lease)
+                raise PessimisticLockCommitConditionFailedError(lease.key) from e
+            lease.lost = True
+            raise PessimisticLockLostError(lease.key) from e
+        lease.released = True
+
+    async def _commit_with_lock_table(self, lease: PessimisticLockLease, update: CommitUpdate) -> None:
+        try:
+            await self._client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Update": {
+                            "TableName": self._table_name,
+                            "Key": lease.key,
+                            **update,
+                            "ConditionExpression": " AND ".join(
+                                [
+                                    *(
+                                        [f"({update['ConditionExpression']})"]
+                                        if "ConditionExpression" in update
+                                        else []
+                                    ),
+                                    self._item_exists_expression(lease.key),
+                                ]
+                            ),
+                            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+                        }
+                    },
+                    {
+                        "Update": {
+                            "TableName": self._lock_table_name,
+                            "Key": lease.key,
+                            "UpdateExpression": "REMOVE #LockAttribute",
+                            "ExpressionAttributeNames": {
+                                "#LockAttribute": self._lock_attribute,
+                                **self._fencing_token_attribute_name,
+                            },
+                            "ExpressionAttributeValues": {
+                                ":LockedAt": self._timestamp_value(lease.locked_at),
+                                **self._fencing_token_condition_attribute_value(lease),
+                            },
+                            "ConditionExpression": self._lock_owned_expression,
+                        }
+                    },
+                ]
+            )
+        except self._client.exceptions.TransactionCanceledException as e:
+            item_reason, lock_reason = e.response["CancellationReasons"]
+            if lock_reason.get("Code") == "ConditionalCheckFailed":
+                lease.lost = True
+                raise PessimisticLockLostError(lease.key) from e
+            if item_reason.get("Code") != "ConditionalCheckFailed":
+                raise
+            if not item_reason.get("Item"):
+                raise PessimisticLockItemNotFoundError(lease.key) from e
+            self._resume_heartbeat(lease)
+            raise PessimisticLockCommitConditionFailedError(lease.key) from e
+        lease.released = True
+
+    async def fenced_update(self, lease: PessimisticLockLease, update: CommitUpdate) -> None:
+        # Writes on behalf of a lease without releasing it, e.g. from another task or after the lease was committed.
+        # The fencing token only changes when the lock is acquired again, so it's valid for both
+        if lease.shared:
+            raise ValueError("Cannot update under a shared lock")
+        if not self._fencing_token_attribute:
+            raise ValueError("Fenced updates require a fencing_token_attribute")
+        if lease.lost:
+            raise PessimisticLockLostError(lease.key)
+        if self._dedicated_lock_table:
+            await self._fenced_update_with_lock_table(lease, update)
+            return
+        try:
+            await self._client.update_item(
+                TableName=self._table_name,
+                Key=lease.key,
+                UpdateExpression=update["UpdateExpression"],
+                ExpressionAttributeNames={
+                    **update.get("ExpressionAttributeNames", {}),
+                    **self._fencing_token_attribute_name,
+                },
+                ExpressionAttributeValues={
+                    **update.get("ExpressionAttributeValues", {}),
+                    **self._fencing_token_condition_attribute_value(lease),
+                },
+                ConditionExpression=" AND ".join(
+                    [
+                        *([f"({update['ConditionExpression']})"] if "ConditionExpression" in update else []),
+                        self._item_exists_expression(lease.key),
+                        "#FencingToken = :FencingToken",
+                    ]
+                ),
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+        except self._client.exceptions.ConditionalCheckFailedException as e:
+            if not (item := e.response.get("Item")):
+                raise PessimisticLockItemNotFoundError(lease.key) from e
+            if cast(dict, item).get(self._fencing_token_attribute) == {"N": str(lease.fencing_token)}:
+                raise PessimisticLockCommitConditionFailedError(lease.key) from e
+            self._fenced_out(lease, e)
+
+    async def _fenced_update_with_lock_table(self, lease: PessimisticLockLease, update: CommitUpdate) -> None:
+        try:
+            await self._client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Update": {
+                            "TableName": self._table_name,
+                            "Key": lease.key,
+                            **update,
+                            "ConditionExpression": " AND ".join(
+                                [
+                                    *(
+                                        [f"({update['ConditionExpression']})"]
+                                        if "ConditionExpression" in update
+                                        else []
+                                    ),
+                                    self._item_exists_expression(lease.key),
+                                ]
+                            ),
+                            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+                        }
+                    },
+                    {
+                        "ConditionCheck": {
+                            "TableName": self._lock_table_name,
+                            "Key": lease.key,
+                            "ExpressionAttributeNames": self._fencing_token_attribute_name,
+                            "ExpressionAttributeValues": self._fencing_token_condition_attribute_value(lease),
+                            "ConditionExpression": "#FencingToken = :FencingToken",
+                        }
+                    },
+                ]
             )
+        except self._client.exceptions.TransactionCanceledException as e:
+            item_reason, lock_reason = e.response["CancellationReasons"]
+            if lock_reason.get("Code") == "ConditionalCheckFailed":
+                self._fenced_out(lease, e)
+            if item_reason.get("Code") != "ConditionalCheckFailed":
+                raise
+            if not item_reason.get("Item"):
+                raise PessimisticLockItemNotFoundError(lease.key) from e
+            raise PessimisticLockCommitConditionFailedError(lease.key) from e
+
+    def _fenced_out(self, lease: PessimisticLockLease, e: Exception) -> NoReturn:
+        # The lock was acquired again since this lease got its fencing token
+        if not lease.released:
+            lease.lost = True
+        raise PessimisticLockLostError(lease.key) from e
+
+    def _lock_owned(self, lease: PessimisticLockLease, item: dict[str, AttributeValueTypeDef]) -> bool:
+        if item.get(self._lock_attribute) != self._timestamp_value(lease.locked_at):
+            return False
+        if self._fencing_token_attribute:
+            return item.get(self._fencing_token_attribute) == {"N": str(lease.fencing_token)}
+        return True
+
+    def _start_heartbeat(self, lease: PessimisticLockLease) -> None:
+        if self._heartbeat_interval:
+            lease._heartbeat = asyncio.create_task(
+                self._renew_lock_periodically(lease, self._heartbeat_interval.total_seconds())
+            )
+
+    def _resume_heartbeat(self, lease: PessimisticLockLease) -> None:
+        # The lock is still held after a rejected commit, so it's kept alive until it's released as usual
+        lease._heartbeat_stopped.clear()
+        self._start_heartbeat(lease)
+
+    async def _stop_heartbeat(self, lease: PessimisticLockLease) -> None:
+        if lease._heartbeat is None:
+            return
+        # Not cancelling an in-flight renewal, so that the lease knows the lock attribute value that is actually stored
+        lease._heartbeat_stopped.set()
+        await asyncio.wait([lease._heartbeat])
+        lease._heartbeat = None
+
+    async def _renew_lock_periodically(self, lease: PessimisticLockLease, interval: float) -> None:
+        while not lease.lost:
+            with suppress(TimeoutError):
+                await asyncio.wait_for(lease._heartbeat_stopped.wait(), timeout=interval)
+            if lease._heartbeat_stopped.is_set():
+                return
+            try:
+                await self._renew_lock(lease)
+            except (BotoCoreError, ClientError):
+                continue  # Transient error - the lock is still ours until the lock timeout, retry on the next beat
+
+    async def _renew_lock(self, lease: PessimisticLockLease) -> None:
+        current_time = now()
+        locked_at = self._timestamp(current_time)
+        # Other readers renew the shared lock as well, so it's enough that it's still held by the same readers
+        lock_held_expression = (
+            READERS_GENERATION_HELD_EXPRESSION if lease.shared else "#LockAttribute = :CurrentLockAttribute"
+        )
+        try:
+            await self._client.update_item(
+                TableName=self._lock_table_name,
+                Key=lease.key,
+                UpdateExpression=f"SET #LockAttribute = :LockAttribute{self._time_to_live_update_expression}",
+                ExpressionAttributeNames={
+                    "#LockAttribute": self._lock_attribute,
+                    **self._readers_generation_attribute_names(lease),
+                    **self._time_to_live_attribute_name,
+                },
+                ExpressionAttributeValues={
+                    ":LockAttribute": self._timestamp_value(locked_at),
+                    **self._time_to_live_attribute_value(current_time),
+                    **(
+                        self._readers_generation_attribute_values(lease)
+                        if lease.shared
+                        else {":CurrentLockAttribute": self._timestamp_value(lease.locked_at)}
+                    ),
+                },
+                ConditionExpression=f"{self._item_exists_expression(lease.key)} AND {lock_held_expression}",
+            )
+        except self._client.exceptions.ConditionalCheckFailedException:
+            lease.lost = True
+        else:
+            lease.locked_at = locked_at
+
+    async def _release_lock(self, lease: PessimisticLockLease) -> None:
+        try:
+            await self._client.update_item(**self._release_lock_request(lease))
         except self._client.exceptions.ConditionalCheckFailedException as e:
-            raise PessimisticLockItemNotFoundError(key) from e
+            if not e.response.get("Item"):
+                self._lock_item_not_found(lease, e)
+                return
+            lease.lost = True  # Expired lock was taken over, so it's not ours to remove
+
+    async def _release_shared_lock(self, lease: PessimisticLockLease) -> None:
+        try:
+            response = await self._client.update_item(
+                TableName=self._lock_table_name,
+                Key=lease.key,
+                UpdateExpression="ADD #Readers :MinusOne",
+                ExpressionAttributeNames=self._readers_generation_attribute_names(lease),
+                ExpressionAttributeValues={
+                    ":MinusOne": {"N": "-1"},
+                    **self._readers_generation_attribute_values(lease),
+                },
+                ConditionExpression=(
+                    f"{self._item_exists_expression(lease.key)} AND {READERS_GENERATION_HELD_EXPRESSION}"
+                ),
+                ReturnValues="UPDATED_NEW",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+        except self._client.exceptions.ConditionalCheckFailedException as e:
+            if not e.response.get("Item"):
+                self._lock_item_not_found(lease, e)
+                return
+            lease.lost = True  # Expired shared lock was taken over by a writer, and possibly by other readers since
+            return
+        if int(response["Attributes"][self._readers_attribute]["N"]) == 0:
+            # The last reader cleans up, unless a new reader has joined in the meantime
+            with suppress(self._client.exceptions.ConditionalCheckFailedException):
+                await self._client.update_item(
+                    TableName=self._lock_table_name,
+                    Key=lease.key,
+                    UpdateExpression="REMOVE #LockAttribute, #Readers, #ReadersGeneration",
+                    ExpressionAttributeNames={
+                        "#LockAttribute": self._lock_attribute,
+                        **self._readers_generation_attribute_names(lease),
+                    },
+                    ExpressionAttributeValues=self._readers_generation_attribute_values(lease),
+                    ConditionExpression="#Readers = :Zero AND #ReadersGeneration = :ReadersGeneration",
+                )
+
+    async def _release_locks(self, leases: list[PessimisticLockLease]) -> None:
+        try:
+            await self._client.transact_write_items(
+                TransactItems=[{"Update": self._release_lock_request(lease)} for lease in leases]
+            )
+        except self._client.exceptions.TransactionCanceledException as e:
+            reasons = e.response["CancellationReasons"]
+            if not any(reason.get("Code") == "ConditionalCheckFailed" for reason in reasons):
+                raise
+            not_found_keys = []
+            for lease, reason in zip(leases, reasons, strict=True):
+                if reason.get("Code") != "ConditionalCheckFailed":
+                    continue
+                if reason.get("Item") or self._dedicated_lock_table:
+                    lease.lost = True  # Expired lock was taken over, or its lock item was removed by TTL
+                else:
+                    not_found_keys.append(lease.key)
+                    lease.released = True
+            # The remaining locks are still ours, so they are released without the failed ones
+            if held_leases := [lease for lease in leases if lease.held]:
+                await self._release_locks(held_leases)
+            if not_found_keys:
+                raise PessimisticLockItemNotFoundError(not_found_keys) from e
+
+    def _lock_item_not_found(self, lease: PessimisticLockLease, e: Exception) -> None:
+        if not self._dedicated_lock_table:
+            raise PessimisticLockItemNotFoundError(lease.key) from e
+        lease.lost = True  # Expired lock item was removed by TTL, so the lock might have been taken in the meantime
+
+    def _release_lock_request(self, lease: PessimisticLockLease) -> UpdateTypeDef:
+        return {
+            "TableName": self._lock_table_name,
+            "Key": lease.key,
+            "UpdateExpression": "REMOVE #LockAttribute",
+            "ExpressionAttributeNames": {"#LockAttribute": self._lock_attribute, **self._fencing_token_attribute_name},
+            "ExpressionAttributeValues": {
+                ":LockedAt": self._timestamp_value(lease.locked_at),
+                **self._fencing_token_condition_attribute_value(lease),
+            },
+            "ConditionExpression": f"{self._item_exists_expression(lease.key)} AND {self._lock_owned_expression}",
+            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        }
+
+    @staticmethod
+    def _remove_lock_attribute_expression(update_expression: str) -> str:
+        # Each clause can appear only once in an update expression, so an existing REMOVE clause is extended
+        expression, count = REMOVE_CLAUSE.subn("REMOVE #LockAttribute, ", update_expression, count=1)
+        return expression if count else f"{update_expression} REMOVE #LockAttribute"
 
     def _item_exists_expression(self, key: dict[str, UniversalAttributeValueTypeDef]) -> str:
-        return " AND ".join(f"attribute_exists({v})" for v in key.keys()).removesuffix(" AND ")
+        key_schema = tuple(key.keys())
+        if (expression := self._item_exists_expressions.get(key_schema)) is None:
+            expression = " AND ".join(f"attribute_exists({v})" for v in key_schema).removesuffix(" AND ")
+            self._item_exists_expressions[key_schema] = expression
+        return expression
+
+    def _lock_available_expression(self, key: dict[str, UniversalAttributeValueTypeDef], expression: str) -> str:
+        if self._dedicated_lock_table:
+            return expression  # Lock item is created on the first acquisition
+        return f"{self._item_exists_expression(key)} AND {expression}"
+
+    def _timestamp(self, value: datetime.datetime) -> str:
+        if self._numeric_timestamps:
+            return str(int(value.timestamp() * 1000))
+        return value.isoformat()
 
-    def _lock_expires_at_attribute_value(self) -> dict:
+    def _timestamp_value(self, value: str) -> UniversalAttributeValueTypeDef:
+        if self._numeric_timestamps:
+            return {"N": value}
+        return {"S": value}
+
+    @cached_property
+    def _acquire_lock_update_expression(self) -> str:
+        return (
+            f"SET #LockAttribute = :LockAttribute{self._time_to_live_update_expression}"
+            f" REMOVE #Readers, #ReadersGeneration, #WriterWaiting{self._fencing_token_update_expression}"
+        )
+
+    @cached_property
+    def _acquire_lock_attribute_names(self) -> dict[str, str]:
+        return {
+            "#LockAttribute": self._lock_attribute,
+            "#Readers": self._readers_attribute,
+            "#ReadersGeneration": self._readers_generation_attribute,
+            "#WriterWaiting": self._writer_waiting_attribute,
+            **self._time_to_live_attribute_name,
+            **self._fencing_token_attribute_name,
+        }
+
+    def _readers_generation_attribute_names(self, lease: PessimisticLockLease) -> dict[str, str]:
+        if not lease.shared:
+            return {}
+        return {"#Readers": self._readers_attribute, "#ReadersGeneration": self._readers_generation_attribute}
+
+    def _readers_generation_attribute_values(self, lease: PessimisticLockLease) -> dict:
+        return {":Zero": {"N": "0"}, ":ReadersGeneration": {"S": str(lease.readers_generation)}}
+
+    @cached_property
+    def _time_to_live_update_expression(self) -> str:
+        if not self._dedicated_lock_table or not self._lock_timeout:
+            return ""
+        return ", #TimeToLive = :TimeToLive"
+
+    @cached_property
+    def _time_to_live_attribute_name(self) -> dict:
+        if not self._dedicated_lock_table or not self._lock_timeout:
+            return {}
+        return {"#TimeToLive": self._time_to_live_attribute}
+
+    def _time_to_live_attribute_value(self, current_time: datetime.datetime) -> dict:
+        if not self._dedicated_lock_table or not self._lock_timeout:
+            return {}
+        # DynamoDB TTL requires epoch seconds
+        return {":TimeToLive": {"N": str(int((current_time + self._lock_timeout).timestamp()))}}
+
+    def _lock_expires_at_attribute_value(self, current_time: datetime.datetime) -> dict:
         if not self._lock_timeout:
             return {}
-        return {":LockExpiresAt": {"S": (now() - self._lock_timeout).isoformat()}}
+        return {":LockExpiresAt": self._timestamp_value(self._timestamp(current_time - self._lock_timeout))}
 
+    @cached_property
     def _lock_not_acquired_expression(self) -> str:
         if not self._lock_timeout:
             return "attribute_not_exists(#LockAttribute)"
         return "(attribute_not_exists(#LockAttribute) OR :LockExpiresAt > #LockAttribute)"
+
+    @cached_property
+    def _fencing_token_update_expression(self) -> str:
+        if not self._fencing_token_attribute:
+            return ""
+        return " ADD #FencingToken :FencingTokenIncrement"
+
+    @cached_property
+    def _fencing_token_attribute_name(self) -> dict:
+        if not self._fencing_token_attribute:
+            return {}
+        return {"#FencingToken": self._fencing_token_attribute}
+
+    @cached_property
+    def _fencing_token_attribute_value(self) -> dict:
+        if not self._fencing_token_attribute:
+            return {}
+        return {":FencingTokenIncrement": {"N": "1"}}
+
+    @cached_property
+    def _lock_owned_expression(self) -> str:
+        if not self._fencing_token_attribute:
+            return "#LockAttribute = :LockedAt"
+        return "#LockAttribute = :LockedAt AND #FencingToken = :FencingToken"
+
+    def _fencing_token_condition_attribute_value(self, lease: PessimisticLockLease) -> dict:
+        if not self._fencing_token_attribute:
+            return {}
+        return {":FencingToken": {"N": str(lease.fencing_token)}}
+
+    def _fencing_token(self, old_item: dict[str, AttributeValueTypeDef]) -> int | None:
+        if not self._fencing_token_attribute:
+            return None
+        return int(old_item.get(self._fencing_token_attribute, {"N": "0"})["N"]) + 1
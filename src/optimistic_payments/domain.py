@@ -4,6 +4,8 @@ from enum import StrEnum
 
 from .events import PaymentIntentChargeRequested, PaymentIntentEvent
 
+UPDATABLE_FIELDS = frozenset({"state", "amount", "charge"})
+
 
 class PaymentIntentNotFoundError(Exception):
     pass
@@ -47,6 +49,8 @@ class PaymentIntent:
         self._charge = charge
         self._events = events
         self._version = version
+        # Fields changed since the aggregate was loaded, so that only those are written; unknown for a new aggregate
+        self._changed_fields = set(UPDATABLE_FIELDS)
 
     @property
     def id(self) -> str:
@@ -80,6 +84,13 @@ class PaymentIntent:
     def version(self) -> int:
         return self._version
 
+    @property
+    def changed_fields(self) -> frozenset[str]:
+        return frozenset(self._changed_fields)
+
+    def clear_changes(self) -> None:
+        self._changed_fields.clear()
+
     @staticmethod
     def create(customer_id: str, amount: int, currency: str) -> "PaymentIntent":
         return PaymentIntent(
@@ -97,13 +108,16 @@ class PaymentIntent:
         if self._state != PaymentIntentState.CREATED:
             raise PaymentIntentStateError(f"Cannot change PaymentIntent amount in state: {self._state}")
 
-        self._amount = amount
+        if amount != self._amount:
+            self._amount = amount
+            self._changed_fields.add("amount")
 
     def request_charge(self) -> None:
         if self._state != PaymentIntentState.CREATED:
             raise PaymentIntentStateError(f"Cannot charge PaymentIntent in state: {self._state}")
 
         self._state = PaymentIntentState.CHARGE_REQUESTED
+        self._changed_fields.add("state")
 
         event = PaymentIntentChargeRequested(
             payment_intent_id=self._id,
@@ -126,6 +140,13 @@ class PaymentIntent:
             error_code=error_code,
             error_message=error_message,
         )
+        self._changed_fields.update(("state", "charge"))
+
+    def mark_committed(self) -> None:
+        # Called by the repository once the changes and events are persisted, so the aggregate can be updated again
+        self._version += 1
+        self._events = []
+        self._changed_fields.clear()
 
     def __eq__(self, __value: object) -> bool:
         if not isinstance(__value, PaymentIntent):
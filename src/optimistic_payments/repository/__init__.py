@@ -1,19 +1,33 @@
-from typing import Protocol
+from typing import Iterable, Protocol
 
 from ..domain import PaymentIntent
+from .caching import CachingPaymentIntentRepository
 from .dynamodb import DynamoDBPaymentIntentRepository
-from .exceptions import OptimisticLockError
+from .exceptions import OptimisticLockError, PaymentIntentBatchGetError
 
 __all__ = [
+    "CachingPaymentIntentRepository",
     "DynamoDBPaymentIntentRepository",
     "OptimisticLockError",
+    "PaymentIntentBatchGetError",
     "PaymentIntentRepository",
 ]
 
 
 class PaymentIntentRepository(Protocol):
-    async def get(self, payment_intent_id: str) -> PaymentIntent: ...  # pragma: no cover
+    @property
+    def consistent_read(self) -> bool: ...  # pragma: no cover
+
+    async def get(
+        self, payment_intent_id: str, *, consistent_read: bool | None = None
+    ) -> PaymentIntent: ...  # pragma: no cover
+
+    async def get_many(
+        self, payment_intent_ids: Iterable[str], *, consistent_read: bool | None = None
+    ) -> dict[str, PaymentIntent]: ...  # pragma: no cover
 
     async def create(self, payment_intent: PaymentIntent) -> None: ...  # pragma: no cover
 
     async def update(self, payment_intent: PaymentIntent) -> None: ...  # pragma: no cover
+
+    async def change_amount(self, payment_intent_id: str, amount: int) -> PaymentIntent: ...  # pragma: no cover
@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import datetime
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable
+
+from optimistic_payments.domain import Charge, PaymentIntent, PaymentIntentState
+
+from .exceptions import OptimisticLockError
+
+if TYPE_CHECKING:
+    from . import PaymentIntentRepository
+
+TERMINAL_STATES = frozenset({PaymentIntentState.CHARGED, PaymentIntentState.CHARGE_FAILED})
+
+
+@dataclass(frozen=True)
+class _CachedPaymentIntent:
+    id: str
+    state: PaymentIntentState
+    customer_id: str
+    amount: int
+    currency: str
+    charge: Charge | None
+    version: int
+    expires_at: float
+
+    @staticmethod
+    def from_entity(payment_intent: PaymentIntent, expires_at: float) -> "_CachedPaymentIntent":
+        return _CachedPaymentIntent(
+            id=payment_intent.id,
+            state=payment_intent.state,
+            customer_id=payment_intent.customer_id,
+            amount=payment_intent.amount,
+            currency=payment_intent.currency,
+            charge=payment_intent.charge,
+            version=payment_intent.version,
+            expires_at=expires_at,
+        )
+
+    def to_entity(self) -> PaymentIntent:
+        # Each caller gets its own aggregate, so that changes made to it don't leak into the cache
+        payment_intent = PaymentIntent(
+            id=self.id,
+            state=self.state,
+            customer_id=self.customer_id,
+            amount=self.amount,
+            currency=self.currency,
+            charge=self.charge,
+            events=[],
+            version=self.version,
+        )
+        payment_intent.clear_changes()
+        return payment_intent
+
+
+class CachingPaymentIntentRepository:
+    def __init__(
+        self,
+        repository: "PaymentIntentRepository",
+        *,
+        max_size: int = 10_000,
+        ttl: datetime.timedelta = datetime.timedelta(seconds=30),
+    ) -> None:
+        # A stale cached payment intent is safe to update, because the write's version check rejects it
+        self._repository = repository
+        self._max_size = max_size
+        self._ttl = ttl.total_seconds()
+        self._cache: collections.OrderedDict[str, _CachedPaymentIntent] = collections.OrderedDict()
+
+    @property
+    def consistent_read(self) -> bool:
+        return self._repository.consistent_read
+
+    async def get(self, payment_intent_id: str, *, consistent_read: bool | None = None) -> PaymentIntent:
+        if self._use_cache(consistent_read) and (cached := self._get_cached(payment_intent_id)):
+            return cached.to_entity()
+        payment_intent = await self._repository.get(payment_intent_id, consistent_read=consistent_read)
+        self._put(payment_intent)
+        return payment_intent
+
+    async def get_many(
+        self, payment_intent_ids: Iterable[str], *, consistent_read: bool | None = None
+    ) -> dict[str, PaymentIntent]:
+        payment_intents: dict[str, PaymentIntent] = {}
+        missing_ids: list[str] = []
+        use_cache = self._use_cache(consistent_read)
+        for payment_intent_id in payment_intent_ids:
+            if use_cache and (cached := self._get_cached(payment_intent_id)):
+                payment_intents[payment_intent_id] = cached.to_entity()
+            else:
+                missing_ids.append(payment_intent_id)
+        if missing_ids:
+            loaded_payment_intents = await self._repository.get_many(missing_ids, consistent_read=consistent_read)
+            for payment_intent in loaded_payment_intents.values():
+                self._put(payment_intent)
+            payment_intents.update(loaded_payment_intents)
+        return payment_intents
+
+    async def create(self, payment_intent: PaymentIntent) -> None:
+        await self._repository.create(payment_intent)
+        self._put(payment_intent)
+
+    async def update(self, payment_intent: PaymentIntent) -> None:
+        try:
+            await self._repository.update(payment_intent)
+        except OptimisticLockError as e:
+            self._replace_with_current(payment_intent.id, e)
+            raise
+        self._put(payment_intent)
+
+    async def change_amount(self, payment_intent_id: str, amount: int) -> PaymentIntent:
+        try:
+            payment_intent = await self._repository.change_amount(payment_intent_id, amount)
+        except OptimisticLockError as e:
+            self._replace_with_current(payment_intent_id, e)
+            raise
+        except Exception:
+            self.invalidate(payment_intent_id)  # Not found or not in a changeable state, the cached state is stale
+            raise
+        self._put(payment_intent)
+        return payment_intent
+
+    def invalidate(self, payment_intent_id: str) -> None:
+        self._cache.pop(payment_intent_id, None)
+
+    def _use_cache(self, consistent_read: bool | None) -> bool:
+        # A cached payment intent is as stale as an eventually consistent read, so it's never served for a strong one
+        if consistent_read is None:
+            return not self._repository.consistent_read
+        return not consistent_read
+
+    def _get_cached(self, payment_intent_id: str) -> _CachedPaymentIntent | None:
+        if (cached := self._cache.get(payment_intent_id)) is None:
+            return None
+        if cached.expires_at < asyncio.get_running_loop().time():
+            del self._cache[payment_intent_id]
+            return None
+        self._cache.move_to_end(payment_intent_id)
+        return cached
+
+    def _put(self, payment_intent: PaymentIntent) -> None:
+        # Terminal payment intents never change again, so they're cached until evicted
+        expires_at = (
+            float("inf") if payment_intent.state in TERMINAL_STATES else asyncio.get_running_loop().time() + self._ttl
+        )
+        self._cache[payment_intent.id] = _CachedPaymentIntent.from_entity(payment_intent, expires_at)
+        self._cache.move_to_end(payment_intent.id)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+    def _replace_with_current(self, payment_intent_id: str, e: OptimisticLockError) -> None:
+        # The conflicting write returned the latest version, so the next read doesn't need to load it
+        if e.current_payment_intent is not None:
+            self._put(e.current_payment_intent)
+        else:
+            self.invalidate(payment_intent_id)
@@ -1,18 +1,23 @@
 import abc
-from typing import Generic, Self, TypeVar
+from typing import Any, ClassVar, Generic, Self, TypeVar
 
-import boto3.dynamodb.types
 from pydantic import BaseModel
 from types_aiobotocore_dynamodb.type_defs import AttributeValueTypeDef
 
-BOTO3_DESERIALIZER = boto3.dynamodb.types.TypeDeserializer()
-BOTO3_SERIALIZER = boto3.dynamodb.types.TypeSerializer()
-
+from .codec import DTOCodec
 
 EntityType = TypeVar("EntityType")
 
 
 class AbstractDTO(BaseModel, Generic[EntityType]):
+    # Generated from the DTO's fields, so that items are converted without boto3's TypeSerializer and Decimals
+    codec: ClassVar[DTOCodec]
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        cls.codec = DTOCodec(cls)
+
     @classmethod
     @abc.abstractmethod
     def from_entity(cls: type[Self], entity: EntityType) -> Self:
@@ -23,8 +28,11 @@ class AbstractDTO(BaseModel, Generic[EntityType]):
         pass  # pragma: no cover
 
     @classmethod
-    def from_dynamodb_item(cls: type[Self], item: dict[str, AttributeValueTypeDef]) -> Self:
-        return cls(**{k: BOTO3_DESERIALIZER.deserialize(v) for k, v in item.items()})
+    def from_dynamodb_item(cls: type[Self], item: dict[str, AttributeValueTypeDef], *, validate: bool = True) -> Self:
+        if not validate:
+            # Trusted items, e.g. written by the repository itself, skip pydantic validation
+            return cls.codec.construct(item)
+        return cls.model_validate(cls.codec.decode(item))
 
     def to_dynamodb_item(self) -> dict[str, AttributeValueTypeDef]:
-        return {k: BOTO3_SERIALIZER.serialize(v) for k, v in self.model_dump().items()}
+        return self.codec.encode(self)
@@ -0,0 +1,99 @@
+import enum
+import operator
+import types
+from dataclasses import dataclass
+from typing import Any, Callable, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from types_aiobotocore_dynamodb.type_defs import AttributeValueTypeDef
+
+_get_string = operator.itemgetter("S")
+
+
+@dataclass(frozen=True)
+class AttributeCodec:
+    encode: Callable[[Any], AttributeValueTypeDef]
+    # Plain Python values for pydantic validation
+    decode: Callable[[Any], Any]
+    # Field values as the model stores them, for trusted reads that skip validation
+    construct: Callable[[Any], Any]
+
+
+class DTOCodec:
+    def __init__(self, model: type[BaseModel]) -> None:
+        self._model = model
+        codecs = {name: attribute_codec(field.annotation) for name, field in model.model_fields.items()}
+        # Bound up front, so that converting an item is a single loop of plain function calls
+        self._encoders = tuple((name, codec.encode) for name, codec in codecs.items())
+        self._decoders = tuple((name, codec.decode) for name, codec in codecs.items())
+        self._constructors = tuple((name, codec.construct) for name, codec in codecs.items())
+        self._field_names = frozenset(codecs)
+
+    def encode(self, dto: BaseModel) -> dict[str, AttributeValueTypeDef]:
+        values = dto.__dict__
+        return {name: encode(values[name]) for name, encode in self._encoders}
+
+    def decode(self, item: dict[str, Any]) -> dict[str, Any]:
+        return {name: decode(item[name]) for name, decode in self._decoders if name in item}
+
+    def construct(self, item: dict[str, Any]) -> Any:
+        # Same result as BaseModel.model_construct, without its per-call defaults and aliases handling
+        dto = self._model.__new__(self._model)
+        object.__setattr__(dto, "__dict__", {name: construct(item[name]) for name, construct in self._constructors})
+        object.__setattr__(dto, "__pydantic_fields_set__", set(self._field_names))
+        object.__setattr__(dto, "__pydantic_extra__", None)
+        object.__setattr__(dto, "__pydantic_private__", None)
+        return dto
+
+
+def attribute_codec(annotation: Any) -> AttributeCodec:
+    origin = get_origin(annotation)
+    if origin in {Union, types.UnionType}:
+        (inner,) = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _optional_codec(attribute_codec(inner))
+    if origin is list:
+        (inner,) = get_args(annotation)
+        return _list_codec(attribute_codec(inner))
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _model_codec(DTOCodec(annotation))
+    if isinstance(annotation, type) and issubclass(annotation, enum.StrEnum):
+        return _str_enum_codec(annotation)
+    if annotation is str:
+        return AttributeCodec(encode=lambda v: {"S": v}, decode=_get_string, construct=_get_string)
+    if annotation is int:
+        return AttributeCodec(
+            encode=lambda v: {"N": str(v)}, decode=lambda v: int(v["N"]), construct=lambda v: int(v["N"])
+        )
+    raise TypeError(f"Unsupported DTO field type: {annotation}")
+
+
+def _optional_codec(inner: AttributeCodec) -> AttributeCodec:
+    return AttributeCodec(
+        encode=lambda v: {"NULL": True} if v is None else inner.encode(v),
+        decode=lambda v: None if "NULL" in v else inner.decode(v),
+        construct=lambda v: None if "NULL" in v else inner.construct(v),
+    )
+
+
+def _list_codec(inner: AttributeCodec) -> AttributeCodec:
+    return AttributeCodec(
+        encode=lambda v: {"L": [inner.encode(x) for x in v]},
+        decode=lambda v: [inner.decode(x) for x in v["L"]],
+        construct=lambda v: [inner.construct(x) for x in v["L"]],
+    )
+
+
+def _model_codec(codec: DTOCodec) -> AttributeCodec:
+    return AttributeCodec(
+        encode=lambda v: {"M": codec.encode(v)},
+        decode=lambda v: codec.decode(v["M"]),
+        construct=lambda v: codec.construct(v["M"]),
+    )
+
+
+def _str_enum_codec(enum_type: type[enum.StrEnum]) -> AttributeCodec:
+    return AttributeCodec(
+        encode=lambda v: {"S": str(v)},
+        decode=_get_string,
+        construct=lambda v: enum_type._value2member_map_[v["S"]],
+    )
@@ -1,6 +1,6 @@
 import json
 from dataclasses import asdict
-from typing import Self
+from typing import Collection, Self
 
 from types_aiobotocore_dynamodb.type_defs import TransactWriteItemTypeDef, UniversalAttributeValueTypeDef
 
@@ -45,7 +45,7 @@ class PaymentIntentDTO(AbstractDTO[PaymentIntent]):
         )
 
     def to_entity(self) -> PaymentIntent:
-        return PaymentIntent(
+        payment_intent = PaymentIntent(
             id=self.Id,
             state=self.State,
             customer_id=self.CustomerId,
@@ -55,8 +55,18 @@ class PaymentIntentDTO(AbstractDTO[PaymentIntent]):
             events=[],
             version=self.Version,
         )
+        payment_intent.clear_changes()
+        return payment_intent
 
-    def update_item_request(self, table_name: str) -> TransactWriteItemTypeDef:
+    def update_item_request(self, table_name: str, changed_fields: Collection[str]) -> TransactWriteItemTypeDef:
+        # Only the changed attributes are set, the version is incremented by every update
+        changed_attributes: dict[str, UniversalAttributeValueTypeDef] = {}
+        if "state" in changed_fields:
+            changed_attributes["State"] = {"S": self.State}
+        if "amount" in changed_fields:
+            changed_attributes["Amount"] = {"N": str(self.Amount)}
+        if "charge" in changed_fields:
+            changed_attributes["Charge"] = {"S": self.Charge} if self.Charge else {"NULL": True}
         return {
             "Update": {
                 "TableName": table_name,
@@ -64,21 +74,20 @@ class PaymentIntentDTO(AbstractDTO[PaymentIntent]):
                     "PK": {"S": self.PK},
                     "SK": {"S": self.SK},
                 },
-                "UpdateExpression": "SET #State = :State, #Amount = :Amount, #Charge = :Charge, #Version = :NewVersion",
+                "UpdateExpression": "SET "
+                + ", ".join([*(f"#{name} = :{name}" for name in changed_attributes), "#Version = :NewVersion"]),
                 "ExpressionAttributeNames": {
-                    "#State": "State",
-                    "#Amount": "Amount",
-                    "#Charge": "Charge",
+                    **{f"#{name}": name for name in changed_attributes},
                     "#Version": "Version",
                 },
                 "ExpressionAttributeValues": {
-                    ":State": {"S": self.State},
-                    ":Amount": {"N": str(self.Amount)},
-                    ":Charge": {"S": self.Charge} if self.Charge else {"NULL": True},
+                    **{f":{name}": value for name, value in changed_attributes.items()},
                     ":NewVersion": {"N": str(self.Version + 1)},
                     ":CurrentVersion": {"N": str(self.Version)},
                 },
                 "ConditionExpression": "attribute_exists(Id) AND Version = :CurrentVersion",
+                # The current item is returned in the cancellation reason, so that a conflict doesn't need another read
+                "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
             }
         }
 
@@ -1,45 +1,137 @@
+import asyncio
+import datetime
+from typing import Iterable, Mapping, Sequence, cast
+
 from types_aiobotocore_dynamodb import DynamoDBClient
+from types_aiobotocore_dynamodb.type_defs import (
+    AttributeValueTypeDef,
+    PutTypeDef,
+    TransactWriteItemTypeDef,
+    UniversalAttributeValueTypeDef,
+)
 
-from optimistic_payments.domain import PaymentIntent, PaymentIntentNotFoundError
+from adapters.dynamodb import TRANSACT_WRITE_ITEMS_LIMIT, DynamoDBGroupCommitWriter
+from adapters.retry import RetryPolicy
+from adapters.singleflight import SingleFlight
+from optimistic_payments.domain import PaymentIntent, PaymentIntentNotFoundError, PaymentIntentState
 
-from ..exceptions import OptimisticLockError
+from ..exceptions import OptimisticLockError, PaymentIntentBatchGetError
 from .dto import PaymentIntentDTO, PaymentIntentEventDTO
 
+BATCH_GET_ITEM_LIMIT = 100
+
+DEFAULT_BATCH_GET_RETRY_POLICY = RetryPolicy(wait_timeout=datetime.timedelta(seconds=5), max_attempts=10)
+
 
 class DynamoDBPaymentIntentRepository:
-    def __init__(self, client: DynamoDBClient, table_name: str) -> None:
+    def __init__(
+        self,
+        client: DynamoDBClient,
+        table_name: str,
+        *,
+        coalesce_gets: bool = False,
+        batch_get_retry_policy: RetryPolicy | None = None,
+        group_commit: DynamoDBGroupCommitWriter | None = None,
+        consistent_read: bool = False,
+        singleflight_gets: bool = False,
+    ) -> None:
         self._client = client
         self._table_name = table_name
-
-    async def get(self, payment_intent_id: str) -> PaymentIntent:
-        response = await self._client.get_item(
-            TableName=self._table_name,
-            Key=PaymentIntentDTO.key(payment_intent_id),
+        # Eventually consistent reads cost half the read capacity, a stale read is rejected by the version check
+        self._consistent_read = consistent_read
+        # Concurrent gets issued within one event loop iteration are merged into a single BatchGetItem request
+        self._coalesce_gets = coalesce_gets
+        self._batch_get_retry_policy = batch_get_retry_policy or DEFAULT_BATCH_GET_RETRY_POLICY
+        self._pending_gets: dict[tuple[str, bool], asyncio.Future[PaymentIntentDTO | None]] = {}
+        self._background_tasks: set[asyncio.Task] = set()
+        # Concurrent creates are written together in a single TransactWriteItems request
+        self._group_commit = group_commit
+        # Eventually consistent gets of a payment intent that is already being read wait for that read instead of
+        # making their own. A joined read may have started before a write the caller has seen, so consistent reads
+        # are never joined
+        self._singleflight: SingleFlight[str, PaymentIntentDTO | None] | None = (
+            SingleFlight() if singleflight_gets else None
         )
-        if item := response.get("Item"):
-            return PaymentIntentDTO.from_dynamodb_item(item).to_entity()
+
+    @property
+    def consistent_read(self) -> bool:
+        return self._consistent_read
+
+    async def get(self, payment_intent_id: str, *, consistent_read: bool | None = None) -> PaymentIntent:
+        consistent_read = self._consistent_read if consistent_read is None else consistent_read
+        if self._singleflight and not consistent_read:
+            payment_intent_dto = await self._singleflight.do(
+                payment_intent_id, lambda: self._get_dto(payment_intent_id, consistent_read=False)
+            )
+        else:
+            payment_intent_dto = await self._get_dto(payment_intent_id, consistent_read)
+        if payment_intent_dto:
+            # Every caller gets its own aggregate, also when the read was shared
+            return payment_intent_dto.to_entity()
         raise PaymentIntentNotFoundError(payment_intent_id)
 
+    async def get_many(
+        self, payment_intent_ids: Iterable[str], *, consistent_read: bool | None = None
+    ) -> dict[str, PaymentIntent]:
+        consistent_read = self._consistent_read if consistent_read is None else consistent_read
+        payment_intent_dtos = await self._batch_get(payment_intent_ids, consistent_read)
+        return {payment_intent_id: dto.to_entity() for payment_intent_id, dto in payment_intent_dtos.items()}
+
     async def create(self, payment_intent: PaymentIntent) -> None:
-        await self._client.put_item(
-            TableName=self._table_name,
-            Item=PaymentIntentDTO.from_entity(payment_intent).to_dynamodb_item(),
-            ConditionExpression="attribute_not_exists(Id)",
-        )
+        put: PutTypeDef = {
+            "TableName": self._table_name,
+            "Item": PaymentIntentDTO.from_entity(payment_intent).to_dynamodb_item(),
+            "ConditionExpression": "attribute_not_exists(Id)",
+        }
+        if self._group_commit:
+            await self._group_commit.put_item(put)
+        else:
+            await self._client.put_item(**put)
+        payment_intent.clear_changes()
 
     async def update(self, payment_intent: PaymentIntent) -> None:
+        changed_fields = payment_intent.changed_fields
+        if not changed_fields and not payment_intent.events:
+            return
         payment_intent_dto = PaymentIntentDTO.from_entity(payment_intent)
+        update_request = payment_intent_dto.update_item_request(self._table_name, changed_fields)
+        if not payment_intent_dto.Events:
+            # A single item write doesn't need a transaction, which costs twice the write capacity
+            try:
+                await self._client.update_item(**update_request["Update"])
+            except self._client.exceptions.ConditionalCheckFailedException as e:
+                raise OptimisticLockError(
+                    payment_intent.id, self._current_payment_intent(e.response.get("Item"))
+                ) from e
+        else:
+            await self._update_with_events(payment_intent_dto, update_request)
+        payment_intent.mark_committed()
+
+    async def change_amount(self, payment_intent_id: str, amount: int) -> PaymentIntent:
+        # Single conditional write without reading the payment intent first, for a change that emits no events.
+        # The condition mirrors PaymentIntent.change_amount's state check
         try:
-            await self._client.transact_write_items(
-                TransactItems=[
-                    payment_intent_dto.update_item_request(self._table_name),
-                    *payment_intent_dto.add_event_item_requests(self._table_name),
-                ]
+            response = await self._client.update_item(
+                TableName=self._table_name,
+                Key=PaymentIntentDTO.key(payment_intent_id),
+                UpdateExpression="SET #Amount = :Amount, #Version = #Version + :VersionIncrement",
+                ExpressionAttributeNames={"#Amount": "Amount", "#State": "State", "#Version": "Version"},
+                ExpressionAttributeValues={
+                    ":Amount": {"N": str(amount)},
+                    ":VersionIncrement": {"N": "1"},
+                    ":ChangeableState": {"S": PaymentIntentState.CREATED},
+                },
+                ConditionExpression="attribute_exists(Id) AND #State = :ChangeableState",
+                ReturnValues="ALL_NEW",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
             )
-        except self._client.exceptions.TransactionCanceledException as e:
-            if e.response["CancellationReasons"][0]["Code"] == "ConditionalCheckFailed":
-                raise OptimisticLockError(payment_intent.id) from e
-            raise
+        except self._client.exceptions.ConditionalCheckFailedException as e:
+            if not (current_payment_intent := self._current_payment_intent(e.response.get("Item"))):
+                raise PaymentIntentNotFoundError(payment_intent_id) from e
+            # Replaying the change on the current payment intent raises the domain error for its state
+            current_payment_intent.change_amount(amount)
+            raise OptimisticLockError(payment_intent_id, current_payment_intent) from e
+        return PaymentIntentDTO.from_dynamodb_item(response["Attributes"], validate=False).to_entity()
 
     async def get_event(self, payment_intent_id: str, event_id: str) -> PaymentIntentEventDTO | None:
         response = await self._client.get_item(
@@ -47,5 +139,122 @@ class DynamoDBPaymentIntentRepository:
             Key=PaymentIntentEventDTO.key(payment_intent_id, event_id),
         )
         if item := response.get("Item"):
-            return PaymentIntentEventDTO.from_dynamodb_item(item)
+            return PaymentIntentEventDTO.from_dynamodb_item(item, validate=False)
         return None
+
+    async def _get_dto(self, payment_intent_id: str, consistent_read: bool) -> PaymentIntentDTO | None:
+        if self._coalesce_gets:
+            return await self._get_coalesced(payment_intent_id, consistent_read)
+        response = await self._client.get_item(
+            TableName=self._table_name,
+            Key=PaymentIntentDTO.key(payment_intent_id),
+            ConsistentRead=consistent_read,
+        )
+        if item := response.get("Item"):
+            return PaymentIntentDTO.from_dynamodb_item(item, validate=False)
+        return None
+
+    async def _update_with_events(
+        self, payment_intent_dto: PaymentIntentDTO, update_request: TransactWriteItemTypeDef
+    ) -> None:
+        # Events are written in the same transaction as the version checked update, so they're published only when
+        # the update commits. Splitting them across transactions would expose events of an update that later fails
+        if len(payment_intent_dto.Events) > TRANSACT_WRITE_ITEMS_LIMIT - 1:
+            raise ValueError(
+                f"Cannot commit more than {TRANSACT_WRITE_ITEMS_LIMIT - 1} events with a single payment intent update"
+            )
+        await self._transact_write_items(
+            payment_intent_dto.Id, [update_request, *payment_intent_dto.add_event_item_requests(self._table_name)]
+        )
+
+    async def _transact_write_items(
+        self, payment_intent_id: str, transact_items: Sequence[TransactWriteItemTypeDef]
+    ) -> None:
+        try:
+            await self._client.transact_write_items(TransactItems=transact_items)
+        except self._client.exceptions.TransactionCanceledException as e:
+            reason = e.response["CancellationReasons"][0]
+            if reason["Code"] == "ConditionalCheckFailed":
+                raise OptimisticLockError(payment_intent_id, self._current_payment_intent(reason.get("Item"))) from e
+            raise
+
+    @staticmethod
+    def _current_payment_intent(item: object) -> PaymentIntent | None:
+        if not item:
+            return None
+        item = cast(dict[str, AttributeValueTypeDef], item)
+        return PaymentIntentDTO.from_dynamodb_item(item, validate=False).to_entity()
+
+    async def _get_coalesced(self, payment_intent_id: str, consistent_read: bool) -> PaymentIntentDTO | None:
+        if (future := self._pending_gets.get((payment_intent_id, consistent_read))) is None:
+            loop = asyncio.get_running_loop()
+            if not self._pending_gets:
+                loop.call_soon(self._flush_pending_gets)
+            future = self._pending_gets[(payment_intent_id, consistent_read)] = loop.create_future()
+        # A cancelled caller must not cancel the result for the other callers waiting for the same batch
+        return await asyncio.shield(future)
+
+    def _flush_pending_gets(self) -> None:
+        pending_gets, self._pending_gets = self._pending_gets, {}
+        for consistent_read in (False, True):
+            if pending_gets_by_id := {
+                payment_intent_id: future
+                for (payment_intent_id, consistent), future in pending_gets.items()
+                if consistent is consistent_read
+            }:
+                task = asyncio.create_task(self._resolve_pending_gets(pending_gets_by_id, consistent_read))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+
+    async def _resolve_pending_gets(
+        self, pending_gets: dict[str, asyncio.Future[PaymentIntentDTO | None]], consistent_read: bool
+    ) -> None:
+        try:
+            payment_intent_dtos = await self._batch_get(pending_gets.keys(), consistent_read)
+        except Exception as e:  # noqa: BLE001
+            # Coalesced callers only await their futures, so a failure of any type, e.g. a malformed item, must reach
+            # them instead of leaving them waiting forever on a background task that died
+            for future in pending_gets.values():
+                future.set_exception(e)
+            return
+        for payment_intent_id, future in pending_gets.items():
+            future.set_result(payment_intent_dtos.get(payment_intent_id))
+
+    async def _batch_get(self, payment_intent_ids: Iterable[str], consistent_read: bool) -> dict[str, PaymentIntentDTO]:
+        unique_ids = list(dict.fromkeys(payment_intent_ids))  # BatchGetItem rejects duplicate keys
+        chunks = await asyncio.gather(
+            *[
+                self._batch_get_chunk(
+                    [PaymentIntentDTO.key(payment_intent_id) for payment_intent_id in chunk_ids], consistent_read
+                )
+                for chunk_ids in (
+                    unique_ids[i : i + BATCH_GET_ITEM_LIMIT] for i in range(0, len(unique_ids), BATCH_GET_ITEM_LIMIT)
+                )
+            ]
+        )
+        return {dto.Id: dto for chunk in chunks for dto in chunk}
+
+    async def _batch_get_chunk(
+        self, keys: Sequence[Mapping[str, UniversalAttributeValueTypeDef]], consistent_read: bool
+    ) -> list[PaymentIntentDTO]:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        payment_intent_dtos: list[PaymentIntentDTO] = []
+        attempt = 0
+        while True:
+            attempt += 1
+            response = await self._client.batch_get_item(
+                RequestItems={self._table_name: {"Keys": keys, "ConsistentRead": consistent_read}}
+            )
+            payment_intent_dtos.extend(
+                PaymentIntentDTO.from_dynamodb_item(item, validate=False)
+                for item in response["Responses"].get(self._table_name, [])
+            )
+            # Keys that DynamoDB didn't process because of throttling or the response size limit
+            if not (unprocessed_keys := response.get("UnprocessedKeys", {}).get(self._table_name)):
+                return payment_intent_dtos
+            keys = unprocessed_keys["Keys"]
+            elapsed = loop.time() - started_at
+            if not self._batch_get_retry_policy.can_retry(attempt, elapsed):
+                raise PaymentIntentBatchGetError([key["PK"] for key in keys])
+            await asyncio.sleep(self._batch_get_retry_policy.backoff(attempt, elapsed))
@@ -1,2 +1,12 @@
+from optimistic_payments.domain import PaymentIntent
+
+
 class OptimisticLockError(Exception):
+    def __init__(self, payment_intent_id: str, current_payment_intent: PaymentIntent | None = None) -> None:
+        super().__init__(payment_intent_id)
+        # Latest version returned by the failed write, None when the payment intent doesn't exist
+        self.current_payment_intent = current_payment_intent
+
+
+class PaymentIntentBatchGetError(Exception):
     pass
@@ -0,0 +1,131 @@
+import asyncio
+import collections
+import datetime
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Protocol, TypeVar
+
+from adapters.retry import RetryPolicy
+
+from .repository import OptimisticLockError
+
+T = TypeVar("T")
+
+DEFAULT_OPTIMISTIC_LOCK_RETRY_POLICY = RetryPolicy(
+    wait_timeout=datetime.timedelta(seconds=1),
+    max_attempts=5,
+    base_delay=datetime.timedelta(milliseconds=2),
+    max_delay=datetime.timedelta(milliseconds=100),
+)
+
+
+class OptimisticLockRetryMetrics(Protocol):
+    def conflicted(self, use_case: str, *, attempt: int) -> None: ...  # pragma: no cover
+
+    def retried(self, use_case: str, *, attempt: int, delay: float) -> None: ...  # pragma: no cover
+
+    def exhausted(self, use_case: str, *, attempts: int, budget_exhausted: bool) -> None: ...  # pragma: no cover
+
+    def succeeded(self, use_case: str, *, attempts: int) -> None: ...  # pragma: no cover
+
+
+class NoopOptimisticLockRetryMetrics:
+    def conflicted(self, use_case: str, *, attempt: int) -> None:
+        pass
+
+    def retried(self, use_case: str, *, attempt: int, delay: float) -> None:
+        pass
+
+    def exhausted(self, use_case: str, *, attempts: int, budget_exhausted: bool) -> None:
+        pass
+
+    def succeeded(self, use_case: str, *, attempts: int) -> None:
+        pass
+
+
+@dataclass
+class InMemoryOptimisticLockRetryMetrics:
+    conflicts: collections.Counter[str] = field(default_factory=collections.Counter)
+    retries: collections.Counter[str] = field(default_factory=collections.Counter)
+    exhausted_retries: collections.Counter[str] = field(default_factory=collections.Counter)
+    exhausted_budget: collections.Counter[str] = field(default_factory=collections.Counter)
+    attempts: collections.Counter[str] = field(default_factory=collections.Counter)
+
+    def conflicted(self, use_case: str, *, attempt: int) -> None:
+        self.conflicts[use_case] += 1
+
+    def retried(self, use_case: str, *, attempt: int, delay: float) -> None:
+        self.retries[use_case] += 1
+
+    def exhausted(self, use_case: str, *, attempts: int, budget_exhausted: bool) -> None:
+        self.attempts[use_case] += attempts
+        if budget_exhausted:
+            self.exhausted_budget[use_case] += 1
+        else:
+            self.exhausted_retries[use_case] += 1
+
+    def succeeded(self, use_case: str, *, attempts: int) -> None:
+        self.attempts[use_case] += attempts
+
+    def conflict_rate(self, use_case: str) -> float:
+        # Share of writes rejected by the version check, e.g. because they were based on a stale read
+        return self.conflicts[use_case] / self.attempts[use_case] if self.attempts[use_case] else 0.0
+
+
+class RetryBudget:
+    def __init__(self, *, max_tokens: float = 100.0, token_ratio: float = 0.1) -> None:
+        # Retries spend a token and successful operations earn a fraction of one back,
+        # so that sustained contention can't multiply the load on a hot item
+        self._max_tokens = max_tokens
+        self._token_ratio = token_ratio
+        self._tokens = max_tokens
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def deposit(self) -> None:
+        self._tokens = min(self._max_tokens, self._tokens + self._token_ratio)
+
+
+class OptimisticLockRetry:
+    def __init__(
+        self,
+        policy: RetryPolicy | None = None,
+        *,
+        budget: RetryBudget | None = None,
+        metrics: OptimisticLockRetryMetrics | None = None,
+    ) -> None:
+        self._policy = policy or DEFAULT_OPTIMISTIC_LOCK_RETRY_POLICY
+        self._budget = budget or RetryBudget()
+        self._metrics = metrics or NoopOptimisticLockRetryMetrics()
+
+    async def run(self, use_case: str, operation: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = await operation()
+            except OptimisticLockError:
+                self._metrics.conflicted(use_case, attempt=attempt)
+                elapsed = loop.time() - started_at
+                if not self._policy.can_retry(attempt, elapsed):
+                    self._metrics.exhausted(use_case, attempts=attempt, budget_exhausted=False)
+                    raise
+                if not self._budget.withdraw():
+                    self._metrics.exhausted(use_case, attempts=attempt, budget_exhausted=True)
+                    raise
+                delay = self._policy.backoff(attempt, elapsed)
+                self._metrics.retried(use_case, attempt=attempt, delay=delay)
+                await asyncio.sleep(delay)
+            else:
+                self._budget.deposit()
+                self._metrics.succeeded(use_case, attempts=attempt)
+                return result
@@ -1,9 +1,14 @@
+from typing import Callable
+
 from .domain import PaymentIntent
-from .repository import PaymentIntentRepository
+from .repository import OptimisticLockError, PaymentIntentRepository
+from .retry import OptimisticLockRetry
 
 
-async def get_payment_intent(payment_intent_id: str, repository: PaymentIntentRepository) -> PaymentIntent:
-    return await repository.get(payment_intent_id)
+async def get_payment_intent(
+    payment_intent_id: str, repository: PaymentIntentRepository, *, consistent_read: bool | None = None
+) -> PaymentIntent:
+    return await repository.get(payment_intent_id, consistent_read=consistent_read)
 
 
 async def create_payment_intent(
@@ -15,23 +20,35 @@ async def create_payment_intent(
 
 
 async def change_payment_intent_amount(
-    payment_intent_id: str, amount: int, repository: PaymentIntentRepository
+    payment_intent_id: str,
+    amount: int,
+    repository: PaymentIntentRepository,
+    *,
+    retry: OptimisticLockRetry | None = None,
+    read_free: bool = False,
 ) -> PaymentIntent:
-    payment_intent = await repository.get(payment_intent_id)
-
-    payment_intent.change_amount(amount)
-    await repository.update(payment_intent)
-
-    return payment_intent
-
-
-async def request_payment_request_charge(payment_intent_id: str, repository: PaymentIntentRepository) -> PaymentIntent:
-    payment_intent = await repository.get(payment_intent_id)
-
-    payment_intent.request_charge()
-    await repository.update(payment_intent)
-
-    return payment_intent
+    if read_free:
+        # A single conditional write, so there is no version to conflict with and nothing to retry
+        return await repository.change_amount(payment_intent_id, amount)
+    return await _update_payment_intent(
+        "change_payment_intent_amount",
+        payment_intent_id,
+        lambda payment_intent: payment_intent.change_amount(amount),
+        repository,
+        retry,
+    )
+
+
+async def request_payment_request_charge(
+    payment_intent_id: str, repository: PaymentIntentRepository, *, retry: OptimisticLockRetry | None = None
+) -> PaymentIntent:
+    return await _update_payment_intent(
+        "request_payment_request_charge",
+        payment_intent_id,
+        lambda payment_intent: payment_intent.request_charge(),
+        repository,
+        retry,
+    )
 
 
 async def handle_payment_intent_charge_response(
@@ -40,10 +57,44 @@ async def handle_payment_intent_charge_response(
     error_code: str | None,
     error_message: str | None,
     repository: PaymentIntentRepository,
+    *,
+    retry: OptimisticLockRetry | None = None,
 ) -> PaymentIntent:
-    payment_intent = await repository.get(payment_intent_id)
+    return await _update_payment_intent(
+        "handle_payment_intent_charge_response",
+        payment_intent_id,
+        lambda payment_intent: payment_intent.handle_charge_response(charge_id, error_code, error_message),
+        repository,
+        retry,
+    )
 
-    payment_intent.handle_charge_response(charge_id, error_code, error_message)
-    await repository.update(payment_intent)
 
-    return payment_intent
+async def _update_payment_intent(
+    use_case: str,
+    payment_intent_id: str,
+    update: Callable[[PaymentIntent], None],
+    repository: PaymentIntentRepository,
+    retry: OptimisticLockRetry | None,
+) -> PaymentIntent:
+    current_payment_intent: PaymentIntent | None = None
+
+    async def get_and_update() -> PaymentIntent:
+        nonlocal current_payment_intent
+        # A retry starts from the latest version returned by the conflicting write, without another read.
+        # An eventually consistent read is enough, because a write based on a stale read fails the version check
+        payment_intent = current_payment_intent or await repository.get(payment_intent_id, consistent_read=False)
+        current_payment_intent = None
+
+        update(payment_intent)
+        try:
+            await repository.update(payment_intent)
+        except OptimisticLockError as e:
+            current_payment_intent = e.current_payment_intent
+            raise
+
+        return payment_intent
+
+    if retry is None:
+        return await get_and_update()
+    # On a version conflict the payment intent is reloaded and the domain method is applied to the latest version
+    return await retry.run(use_case, get_and_update)
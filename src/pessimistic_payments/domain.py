@@ -4,6 +4,8 @@ from enum import StrEnum
 
 from .payment_gateway import PaymentGateway
 
+UPDATABLE_FIELDS = frozenset({"state", "amount", "charge"})
+
 
 class PaymentIntentNotFoundError(Exception):
     pass
@@ -42,6 +44,8 @@ class PaymentIntent:
         self._amount = amount
         self._currency = currency
         self._charge = charge
+        # Fields changed since the aggregate was loaded, so that only those are written; unknown for a new aggregate
+        self._changed_fields = set(UPDATABLE_FIELDS)
 
     @property
     def id(self) -> str:
@@ -67,6 +71,13 @@ class PaymentIntent:
     def charge(self) -> Charge | None:
         return self._charge
 
+    @property
+    def changed_fields(self) -> frozenset[str]:
+        return frozenset(self._changed_fields)
+
+    def clear_changes(self) -> None:
+        self._changed_fields.clear()
+
     @staticmethod
     def create(customer_id: str, amount: int, currency: str) -> "PaymentIntent":
         return PaymentIntent(
@@ -82,7 +93,9 @@ class PaymentIntent:
         if self._state != PaymentIntentState.CREATED:
             raise PaymentIntentStateError(f"Cannot change PaymentIntent amount in state: {self._state}")
 
-        self._amount = amount
+        if amount != self._amount:
+            self._amount = amount
+            self._changed_fields.add("amount")
 
     async def execute_charge(self, payment_gateway: PaymentGateway) -> None:
         if self._state != PaymentIntentState.CREATED:
@@ -99,6 +112,7 @@ class PaymentIntent:
             error_code=response.error_code,
             error_message=response.error_message,
         )
+        self._changed_fields.update(("state", "charge"))
 
     def __eq__(self, __value: object) -> bool:
         if not isinstance(__value, PaymentIntent):
@@ -1,14 +1,25 @@
+import asyncio
 import json
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from dataclasses import asdict
 from typing import AsyncGenerator, Protocol
 
 from types_aiobotocore_dynamodb import DynamoDBClient
+from types_aiobotocore_dynamodb.type_defs import AttributeValueTypeDef, PutTypeDef
 
-from database_locks import DynamoDBPessimisticLock
+from adapters.dynamodb import DynamoDBGroupCommitWriter
+from adapters.singleflight import SingleFlight
+from database_locks import CommitUpdate, DynamoDBPessimisticLock, PessimisticLockItemNotFoundError, PessimisticLockLease
 
 from .domain import Charge, PaymentIntent, PaymentIntentNotFoundError, PaymentIntentState
 
+# Leases held by the current task per repository, so that an update made under a lock is committed together with its
+# release. Tasks spawned inside the locked block inherit the context, so the holding task is stored with the lease
+_held_leases: ContextVar[dict[tuple[int, str], tuple[asyncio.Task | None, PessimisticLockLease]]] = ContextVar(
+    "held_leases"
+)
+
 
 class PaymentIntentRepository(Protocol):
     @asynccontextmanager
@@ -23,10 +34,27 @@ class PaymentIntentRepository(Protocol):
 
 
 class DynamoDBPaymentIntentRepository:
-    def __init__(self, client: DynamoDBClient, table_name: str) -> None:
+    def __init__(
+        self,
+        client: DynamoDBClient,
+        table_name: str,
+        *,
+        lock: DynamoDBPessimisticLock | None = None,
+        group_commit: DynamoDBGroupCommitWriter | None = None,
+        singleflight_gets: bool = False,
+    ) -> None:
         self._client = client
         self._table_name = table_name
-        self._lock = DynamoDBPessimisticLock(self._client, self._table_name)
+        self._lock = lock or DynamoDBPessimisticLock(
+            self._client, self._table_name, fencing_token_attribute="__FencingToken", local_queue=True
+        )
+        # Concurrent creates are written together in a single TransactWriteItems request
+        self._group_commit = group_commit
+        # Gets of a payment intent that is already being read wait for that read instead of making their own.
+        # A joined read may have started before a write the caller has seen, so it's meant for polling reads
+        self._singleflight: SingleFlight[str, dict[str, AttributeValueTypeDef] | None] | None = (
+            SingleFlight() if singleflight_gets else None
+        )
 
     @asynccontextmanager
     async def lock(self, payment_intent_id: str) -> AsyncGenerator[PaymentIntent, None]:
@@ -34,11 +62,28 @@ class DynamoDBPaymentIntentRepository:
             {
                 "PK": {"S": f"PAYMENT_INTENT#{payment_intent_id}"},
                 "SK": {"S": "#PAYMENT_INTENT"},
-            }
-        ):
-            yield await self.get(payment_intent_id)
+            },
+            return_item=True,
+        ) as lease:
+            token = _held_leases.set(
+                {**_held_leases.get({}), (id(self), payment_intent_id): (asyncio.current_task(), lease)}
+            )
+            try:
+                yield self._payment_intent_from_item(lease.item)
+            finally:
+                _held_leases.reset(token)
 
     async def get(self, payment_intent_id: str) -> PaymentIntent:
+        if self._singleflight:
+            item = await self._singleflight.do(payment_intent_id, lambda: self._get_item(payment_intent_id))
+        else:
+            item = await self._get_item(payment_intent_id)
+        if item:
+            # Every caller gets its own aggregate, also when the read was shared
+            return self._payment_intent_from_item(item)
+        raise PaymentIntentNotFoundError(payment_intent_id)
+
+    async def _get_item(self, payment_intent_id: str) -> dict[str, AttributeValueTypeDef] | None:
         response = await self._client.get_item(
             TableName=self._table_name,
             Key={
@@ -47,21 +92,12 @@ class DynamoDBPaymentIntentRepository:
             },
             ConsistentRead=True,  # Consistent read is required when using two-phase locking for concurrency control
         )
-        if item := response.get("Item"):
-            return PaymentIntent(
-                id=item["Id"]["S"],
-                state=PaymentIntentState(item["State"]["S"]),
-                customer_id=item["CustomerId"]["S"],
-                amount=int(item["Amount"]["N"]),
-                currency=item["Currency"]["S"],
-                charge=Charge(**charge_item) if (charge_item := json.loads(item["Charge"]["S"])) else None,
-            )
-        raise PaymentIntentNotFoundError(payment_intent_id)
+        return response.get("Item")
 
     async def create(self, payment_intent: PaymentIntent) -> None:
-        await self._client.put_item(
-            TableName=self._table_name,
-            Item={
+        put: PutTypeDef = {
+            "TableName": self._table_name,
+            "Item": {
                 "PK": {"S": f"PAYMENT_INTENT#{payment_intent.id}"},
                 "SK": {"S": "#PAYMENT_INTENT"},
                 "Id": {"S": payment_intent.id},
@@ -71,10 +107,48 @@ class DynamoDBPaymentIntentRepository:
                 "Currency": {"S": payment_intent.currency},
                 "Charge": {"S": json.dumps(asdict(payment_intent.charge) if payment_intent.charge else {})},
             },
-            ConditionExpression="attribute_not_exists(Id)",
-        )
+            "ConditionExpression": "attribute_not_exists(Id)",
+        }
+        if self._group_commit:
+            await self._group_commit.put_item(put)
+        else:
+            await self._client.put_item(**put)
+        payment_intent.clear_changes()
 
     async def update(self, payment_intent: PaymentIntent) -> None:
+        # Only the changed attributes are set, and nothing is written when nothing has changed
+        changed_attributes: dict[str, AttributeValueTypeDef] = {}
+        if "state" in payment_intent.changed_fields:
+            changed_attributes["State"] = {"S": payment_intent.state}
+        if "amount" in payment_intent.changed_fields:
+            changed_attributes["Amount"] = {"N": str(payment_intent.amount)}
+        if "charge" in payment_intent.changed_fields:
+            changed_attributes["Charge"] = {
+                "S": json.dumps(asdict(payment_intent.charge) if payment_intent.charge else {})
+            }
+        if not changed_attributes:
+            return
+        update: CommitUpdate = {
+            "UpdateExpression": "SET " + ", ".join(f"#{name} = :{name}" for name in changed_attributes),
+            "ExpressionAttributeNames": {f"#{name}": name for name in changed_attributes},
+            "ExpressionAttributeValues": {f":{name}": value for name, value in changed_attributes.items()},
+            "ConditionExpression": "attribute_exists(Id)",
+        }
+        if held_lease := _held_leases.get({}).get((id(self), payment_intent.id)):
+            owner, lease = held_lease
+            try:
+                if owner is asyncio.current_task() and lease.held:
+                    # Update made under the lock also releases it, so the locked operation doesn't need a separate release
+                    await self._lock.commit(lease, update)
+                else:
+                    # Made from a task spawned under the lock, or after the lock was released by an earlier update.
+                    # Rejected once another holder has acquired the lock, instead of overwriting its writes
+                    await self._lock.fenced_update(lease, update)
+            except PessimisticLockItemNotFoundError as e:
+                raise PaymentIntentNotFoundError(payment_intent.id) from e
+            payment_intent.clear_changes()
+            return
+
         try:
             await self._client.update_item(
                 TableName=self._table_name,
@@ -82,18 +156,21 @@ class DynamoDBPaymentIntentRepository:
                     "PK": {"S": f"PAYMENT_INTENT#{payment_intent.id}"},
                     "SK": {"S": "#PAYMENT_INTENT"},
                 },
-                UpdateExpression="SET #State = :State, #Amount = :Amount, #Charge = :Charge",
-                ExpressionAttributeNames={
-                    "#State": "State",
-                    "#Amount": "Amount",
-                    "#Charge": "Charge",
-                },
-                ExpressionAttributeValues={
-                    ":State": {"S": payment_intent.state},
-                    ":Amount": {"N": str(payment_intent.amount)},
-                    ":Charge": {"S": json.dumps(asdict(payment_intent.charge) if payment_intent.charge else {})},
-                },
-                ConditionExpression="attribute_exists(Id)",
+                **update,
             )
         except self._client.exceptions.ConditionalCheckFailedException as e:
             raise PaymentIntentNotFoundError(payment_intent.id) from e
+        payment_intent.clear_changes()
+
+    @staticmethod
+    def _payment_intent_from_item(item: dict[str, AttributeValueTypeDef]) -> PaymentIntent:
+        payment_intent = PaymentIntent(
+            id=item["Id"]["S"],
+            state=PaymentIntentState(item["State"]["S"]),
+            customer_id=item["CustomerId"]["S"],
+            amount=int(item["Amount"]["N"]),
+            currency=item["Currency"]["S"],
+            charge=Charge(**charge_item) if (charge_item := json.loads(item["Charge"]["S"])) else None,
+        )
+        payment_intent.clear_changes()
+        return payment_intent
@@ -0,0 +1,23 @@
+import uuid
+from typing import AsyncGenerator
+
+import pytest_asyncio
+from types_aiobotocore_dynamodb import DynamoDBClient
+
+from adapters.dynamodb import create_table
+from adapters.in_memory_dynamodb import InMemoryDynamoDBClient
+
+
+@pytest_asyncio.fixture()
+async def in_memory_dynamodb_client() -> InMemoryDynamoDBClient:
+    client = InMemoryDynamoDBClient()
+    await create_table(client, "table", with_range_key=True)  # type: ignore[arg-type]
+    return client
+
+
+@pytest_asyncio.fixture()
+async def dynamodb_table_name(localstack_dynamodb_client: DynamoDBClient) -> AsyncGenerator[str, None]:
+    table_name = f"autotest-adapters-{uuid.uuid4()}"
+    await create_table(localstack_dynamodb_client, table_name, with_range_key=True)
+    yield table_name
+    await localstack_dynamodb_client.delete_table(TableName=table_name)
@@ -0,0 +1,54 @@
+import asyncio
+import dataclasses
+import uuid
+from typing import Any, cast
+
+import pytest
+from tomodachi_testcontainers import LocalStackContainer
+
+from adapters.dynamodb import DynamoDBClientConfig, DynamoDBClientFactory, create_table
+
+
+def client_config(localstack_container: LocalStackContainer) -> DynamoDBClientConfig:
+    return DynamoDBClientConfig(**localstack_container.get_aws_client_config())
+
+
+@pytest.mark.asyncio()
+async def test_should_share_single_client_between_callers(localstack_container: LocalStackContainer) -> None:
+    factory = DynamoDBClientFactory(client_config(localstack_container))
+    try:
+        clients = await asyncio.gather(*[factory.get_client() for _ in range(10)])
+
+        assert all(c is clients[0] for c in clients)
+    finally:
+        await factory.close()
+
+
+@pytest.mark.asyncio()
+async def test_should_create_client_with_tuned_config(localstack_container: LocalStackContainer) -> None:
+    config = dataclasses.replace(client_config(localstack_container), max_pool_connections=25, total_max_attempts=5)
+
+    aio_config = cast(Any, config.aio_config())  # botocore's Config stubs don't declare the options
+    assert aio_config.retries == {"mode": "standard", "total_max_attempts": 5}
+    assert aio_config.connector_args == {"keepalive_timeout": 60.0}
+
+    async with DynamoDBClientFactory(config) as client:
+        assert cast(Any, client.meta.config).max_pool_connections == 25
+
+        table_name = f"autotest-dynamodb-client-factory-{uuid.uuid4()}"
+        await create_table(client, table_name, with_range_key=False)
+        response = await client.describe_table(TableName=table_name)
+        assert response["Table"]["TableName"] == table_name
+        await client.delete_table(TableName=table_name)
+
+
+@pytest.mark.asyncio()
+async def test_should_create_new_client_after_close(localstack_container: LocalStackContainer) -> None:
+    factory = DynamoDBClientFactory(client_config(localstack_container))
+    client = await factory.get_client()
+    await factory.close()
+
+    try:
+        assert await factory.get_client() is not client
+    finally:
+        await factory.close()
@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+
+import pytest
+from pytest_mock import MockerFixture
+from types_aiobotocore_dynamodb import DynamoDBClient
+from types_aiobotocore_dynamodb.type_defs import PutTypeDef
+
+from adapters.dynamodb import DynamoDBGroupCommitWriter, GroupCommitConfig
+
+
+def put_request(table_name: str, item_id: str, value: str = "value") -> PutTypeDef:
+    return {
+        "TableName": table_name,
+        "Item": {"PK": {"S": f"ITEM#{item_id}"}, "SK": {"S": "#ITEM"}, "Id": {"S": item_id}, "Value": {"S": value}},
+        "ConditionExpression": "attribute_not_exists(Id)",
+    }
+
+
+async def get_value(client: DynamoDBClient, table_name: str, item_id: str) -> str | None:
+    response = await client.get_item(
+        TableName=table_name, Key={"PK": {"S": f"ITEM#{item_id}"}, "SK": {"S": "#ITEM"}}, ConsistentRead=True
+    )
+    return response["Item"]["Value"]["S"] if "Item" in response else None
+
+
+@pytest.mark.asyncio()
+async def test_should_write_concurrent_puts_in_single_transaction(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    writer = DynamoDBGroupCommitWriter(localstack_dynamodb_client)
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    await asyncio.gather(*[writer.put_item(put_request(dynamodb_table_name, str(i))) for i in range(10)])
+
+    assert transact_write_items.call_count == 1
+    assert len(transact_write_items.call_args.kwargs["TransactItems"]) == 10
+    for i in range(10):
+        assert await get_value(localstack_dynamodb_client, dynamodb_table_name, str(i)) == "value"
+
+
+@pytest.mark.asyncio()
+async def test_should_write_single_put_with_put_item(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    writer = DynamoDBGroupCommitWriter(localstack_dynamodb_client)
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    await writer.put_item(put_request(dynamodb_table_name, "1"))
+
+    assert transact_write_items.call_count == 0
+    assert await get_value(localstack_dynamodb_client, dynamodb_table_name, "1") == "value"
+
+
+@pytest.mark.asyncio()
+async def test_should_flush_batch_when_max_items_reached(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    writer = DynamoDBGroupCommitWriter(
+        localstack_dynamodb_client, GroupCommitConfig(max_delay=datetime.timedelta(hours=1), max_items=2)
+    )
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    await asyncio.gather(*[writer.put_item(put_request(dynamodb_table_name, str(i))) for i in range(4)])
+
+    assert transact_write_items.call_count == 2
+
+
+@pytest.mark.asyncio()
+async def test_should_fail_only_puts_with_failed_condition(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    writer = DynamoDBGroupCommitWriter(localstack_dynamodb_client)
+    await writer.put_item(put_request(dynamodb_table_name, "1", "existing"))
+
+    results = await asyncio.gather(
+        *[writer.put_item(put_request(dynamodb_table_name, str(i))) for i in range(3)], return_exceptions=True
+    )
+
+    assert results[0] is None
+    assert isinstance(results[1], localstack_dynamodb_client.exceptions.ConditionalCheckFailedException)
+    assert results[2] is None
+    assert await get_value(localstack_dynamodb_client, dynamodb_table_name, "1") == "existing"
+    assert await get_value(localstack_dynamodb_client, dynamodb_table_name, "0") == "value"
+    assert await get_value(localstack_dynamodb_client, dynamodb_table_name, "2") == "value"
+
+
+@pytest.mark.asyncio()
+async def test_should_write_puts_to_same_item_in_separate_transactions(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    writer = DynamoDBGroupCommitWriter(localstack_dynamodb_client)
+
+    results = await asyncio.gather(
+        writer.put_item(put_request(dynamodb_table_name, "1", "first")),
+        writer.put_item(put_request(dynamodb_table_name, "2")),
+        writer.put_item(put_request(dynamodb_table_name, "1", "second")),
+        return_exceptions=True,
+    )
+
+    assert results[:2] == [None, None]
+    assert isinstance(results[2], localstack_dynamodb_client.exceptions.ConditionalCheckFailedException)
+    assert await get_value(localstack_dynamodb_client, dynamodb_table_name, "1") == "first"
+
+
+def test_should_not_allow_more_items_than_transaction_limit() -> None:
+    with pytest.raises(ValueError, match="max_items"):
+        GroupCommitConfig(max_items=101)
@@ -0,0 +1,304 @@
+import asyncio
+
+import pytest
+
+from adapters.in_memory_dynamodb import InMemoryDynamoDBClient
+
+KEY = {"PK": {"S": "ITEM#1"}, "SK": {"S": "#ITEM"}}
+
+
+@pytest.mark.asyncio()
+async def test_should_put_and_get_item(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={**KEY, "Amount": {"N": "100"}})
+
+    response = await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+
+    assert response["Item"] == {**KEY, "Amount": {"N": "100"}}
+
+
+@pytest.mark.asyncio()
+async def test_should_not_return_not_existing_item(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    response = await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+
+    assert "Item" not in response
+
+
+@pytest.mark.asyncio()
+async def test_returned_item_is_a_copy(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={**KEY, "Tags": {"SS": ["a"]}})
+
+    response = await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+    response["Item"]["Tags"]["SS"].append("b")
+
+    response = await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+    assert response["Item"]["Tags"] == {"SS": ["a"]}
+
+
+@pytest.mark.asyncio()
+async def test_should_project_item_attributes(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={**KEY, "Amount": {"N": "100"}, "Id": {"S": "1"}})
+
+    response = await in_memory_dynamodb_client.get_item(
+        TableName="table", Key=KEY, ProjectionExpression="#Amount", ExpressionAttributeNames={"#Amount": "Amount"}
+    )
+
+    assert response["Item"] == {"Amount": {"N": "100"}}
+
+
+@pytest.mark.asyncio()
+async def test_conditional_put_fails_with_old_item(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={**KEY, "Id": {"S": "1"}})
+
+    with pytest.raises(in_memory_dynamodb_client.exceptions.ConditionalCheckFailedException) as e:
+        await in_memory_dynamodb_client.put_item(
+            TableName="table",
+            Item={**KEY, "Id": {"S": "2"}},
+            ConditionExpression="attribute_not_exists(Id)",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+
+    assert e.value.response["Error"]["Code"] == "ConditionalCheckFailedException"
+    assert e.value.response.get("Item") == {**KEY, "Id": {"S": "1"}}
+
+
+@pytest.mark.asyncio()
+async def test_should_update_item_with_update_expression(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    await in_memory_dynamodb_client.put_item(
+        TableName="table", Item={**KEY, "Amount": {"N": "100"}, "LockedAt": {"S": "2024-01-01"}}
+    )
+
+    response = await in_memory_dynamodb_client.update_item(
+        TableName="table",
+        Key=KEY,
+        UpdateExpression="SET #Amount = #Amount + :Increment, #Version = if_not_exists(#Version, :Zero) REMOVE LockedAt ADD #Counter :One",
+        ExpressionAttributeNames={"#Amount": "Amount", "#Version": "Version", "#Counter": "Counter"},
+        ExpressionAttributeValues={":Increment": {"N": "50"}, ":Zero": {"N": "0"}, ":One": {"N": "1"}},
+        ConditionExpression="Amount BETWEEN :Zero AND :Increment OR (attribute_exists(LockedAt) AND NOT Amount = :One)",
+        ReturnValues="UPDATED_NEW",
+    )
+
+    assert response["Attributes"] == {"Amount": {"N": "150"}, "Version": {"N": "0"}, "Counter": {"N": "1"}}
+    response = await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+    assert response["Item"] == {**KEY, "Amount": {"N": "150"}, "Version": {"N": "0"}, "Counter": {"N": "1"}}
+
+
+@pytest.mark.asyncio()
+async def test_update_item_creates_not_existing_item(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    response = await in_memory_dynamodb_client.update_item(
+        TableName="table",
+        Key=KEY,
+        UpdateExpression="SET Amount = :Amount",
+        ExpressionAttributeValues={":Amount": {"N": "100"}},
+        ReturnValues="ALL_NEW",
+    )
+
+    assert response["Attributes"] == {**KEY, "Amount": {"N": "100"}}
+
+
+@pytest.mark.asyncio()
+async def test_failed_conditional_update_does_not_change_item(
+    in_memory_dynamodb_client: InMemoryDynamoDBClient,
+) -> None:
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={**KEY, "Version": {"N": "2"}})
+
+    with pytest.raises(in_memory_dynamodb_client.exceptions.ConditionalCheckFailedException):
+        await in_memory_dynamodb_client.update_item(
+            TableName="table",
+            Key=KEY,
+            UpdateExpression="SET Version = :NewVersion",
+            ExpressionAttributeValues={":NewVersion": {"N": "2"}, ":CurrentVersion": {"N": "1"}},
+            ConditionExpression="Version = :CurrentVersion",
+        )
+
+    response = await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+    assert response["Item"]["Version"] == {"N": "2"}
+
+
+@pytest.mark.asyncio()
+async def test_conditional_update_of_missing_item_fails_on_condition_before_update_expression(
+    in_memory_dynamodb_client: InMemoryDynamoDBClient,
+) -> None:
+    with pytest.raises(in_memory_dynamodb_client.exceptions.ConditionalCheckFailedException):
+        await in_memory_dynamodb_client.update_item(
+            TableName="table",
+            Key=KEY,
+            UpdateExpression="SET Version = Version + :One",
+            ExpressionAttributeValues={":One": {"N": "1"}},
+            ConditionExpression="attribute_exists(Version)",
+        )
+
+
+@pytest.mark.asyncio()
+@pytest.mark.parametrize(
+    ("update_expression", "expression_attribute_values"),
+    [
+        ("SET Amount = :Amount", {":Amount": {"N": "1"}, ":Unused": {"N": "1"}}),
+        ("SET Amount = :Undefined", {}),
+        ("SET PK = :Amount", {":Amount": {"S": "ITEM#2"}}),
+        ("SET Amount = :Amount REMOVE Amount", {":Amount": {"N": "1"}}),
+        ("REMOVE Amount REMOVE Version", {}),
+        ("SET Amount = Amount +", {}),
+    ],
+)
+async def test_invalid_update_raises_validation_error(
+    in_memory_dynamodb_client: InMemoryDynamoDBClient, update_expression: str, expression_attribute_values: dict
+) -> None:
+    with pytest.raises(in_memory_dynamodb_client.exceptions.ClientError) as e:
+        await in_memory_dynamodb_client.update_item(
+            TableName="table",
+            Key=KEY,
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_attribute_values,
+        )
+
+    assert e.value.response["Error"]["Code"] == "ValidationException"
+
+
+@pytest.mark.asyncio()
+async def test_should_delete_item(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    await in_memory_dynamodb_client.put_item(TableName="table", Item=KEY)
+
+    response = await in_memory_dynamodb_client.delete_item(TableName="table", Key=KEY, ReturnValues="ALL_OLD")
+
+    assert response["Attributes"] == KEY
+    assert "Item" not in await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+
+
+@pytest.mark.asyncio()
+async def test_cancelled_transaction_returns_cancellation_reasons_and_writes_nothing(
+    in_memory_dynamodb_client: InMemoryDynamoDBClient,
+) -> None:
+    other_key = {"PK": {"S": "ITEM#2"}, "SK": {"S": "#ITEM"}}
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={**other_key, "Id": {"S": "2"}})
+
+    with pytest.raises(in_memory_dynamodb_client.exceptions.TransactionCanceledException) as e:
+        await in_memory_dynamodb_client.transact_write_items(
+            TransactItems=[
+                {"Put": {"TableName": "table", "Item": {**KEY, "Id": {"S": "1"}}}},
+                {
+                    "Update": {
+                        "TableName": "table",
+                        "Key": other_key,
+                        "UpdateExpression": "SET Amount = :Amount",
+                        "ExpressionAttributeValues": {":Amount": {"N": "100"}},
+                        "ConditionExpression": "attribute_not_exists(Id)",
+                        "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+                    }
+                },
+            ]
+        )
+
+    assert e.value.response["CancellationReasons"] == [
+        {"Code": "None"},
+        {
+            "Code": "ConditionalCheckFailed",
+            "Message": "The conditional request failed",
+            "Item": {**other_key, "Id": {"S": "2"}},
+        },
+    ]
+    assert "Item" not in await in_memory_dynamodb_client.get_item(TableName="table", Key=KEY)
+
+
+@pytest.mark.asyncio()
+async def test_transaction_cannot_include_multiple_operations_on_one_item(
+    in_memory_dynamodb_client: InMemoryDynamoDBClient,
+) -> None:
+    with pytest.raises(in_memory_dynamodb_client.exceptions.ClientError) as e:
+        await in_memory_dynamodb_client.transact_write_items(
+            TransactItems=[
+                {"Put": {"TableName": "table", "Item": KEY}},
+                {"Delete": {"TableName": "table", "Key": KEY}},
+            ]
+        )
+
+    assert e.value.response["Error"]["Code"] == "ValidationException"
+
+
+@pytest.mark.asyncio()
+async def test_should_transact_get_items(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={**KEY, "Id": {"S": "1"}})
+
+    response = await in_memory_dynamodb_client.transact_get_items(
+        TransactItems=[
+            {"Get": {"TableName": "table", "Key": KEY, "ProjectionExpression": "Id"}},
+            {"Get": {"TableName": "table", "Key": {"PK": {"S": "ITEM#2"}, "SK": {"S": "#ITEM"}}}},
+        ]
+    )
+
+    assert response["Responses"] == [{"Item": {"Id": {"S": "1"}}}, {}]
+
+
+@pytest.mark.asyncio()
+async def test_should_batch_write_and_get_items(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    keys = [{"PK": {"S": f"ITEM#{n}"}, "SK": {"S": "#ITEM"}} for n in range(3)]
+    await in_memory_dynamodb_client.put_item(TableName="table", Item=keys[2])
+
+    await in_memory_dynamodb_client.batch_write_item(
+        RequestItems={
+            "table": [
+                {"PutRequest": {"Item": keys[0]}},
+                {"PutRequest": {"Item": keys[1]}},
+                {"DeleteRequest": {"Key": keys[2]}},
+            ]
+        }
+    )
+    response = await in_memory_dynamodb_client.batch_get_item(RequestItems={"table": {"Keys": keys}})
+
+    assert response["Responses"] == {"table": [keys[0], keys[1]]}
+    assert response["UnprocessedKeys"] == {}
+
+
+@pytest.mark.asyncio()
+async def test_should_query_items_in_range_key_order(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    for sk in ["EVENT#2", "#ITEM", "EVENT#1", "EVENT#3"]:
+        await in_memory_dynamodb_client.put_item(TableName="table", Item={"PK": {"S": "ITEM#1"}, "SK": {"S": sk}})
+    await in_memory_dynamodb_client.put_item(TableName="table", Item={"PK": {"S": "ITEM#2"}, "SK": {"S": "EVENT#1"}})
+
+    response = await in_memory_dynamodb_client.query(
+        TableName="table",
+        KeyConditionExpression="PK = :PK AND begins_with(SK, :Prefix)",
+        ExpressionAttributeValues={":PK": {"S": "ITEM#1"}, ":Prefix": {"S": "EVENT#"}},
+        ScanIndexForward=False,
+        Limit=2,
+    )
+
+    assert [item["SK"]["S"] for item in response["Items"]] == ["EVENT#3", "EVENT#2"]
+    assert response["LastEvaluatedKey"] == {"PK": {"S": "ITEM#1"}, "SK": {"S": "EVENT#2"}}
+
+    response = await in_memory_dynamodb_client.query(
+        TableName="table",
+        KeyConditionExpression="PK = :PK AND begins_with(SK, :Prefix)",
+        ExpressionAttributeValues={":PK": {"S": "ITEM#1"}, ":Prefix": {"S": "EVENT#"}},
+        ScanIndexForward=False,
+        ExclusiveStartKey=response["LastEvaluatedKey"],
+    )
+
+    assert [item["SK"]["S"] for item in response["Items"]] == ["EVENT#1"]
+    assert "LastEvaluatedKey" not in response
+
+
+@pytest.mark.asyncio()
+async def test_should_raise_when_table_already_exists(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    with pytest.raises(in_memory_dynamodb_client.exceptions.ResourceInUseException):
+        await in_memory_dynamodb_client.create_table(
+            TableName="table",
+            AttributeDefinitions=[{"AttributeName": "PK", "AttributeType": "S"}],
+            KeySchema=[{"AttributeName": "PK", "KeyType": "HASH"}],
+        )
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_conditional_writes_are_serialized(in_memory_dynamodb_client: InMemoryDynamoDBClient) -> None:
+    async def create() -> bool:
+        try:
+            await in_memory_dynamodb_client.put_item(
+                TableName="table", Item={**KEY, "Id": {"S": "1"}}, ConditionExpression="attribute_not_exists(Id)"
+            )
+        except in_memory_dynamodb_client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    results = await asyncio.gather(*[create() for _ in range(10)])
+
+    assert results.count(True) == 1
+    assert in_memory_dynamodb_client.request_counts["PutItem"] == 10
@@ -0,0 +1,43 @@
+import datetime
+
+import pytest
+
+from adapters.retry import RetryPolicy
+
+
+@pytest.mark.parametrize(
+    ("policy", "attempt", "elapsed", "can_retry"),
+    [
+        (RetryPolicy(), 1, 0.0, False),
+        (RetryPolicy(wait_timeout=datetime.timedelta(seconds=1)), 1, 0.5, True),
+        (RetryPolicy(wait_timeout=datetime.timedelta(seconds=1)), 10, 1.0, False),
+        (RetryPolicy(max_attempts=3), 2, 60.0, True),
+        (RetryPolicy(max_attempts=3), 3, 0.0, False),
+        (RetryPolicy(wait_timeout=datetime.timedelta(seconds=1), max_attempts=3), 2, 1.0, False),
+    ],
+)
+def test_can_retry(policy: RetryPolicy, attempt: int, elapsed: float, can_retry: bool) -> None:
+    assert policy.can_retry(attempt, elapsed) is can_retry
+
+
+@pytest.mark.parametrize(
+    ("policy", "max_wait"),
+    [
+        (RetryPolicy(), datetime.timedelta(0)),
+        (RetryPolicy(wait_timeout=datetime.timedelta(seconds=5), max_attempts=3), datetime.timedelta(seconds=5)),
+        (RetryPolicy(max_attempts=3, max_delay=datetime.timedelta(seconds=2)), datetime.timedelta(seconds=4)),
+    ],
+)
+def test_max_wait(policy: RetryPolicy, max_wait: datetime.timedelta) -> None:
+    assert policy.max_wait == max_wait
+
+
+def test_backoff_should_not_exceed_wait_timeout() -> None:
+    policy = RetryPolicy(wait_timeout=datetime.timedelta(seconds=1), base_delay=datetime.timedelta(seconds=10))
+
+    assert policy.backoff(1, 0.9) <= 0.1 + 1e-9
+
+
+def test_should_require_at_least_one_attempt() -> None:
+    with pytest.raises(ValueError, match="max_attempts must be at least 1"):
+        RetryPolicy(max_attempts=0)
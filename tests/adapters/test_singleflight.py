@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from adapters.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio()
+async def test_should_share_in_flight_call_between_callers() -> None:
+    singleflight: SingleFlight[str, int] = SingleFlight()
+    calls = 0
+
+    async def call() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    assert await asyncio.gather(*[singleflight.do("key", call) for _ in range(10)]) == [1] * 10
+    assert await singleflight.do("key", call) == 2  # A finished call isn't shared with later callers
+
+
+@pytest.mark.asyncio()
+async def test_should_propagate_error_to_every_caller() -> None:
+    singleflight: SingleFlight[str, int] = SingleFlight()
+
+    async def call() -> int:
+        await asyncio.sleep(0.01)
+        raise ValueError("Error")
+
+    results = await asyncio.gather(*[singleflight.do("key", call) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio()
+async def test_cancelled_caller_does_not_cancel_call_for_other_callers() -> None:
+    singleflight: SingleFlight[str, str] = SingleFlight()
+
+    async def call() -> str:
+        await asyncio.sleep(0.01)
+        return "result"
+
+    cancelled_caller = asyncio.create_task(singleflight.do("key", call))
+    caller = asyncio.create_task(singleflight.do("key", call))
+    await asyncio.sleep(0)
+    cancelled_caller.cancel()
+
+    assert await caller == "result"
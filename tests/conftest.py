@@ -1,9 +1,14 @@
 import asyncio
+import os
 from contextlib import closing
 from typing import Generator, Iterator, cast
 
 import pytest
+import pytest_asyncio
 from tomodachi_testcontainers import DynamoDBAdminContainer, LocalStackContainer
+from types_aiobotocore_dynamodb import DynamoDBClient
+
+from adapters.in_memory_dynamodb import InMemoryDynamoDBClient
 
 
 @pytest.fixture(scope="session")
@@ -12,9 +17,18 @@ def event_loop() -> Iterator[asyncio.AbstractEventLoop]:
         yield loop
 
 
-@pytest.fixture(scope="session", autouse=True)
-def dynamodb_admin_container(
-    localstack_container: LocalStackContainer,
-) -> Generator[DynamoDBAdminContainer, None, None]:
-    with DynamoDBAdminContainer(dynamo_endpoint=localstack_container.get_internal_url()) as container:
-        yield cast(DynamoDBAdminContainer, container)
+if os.environ.get("TEST_DYNAMODB_CLIENT") == "in-memory":
+    # Fast local runs without containers: TEST_DYNAMODB_CLIENT=in-memory pytest --ignore tests/adapters/test_dynamodb.py
+
+    @pytest_asyncio.fixture()
+    async def localstack_dynamodb_client() -> DynamoDBClient:
+        return cast(DynamoDBClient, InMemoryDynamoDBClient())
+
+else:
+
+    @pytest.fixture(scope="session", autouse=True)
+    def dynamodb_admin_container(
+        localstack_container: LocalStackContainer,
+    ) -> Generator[DynamoDBAdminContainer, None, None]:
+        with DynamoDBAdminContainer(dynamo_endpoint=localstack_container.get_internal_url()) as container:
+            yield cast(DynamoDBAdminContainer, container)
@@ -16,6 +16,16 @@ async def dynamodb_table_name(localstack_dynamodb_client: DynamoDBClient) -> Asy
     await localstack_dynamodb_client.delete_table(TableName=table_name)
 
 
+@pytest_asyncio.fixture()
+async def dynamodb_lock_table_name(localstack_dynamodb_client: DynamoDBClient) -> AsyncGenerator[str, None]:
+    table_name = f"autotest-dynamodb-pessimistic-lock-table-{uuid.uuid4()}"
+    await create_table(
+        localstack_dynamodb_client, table_name, with_range_key=True, time_to_live_attribute="__LockTimeToLive"
+    )
+    yield table_name
+    await localstack_dynamodb_client.delete_table(TableName=table_name)
+
+
 @pytest_asyncio.fixture()
 async def dynamodb_pessimistic_lock(
     localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
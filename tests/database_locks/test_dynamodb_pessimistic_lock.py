@@ -1,4 +1,7 @@
+import asyncio
+import collections
 import datetime
+import json
 import uuid
 from unittest import mock
 
@@ -7,7 +10,18 @@ from pytest_mock import MockerFixture
 from types_aiobotocore_dynamodb import DynamoDBClient
 
 from adapters.dynamodb import create_table
-from database_locks import DynamoDBPessimisticLock, PessimisticLockAcquisitionError, PessimisticLockItemNotFoundError
+from database_locks import (
+    CommitUpdate,
+    DynamoDBPessimisticLock,
+    Histogram,
+    InMemoryPessimisticLockMetrics,
+    PessimisticLockAcquisitionError,
+    PessimisticLockCommitConditionFailedError,
+    PessimisticLockItemNotFoundError,
+    PessimisticLockLease,
+    PessimisticLockLostError,
+    RetryPolicy,
+)
 
 
 def mock_time_now(mocker: MockerFixture, now: str) -> None:
@@ -180,6 +194,25 @@ async def test_configurable_lock_attribute(
     }
 
 
+@pytest.mark.asyncio()
+async def test_should_store_lock_attribute_as_epoch_milliseconds(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, numeric_timestamps=True
+    )
+    mock_time_now(mocker, "2024-01-27T09:01:02.345+00:00")
+
+    # Act
+    async with dynamodb_pessimistic_lock(key):
+        # Assert
+        item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+        assert item["Item"]["__LockedAt"] == {"N": "1706346062345"}
+
+
 @pytest.mark.parametrize(
     ("now", "future", "lock_timeout"),
     [
@@ -188,6 +221,7 @@ async def test_configurable_lock_attribute(
         ("2024-01-27T09:00:00+00:00", "2024-01-27T11:00:00+00:00", datetime.timedelta(hours=2)),
     ],
 )
+@pytest.mark.parametrize("numeric_timestamps", [False, True])
 @pytest.mark.asyncio()
 async def test_should_not_discard_stale_lock_when_lock_timeout_has_not_expired(
     localstack_dynamodb_client: DynamoDBClient,
@@ -196,12 +230,16 @@ async def test_should_not_discard_stale_lock_when_lock_timeout_has_not_expired(
     now: str,
     future: str,
     lock_timeout: datetime.timedelta | None,
+    numeric_timestamps: bool,
 ) -> None:
     # Arrange
     key = generate_dynamodb_item_key()
     await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
     dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
-        localstack_dynamodb_client, dynamodb_table_name, lock_timeout=lock_timeout
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=lock_timeout,
+        numeric_timestamps=numeric_timestamps,
     )
 
     # Act
@@ -227,6 +265,7 @@ async def test_should_not_discard_stale_lock_when_lock_timeout_has_not_expired(
         ("2024-01-27T09:00:00+00:00", "2024-01-27T11:01:00+00:00", datetime.timedelta(hours=2)),
     ],
 )
+@pytest.mark.parametrize("numeric_timestamps", [False, True])
 @pytest.mark.asyncio()
 async def test_should_discard_stale_lock_when_lock_timeout_has_expired(
     localstack_dynamodb_client: DynamoDBClient,
@@ -235,26 +274,67 @@ async def test_should_discard_stale_lock_when_lock_timeout_has_expired(
     now: str,
     future: str,
     lock_timeout: datetime.timedelta,
+    numeric_timestamps: bool,
 ) -> None:
     # Arrange
     key = generate_dynamodb_item_key()
     await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
     dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
-        localstack_dynamodb_client, dynamodb_table_name, lock_timeout=lock_timeout
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=lock_timeout,
+        numeric_timestamps=numeric_timestamps,
     )
 
     # Act
     mock_time_now(mocker, now)
 
-    async with dynamodb_pessimistic_lock(key):
-        mock_time_now(mocker, future)
-
-        # Assert
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
         async with dynamodb_pessimistic_lock(key):
-            pass
+            mock_time_now(mocker, future)
+
+            # Assert
+            async with dynamodb_pessimistic_lock(key):
+                pass
+
+            async with dynamodb_pessimistic_lock(key):
+                pass
+
+
+@pytest.mark.asyncio()
+async def test_should_not_release_lock_taken_over_after_lock_timeout_expired(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=datetime.timedelta(seconds=1),
+        fencing_token_attribute="__FencingToken",
+    )
+    mock_time_now(mocker, "2024-01-27T09:00:00+00:00")
+
+    # Act
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as expired_lease:
+            mock_time_now(mocker, "2024-01-27T09:00:02+00:00")
+            current_lock = dynamodb_pessimistic_lock(key)
+            current_lease = await current_lock.__aenter__()
 
+    # Assert
+    assert expired_lease.lost is True
+    assert current_lease.held is True
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"]["__LockedAt"] == {"S": "2024-01-27T09:00:02+00:00"}
+    with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
         async with dynamodb_pessimistic_lock(key):
-            pass
+            pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    await current_lock.__aexit__(None, None, None)
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert "__LockedAt" not in item["Item"]
 
 
 @pytest.mark.asyncio()
@@ -281,3 +361,1239 @@ async def test_should_lock_and_unlock_item_with_only_partition_key(localstack_dy
 
     async with dynamodb_pessimistic_lock(key):
         pass
+
+
+@pytest.mark.asyncio()
+async def test_should_fail_on_first_attempt_by_default(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, metrics=metrics
+    )
+
+    async with dynamodb_pessimistic_lock(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    assert metrics.acquisitions == 1
+    assert metrics.acquisition_failures == 1
+    assert metrics.attempts == collections.Counter({1: 2})
+
+
+@pytest.mark.asyncio()
+async def test_should_wait_for_lock_release_within_wait_timeout(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(wait_timeout=datetime.timedelta(seconds=5)),
+        metrics=metrics,
+    )
+    lock_acquired = asyncio.Event()
+    lock_released = asyncio.Event()
+
+    async def hold_lock() -> None:
+        async with dynamodb_pessimistic_lock(key):
+            lock_acquired.set()
+            await asyncio.sleep(0.2)
+        lock_released.set()
+
+    # Act
+    holder = asyncio.create_task(hold_lock())
+    await lock_acquired.wait()
+
+    async with dynamodb_pessimistic_lock(key):
+        # Assert
+        assert lock_released.is_set()
+
+    await holder
+    assert metrics.acquisitions == 2
+    assert metrics.acquisition_failures == 0
+    assert max(metrics.attempts) > 1
+
+
+@pytest.mark.asyncio()
+async def test_should_raise_when_lock_not_released_within_wait_timeout(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(wait_timeout=datetime.timedelta(milliseconds=200)),
+        metrics=metrics,
+    )
+
+    async with dynamodb_pessimistic_lock(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    assert metrics.acquisition_failures == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_stop_retrying_after_max_attempts(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(wait_timeout=datetime.timedelta(minutes=1), max_attempts=3),
+        metrics=metrics,
+    )
+
+    async with dynamodb_pessimistic_lock(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    assert metrics.attempts[3] == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_retry_up_to_max_attempts_without_wait_timeout(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=datetime.timedelta(milliseconds=1)),
+        metrics=metrics,
+    )
+
+    async with dynamodb_pessimistic_lock(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    assert metrics.attempts[3] == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_not_hold_lock_when_cancelled_while_waiting(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(wait_timeout=datetime.timedelta(minutes=1)),
+    )
+
+    async def wait_for_lock() -> None:
+        async with dynamodb_pessimistic_lock(key):
+            pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    async with dynamodb_pessimistic_lock(key):
+        waiter = asyncio.create_task(wait_for_lock())
+        await asyncio.sleep(0.1)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert "__LockedAt" not in item["Item"]
+
+
+@pytest.mark.parametrize(
+    ("lock_timeout", "heartbeat_interval"),
+    [
+        (None, datetime.timedelta(seconds=1)),
+        (datetime.timedelta(seconds=1), datetime.timedelta(seconds=1)),
+        (datetime.timedelta(seconds=1), datetime.timedelta(seconds=2)),
+    ],
+)
+def test_heartbeat_interval_must_be_shorter_than_lock_timeout(
+    lock_timeout: datetime.timedelta | None, heartbeat_interval: datetime.timedelta
+) -> None:
+    with pytest.raises(ValueError, match="heartbeat_interval must be shorter than lock_timeout"):
+        DynamoDBPessimisticLock(
+            mock.Mock(), "table-name", lock_timeout=lock_timeout, heartbeat_interval=heartbeat_interval
+        )
+
+
+@pytest.mark.asyncio()
+async def test_should_keep_lock_with_heartbeat_after_lock_timeout(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=datetime.timedelta(milliseconds=500),
+        heartbeat_interval=datetime.timedelta(milliseconds=100),
+    )
+
+    # Act
+    async with dynamodb_pessimistic_lock(key) as lease:
+        await asyncio.sleep(1)
+
+        # Assert
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+        assert lease.lost is False
+
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert "__LockedAt" not in item["Item"]
+
+
+@pytest.mark.asyncio()
+async def test_should_raise_and_not_release_lock_when_lock_lost_during_heartbeat(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=datetime.timedelta(seconds=5),
+        heartbeat_interval=datetime.timedelta(milliseconds=100),
+    )
+
+    # Act
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            await localstack_dynamodb_client.update_item(
+                TableName=dynamodb_table_name,
+                Key=key,
+                UpdateExpression="SET #LockAttribute = :LockAttribute",
+                ExpressionAttributeNames={"#LockAttribute": "__LockedAt"},
+                ExpressionAttributeValues={":LockAttribute": {"S": "2124-01-01T00:00:00+00:00"}},
+            )
+            await asyncio.sleep(0.3)
+
+            assert lease.lost is True
+
+    # Assert
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"]["__LockedAt"] == {"S": "2124-01-01T00:00:00+00:00"}
+
+
+@pytest.mark.asyncio()
+async def test_should_not_issue_fencing_token_by_default(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+
+    async with dynamodb_pessimistic_lock(key) as lease:
+        assert lease.fencing_token is None
+
+
+@pytest.mark.asyncio()
+async def test_should_issue_monotonically_increasing_fencing_tokens(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, fencing_token_attribute="__FencingToken"
+    )
+
+    # Act
+    async with dynamodb_pessimistic_lock(key) as first_lease:
+        pass
+    async with dynamodb_pessimistic_lock(key) as second_lease:
+        pass
+
+    # Assert
+    assert first_lease.fencing_token == 1
+    assert second_lease.fencing_token == 2
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {
+        **key,
+        "Id": {"S": "123456"},
+        "Name": {"S": "Test Name"},
+        "__FencingToken": {"N": "2"},
+    }
+
+
+@pytest.mark.asyncio()
+async def test_should_acquire_and_release_many_locks_at_once(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    # Arrange
+    keys = [generate_dynamodb_item_key() for _ in range(3)]
+    for key in keys:
+        await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+
+    # Act
+    async with dynamodb_pessimistic_lock.acquire_many(keys) as leases:
+        # Assert
+        assert [lease.key for lease in leases] == sorted(keys, key=lambda key: json.dumps(key, sort_keys=True))
+        for key in keys:
+            item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+            assert "__LockedAt" in item["Item"]
+
+            with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+                async with dynamodb_pessimistic_lock(key):
+                    pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    # Assert
+    for key in keys:
+        item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+        assert "__LockedAt" not in item["Item"]
+
+
+@pytest.mark.asyncio()
+async def test_should_not_acquire_any_lock_if_one_of_many_is_already_locked(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    # Arrange
+    keys = [generate_dynamodb_item_key() for _ in range(3)]
+    for key in keys:
+        await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+
+    # Act
+    async with dynamodb_pessimistic_lock(keys[1]):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock.acquire_many(keys):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    # Assert
+    for key in keys:
+        item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+        assert "__LockedAt" not in item["Item"]
+
+
+@pytest.mark.asyncio()
+async def test_should_release_only_owned_locks_of_many_after_lock_timeout_expired(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    # Arrange
+    keys = sorted(
+        [generate_dynamodb_item_key() for _ in range(3)],
+        key=lambda key: json.dumps(key, sort_keys=True),
+    )
+    for key in keys:
+        await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, lock_timeout=datetime.timedelta(seconds=1)
+    )
+    mock_time_now(mocker, "2024-01-27T09:00:00+00:00")
+
+    # Act
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock.acquire_many(keys) as leases:
+            mock_time_now(mocker, "2024-01-27T09:00:02+00:00")
+            current_lock = dynamodb_pessimistic_lock(keys[1])
+            await current_lock.__aenter__()
+
+    # Assert
+    assert [lease.lost for lease in leases] == [False, True, False]
+    items = [await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key) for key in keys]
+    assert ["__LockedAt" in item["Item"] for item in items] == [False, True, False]
+    await current_lock.__aexit__(None, None, None)
+
+
+@pytest.mark.asyncio()
+async def test_should_issue_fencing_tokens_when_acquiring_many_locks(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    keys = [generate_dynamodb_item_key() for _ in range(2)]
+    for key in keys:
+        await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, fencing_token_attribute="__FencingToken"
+    )
+
+    async with dynamodb_pessimistic_lock(keys[0]):
+        pass
+    async with dynamodb_pessimistic_lock.acquire_many(keys) as leases:
+        assert [lease.fencing_token for lease in leases if lease.key == keys[0]] == [2]
+        assert [lease.fencing_token for lease in leases if lease.key == keys[1]] == [1]
+
+
+@pytest.mark.asyncio()
+async def test_should_not_acquire_more_locks_than_transaction_limit(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+) -> None:
+    keys = [generate_dynamodb_item_key() for _ in range(101)]
+
+    with pytest.raises(ValueError, match="Cannot acquire more than 100 locks in a single transaction"):  # noqa: PT012
+        async with dynamodb_pessimistic_lock.acquire_many(keys):
+            pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+
+@pytest.mark.parametrize(
+    ("keys", "match"),
+    [
+        ([], "Cannot acquire an empty list of locks"),
+        ([{"PK": {"S": "ITEM#1"}}, {"PK": {"S": "ITEM#1"}}], "Cannot acquire the same lock more than once"),
+    ],
+)
+@pytest.mark.asyncio()
+async def test_should_reject_empty_or_duplicate_keys_when_acquiring_many_locks(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, keys: list[dict], match: str
+) -> None:
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, local_queue=True
+    )
+
+    with pytest.raises(ValueError, match=match):  # noqa: PT012
+        async with dynamodb_pessimistic_lock.acquire_many(keys):
+            pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+
+@pytest.mark.asyncio()
+async def test_should_return_locked_item(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    mock_time_now(mocker, "2024-01-27T09:01:02+00:00")
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, fencing_token_attribute="__FencingToken"
+    )
+
+    async with dynamodb_pessimistic_lock(key, return_item=True) as lease:
+        assert lease.fencing_token == 1
+        assert lease.item == {
+            **key,
+            "Id": {"S": "123456"},
+            "Name": {"S": "Test Name"},
+            "__LockedAt": {"S": "2024-01-27T09:01:02+00:00"},
+            "__FencingToken": {"N": "1"},
+        }
+
+    async with dynamodb_pessimistic_lock(key) as lease:
+        assert lease.item == {}
+
+
+@pytest.mark.asyncio()
+async def test_should_commit_update_and_release_lock_in_single_write(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+    mocker: MockerFixture,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    update_item_spy = mocker.spy(localstack_dynamodb_client, "update_item")
+
+    # Act
+    async with dynamodb_pessimistic_lock(key) as lease:
+        await dynamodb_pessimistic_lock.commit(
+            lease,
+            {
+                "UpdateExpression": "SET #Name = :Name",
+                "ExpressionAttributeNames": {"#Name": "Name"},
+                "ExpressionAttributeValues": {":Name": {"S": "New Name"}},
+                "ConditionExpression": "attribute_exists(Id)",
+            },
+        )
+
+        # Assert
+        assert lease.released is True
+
+    # Assert
+    assert update_item_spy.call_count == 2
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {
+        **key,
+        "Id": {"S": "123456"},
+        "Name": {"S": "New Name"},
+    }
+
+
+@pytest.mark.asyncio()
+async def test_should_commit_update_with_remove_clause(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+
+    # Act
+    async with dynamodb_pessimistic_lock(key) as lease:
+        await dynamodb_pessimistic_lock.commit(
+            lease,
+            {
+                "UpdateExpression": "REMOVE #Name SET #Id = :Id",
+                "ExpressionAttributeNames": {"#Name": "Name", "#Id": "Id"},
+                "ExpressionAttributeValues": {":Id": {"S": "654321"}},
+            },
+        )
+
+    # Assert
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {**key, "Id": {"S": "654321"}}
+
+
+@pytest.mark.asyncio()
+async def test_should_not_commit_update_when_lock_taken_over(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, lock_timeout=datetime.timedelta(hours=2)
+    )
+
+    # Act
+    mock_time_now(mocker, "2024-01-27T09:00:00+00:00")
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            mock_time_now(mocker, "2024-01-27T11:00:01+00:00")
+            async with dynamodb_pessimistic_lock(key):
+                await dynamodb_pessimistic_lock.commit(
+                    lease,
+                    {
+                        "UpdateExpression": "SET #Name = :Name",
+                        "ExpressionAttributeNames": {"#Name": "Name"},
+                        "ExpressionAttributeValues": {":Name": {"S": "New Name"}},
+                    },
+                )
+
+    # Assert
+    assert lease.lost is True
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {
+        **key,
+        "Id": {"S": "123456"},
+        "Name": {"S": "Test Name"},
+    }
+
+
+@pytest.mark.asyncio()
+async def test_should_keep_lock_held_when_commit_condition_fails(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, fencing_token_attribute="__FencingToken"
+    )
+
+    # Act
+    with pytest.raises(PessimisticLockCommitConditionFailedError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            await dynamodb_pessimistic_lock.commit(
+                lease,
+                {
+                    "UpdateExpression": "SET #Name = :Name",
+                    "ExpressionAttributeNames": {"#Name": "Name"},
+                    "ExpressionAttributeValues": {":Name": {"S": "New Name"}, ":Expected": {"S": "Other Name"}},
+                    "ConditionExpression": "#Name = :Expected",
+                },
+            )
+
+    # Assert
+    assert lease.lost is False
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {
+        **key,
+        "Id": {"S": "123456"},
+        "Name": {"S": "Test Name"},
+        "__FencingToken": {"N": "1"},
+    }
+
+
+@pytest.mark.asyncio()
+async def test_local_queue_should_fail_without_request_when_lock_held_in_same_process(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, local_queue=True
+    )
+
+    async with dynamodb_pessimistic_lock(key):
+        update_item_spy = mocker.spy(localstack_dynamodb_client, "update_item")
+
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+        update_item_spy.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_local_queue_should_serve_same_process_contenders_in_order_without_failed_requests(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(wait_timeout=datetime.timedelta(seconds=10)),
+        local_queue=True,
+        metrics=metrics,
+    )
+    lock_holders: list[int] = []
+
+    async def hold_lock(n: int) -> None:
+        async with dynamodb_pessimistic_lock(key):
+            lock_holders.append(n)
+            await asyncio.sleep(0.01)
+
+    # Act
+    await asyncio.gather(*[hold_lock(n) for n in range(10)])
+
+    # Assert
+    assert lock_holders == list(range(10))
+    assert metrics.acquisitions == 10
+    assert metrics.acquisition_failures == 0
+    assert metrics.attempts == collections.Counter({1: 10})
+
+
+@pytest.mark.asyncio()
+async def test_local_queue_should_give_up_waiting_after_wait_timeout(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(wait_timeout=datetime.timedelta(milliseconds=100)),
+        local_queue=True,
+        metrics=metrics,
+    )
+
+    async with dynamodb_pessimistic_lock(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    async with dynamodb_pessimistic_lock(key):
+        pass
+
+    assert metrics.acquisition_failures == 1
+
+
+@pytest.mark.asyncio()
+async def test_shared_lock_should_be_held_by_many_readers_and_block_writers(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+
+    # Act
+    async with dynamodb_pessimistic_lock.shared(key), dynamodb_pessimistic_lock.shared(key):
+        # Assert
+        item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+        assert item["Item"]["__LockReaders"] == {"N": "2"}
+
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    # Assert
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {
+        **key,
+        "Id": {"S": "123456"},
+        "Name": {"S": "Test Name"},
+    }
+    async with dynamodb_pessimistic_lock(key):
+        pass
+
+
+@pytest.mark.asyncio()
+async def test_expired_reader_should_not_release_shared_lock_of_later_readers(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, lock_timeout=datetime.timedelta(seconds=1)
+    )
+    mock_time_now(mocker, "2024-01-27T09:00:00+00:00")
+
+    # Act
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock.shared(key) as expired_lease:
+            mock_time_now(mocker, "2024-01-27T09:00:02+00:00")
+            async with dynamodb_pessimistic_lock(key):
+                pass
+            current_lock = dynamodb_pessimistic_lock.shared(key)
+            current_lease = await current_lock.__aenter__()
+
+    # Assert
+    assert expired_lease.lost is True
+    assert current_lease.readers_generation != expired_lease.readers_generation
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"]["__LockReaders"] == {"N": "1"}
+    with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key):
+            pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    await current_lock.__aexit__(None, None, None)
+    async with dynamodb_pessimistic_lock(key):
+        pass
+
+
+@pytest.mark.asyncio()
+async def test_shared_lock_should_not_be_acquired_while_exclusive_lock_is_held(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+
+    async with dynamodb_pessimistic_lock(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock.shared(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    async with dynamodb_pessimistic_lock.shared(key):
+        pass
+
+
+@pytest.mark.asyncio()
+async def test_writer_giving_up_should_stop_turning_away_new_readers(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    waiting_dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(max_attempts=2, max_delay=datetime.timedelta(minutes=5)),
+    )
+
+    # Act
+    async with dynamodb_pessimistic_lock.shared(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with waiting_dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+        # Assert
+        item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+        assert "__LockWriterWaitingUntil" not in item["Item"]
+        async with dynamodb_pessimistic_lock.shared(key):
+            pass
+
+
+@pytest.mark.asyncio()
+async def test_waiting_writer_should_have_preference_over_new_readers(
+    dynamodb_pessimistic_lock: DynamoDBPessimisticLock,
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    waiting_dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        retry_policy=RetryPolicy(wait_timeout=datetime.timedelta(seconds=5)),
+    )
+    writer_acquired = asyncio.Event()
+
+    async def write() -> None:
+        async with waiting_dynamodb_pessimistic_lock(key):
+            writer_acquired.set()
+
+    # Act
+    async with dynamodb_pessimistic_lock.shared(key):
+        writer = asyncio.create_task(write())
+        await asyncio.sleep(0.2)
+
+        # Assert
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock.shared(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+        assert not writer_acquired.is_set()
+
+    await writer
+    assert writer_acquired.is_set()
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {
+        **key,
+        "Id": {"S": "123456"},
+        "Name": {"S": "Test Name"},
+    }
+
+
+@pytest.mark.asyncio()
+async def test_should_keep_lock_in_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+    dynamodb_lock_table_name: str,
+    mocker: MockerFixture,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=datetime.timedelta(minutes=5),
+        lock_table_name=dynamodb_lock_table_name,
+    )
+    mock_time_now(mocker, "2024-01-27T09:01:02+00:00")
+
+    # Act
+    async with dynamodb_pessimistic_lock(key):
+        # Assert
+        item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+        assert item["Item"] == {
+            **key,
+            "Id": {"S": "123456"},
+            "Name": {"S": "Test Name"},
+        }
+        lock_item = await localstack_dynamodb_client.get_item(TableName=dynamodb_lock_table_name, Key=key)
+        assert lock_item["Item"] == {
+            **key,
+            "__LockedAt": {"S": "2024-01-27T09:01:02+00:00"},
+            "__LockTimeToLive": {"N": "1706346362"},
+        }
+
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    # Assert
+    lock_item = await localstack_dynamodb_client.get_item(TableName=dynamodb_lock_table_name, Key=key)
+    assert lock_item["Item"] == {**key, "__LockTimeToLive": {"N": "1706346362"}}
+
+    async with dynamodb_pessimistic_lock(key):
+        pass
+
+
+@pytest.mark.asyncio()
+async def test_should_enable_time_to_live_on_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_lock_table_name: str
+) -> None:
+    response = await localstack_dynamodb_client.describe_time_to_live(TableName=dynamodb_lock_table_name)
+
+    assert response["TimeToLiveDescription"]["TimeToLiveStatus"] == "ENABLED"
+    assert response["TimeToLiveDescription"]["AttributeName"] == "__LockTimeToLive"
+
+
+def test_fencing_tokens_should_not_be_issued_from_dedicated_lock_table_with_time_to_live() -> None:
+    with pytest.raises(
+        ValueError, match="fencing_token_attribute can't be used with a lock_timeout in a dedicated lock table"
+    ):
+        DynamoDBPessimisticLock(
+            mock.Mock(),
+            "table-name",
+            lock_timeout=datetime.timedelta(minutes=5),
+            fencing_token_attribute="__FencingToken",
+            lock_table_name="lock-table-name",
+        )
+
+
+@pytest.mark.asyncio()
+async def test_should_return_locked_item_from_data_table_when_using_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, dynamodb_lock_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        fencing_token_attribute="__FencingToken",
+        lock_table_name=dynamodb_lock_table_name,
+    )
+
+    async with dynamodb_pessimistic_lock(key, return_item=True) as lease:
+        assert lease.fencing_token == 1
+        assert lease.item == {
+            **key,
+            "Id": {"S": "123456"},
+            "Name": {"S": "Test Name"},
+        }
+
+
+@pytest.mark.asyncio()
+async def test_should_not_lock_not_existing_item_when_returning_item_from_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, dynamodb_lock_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, lock_table_name=dynamodb_lock_table_name
+    )
+
+    with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key, return_item=True):
+            pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    lock_item = await localstack_dynamodb_client.get_item(TableName=dynamodb_lock_table_name, Key=key)
+    assert "__LockedAt" not in lock_item["Item"]
+
+
+@pytest.mark.asyncio()
+async def test_should_commit_update_and_release_lock_from_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+    dynamodb_lock_table_name: str,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        fencing_token_attribute="__FencingToken",
+        lock_table_name=dynamodb_lock_table_name,
+    )
+
+    # Act
+    async with dynamodb_pessimistic_lock(key) as lease:
+        await dynamodb_pessimistic_lock.commit(
+            lease,
+            {
+                "UpdateExpression": "SET #Name = :Name",
+                "ExpressionAttributeNames": {"#Name": "Name"},
+                "ExpressionAttributeValues": {":Name": {"S": "New Name"}},
+                "ConditionExpression": "attribute_exists(Id)",
+            },
+        )
+
+    # Assert
+    assert lease.released is True
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"] == {
+        **key,
+        "Id": {"S": "123456"},
+        "Name": {"S": "New Name"},
+    }
+    lock_item = await localstack_dynamodb_client.get_item(TableName=dynamodb_lock_table_name, Key=key)
+    assert lock_item["Item"] == {**key, "__FencingToken": {"N": "1"}}
+
+
+@pytest.mark.asyncio()
+async def test_should_not_commit_update_when_lock_taken_over_in_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient,
+    dynamodb_table_name: str,
+    dynamodb_lock_table_name: str,
+    mocker: MockerFixture,
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=datetime.timedelta(hours=2),
+        lock_table_name=dynamodb_lock_table_name,
+    )
+
+    # Act
+    mock_time_now(mocker, "2024-01-27T09:00:00+00:00")
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            mock_time_now(mocker, "2024-01-27T11:00:01+00:00")
+            async with dynamodb_pessimistic_lock(key):
+                await dynamodb_pessimistic_lock.commit(
+                    lease,
+                    {
+                        "UpdateExpression": "SET #Name = :Name",
+                        "ExpressionAttributeNames": {"#Name": "Name"},
+                        "ExpressionAttributeValues": {":Name": {"S": "New Name"}},
+                    },
+                )
+
+    # Assert
+    assert lease.lost is True
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"]["Name"] == {"S": "Test Name"}
+
+
+@pytest.mark.asyncio()
+async def test_should_keep_lock_held_when_commit_condition_fails_in_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, dynamodb_lock_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, lock_table_name=dynamodb_lock_table_name
+    )
+
+    # Act
+    with pytest.raises(PessimisticLockCommitConditionFailedError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            await dynamodb_pessimistic_lock.commit(
+                lease,
+                {
+                    "UpdateExpression": "SET #Name = :Name",
+                    "ExpressionAttributeNames": {"#Name": "Name"},
+                    "ExpressionAttributeValues": {":Name": {"S": "New Name"}, ":Expected": {"S": "Other Name"}},
+                    "ConditionExpression": "#Name = :Expected",
+                },
+            )
+
+    # Assert
+    assert lease.lost is False
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"]["Name"] == {"S": "Test Name"}
+    lock_item = await localstack_dynamodb_client.get_item(TableName=dynamodb_lock_table_name, Key=key)
+    assert lock_item["Item"] == key
+
+
+@pytest.mark.asyncio()
+async def test_should_not_commit_update_when_item_deleted_while_locked_in_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, dynamodb_lock_table_name: str
+) -> None:
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, lock_table_name=dynamodb_lock_table_name
+    )
+
+    with pytest.raises(PessimisticLockItemNotFoundError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            await localstack_dynamodb_client.delete_item(TableName=dynamodb_table_name, Key=key)
+            await dynamodb_pessimistic_lock.commit(
+                lease,
+                {
+                    "UpdateExpression": "SET #Name = :Name",
+                    "ExpressionAttributeNames": {"#Name": "Name"},
+                    "ExpressionAttributeValues": {":Name": {"S": "New Name"}},
+                },
+            )
+
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item.get("Item") is None
+
+
+@pytest.mark.asyncio()
+async def test_should_record_lock_metrics(localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, metrics=metrics
+    )
+
+    # Act
+    async with dynamodb_pessimistic_lock(key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock(key):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    # Assert
+    assert metrics.acquire_latency.count == 1
+    assert metrics.hold_duration.count == 1
+    assert metrics.acquisition_failures == 1
+    assert metrics.lost == 0
+    assert metrics.contention == collections.Counter({"ITEM": 1})
+
+
+@pytest.mark.asyncio()
+async def test_should_record_lost_lock_in_metrics(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, lock_timeout=datetime.timedelta(hours=2), metrics=metrics
+    )
+
+    # Act
+    mock_time_now(mocker, "2024-01-27T09:00:00+00:00")
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            mock_time_now(mocker, "2024-01-27T11:00:01+00:00")
+            async with dynamodb_pessimistic_lock(key):
+                await dynamodb_pessimistic_lock.commit(
+                    lease,
+                    {
+                        "UpdateExpression": "SET #Name = :Name",
+                        "ExpressionAttributeNames": {"#Name": "Name"},
+                        "ExpressionAttributeValues": {":Name": {"S": "New Name"}},
+                    },
+                )
+
+    # Assert
+    assert metrics.acquire_latency.count == 2
+    assert metrics.hold_duration.count == 2
+    assert metrics.lost == 1
+    assert metrics.stolen_locks == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_record_lock_abandoned_by_crashed_holder_as_stolen(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=datetime.timedelta(hours=2),
+        fencing_token_attribute="__FencingToken",
+        metrics=metrics,
+    )
+    # Holder crashed without releasing the lock
+    await localstack_dynamodb_client.update_item(
+        TableName=dynamodb_table_name,
+        Key=key,
+        UpdateExpression="SET #LockedAt = :LockedAt, #FencingToken = :FencingToken",
+        ExpressionAttributeNames={"#LockedAt": "__LockedAt", "#FencingToken": "__FencingToken"},
+        ExpressionAttributeValues={":LockedAt": {"S": "2024-01-27T09:00:00+00:00"}, ":FencingToken": {"N": "7"}},
+    )
+
+    # Act
+    mock_time_now(mocker, "2024-01-27T11:00:01+00:00")
+    async with dynamodb_pessimistic_lock(key, return_item=True) as lease:
+        # Assert
+        assert lease.fencing_token == 8
+        assert lease.item == {
+            **key,
+            "Id": {"S": "123456"},
+            "Name": {"S": "Test Name"},
+            "__LockedAt": {"S": "2024-01-27T11:00:01+00:00"},
+            "__FencingToken": {"N": "8"},
+        }
+    async with dynamodb_pessimistic_lock.shared(key):
+        pass
+
+    # Assert
+    assert metrics.stolen_locks == 1
+    mock_time_now(mocker, "2024-01-27T13:00:02+00:00")
+    await localstack_dynamodb_client.update_item(
+        TableName=dynamodb_table_name,
+        Key=key,
+        UpdateExpression="SET #LockedAt = :LockedAt",
+        ExpressionAttributeNames={"#LockedAt": "__LockedAt"},
+        ExpressionAttributeValues={":LockedAt": {"S": "2024-01-27T11:00:01+00:00"}},
+    )
+    async with dynamodb_pessimistic_lock.shared(key):
+        pass
+    assert metrics.stolen_locks == 2
+
+
+@pytest.mark.asyncio()
+async def test_should_record_contention_only_for_locks_held_by_others_when_acquiring_many(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    held_key = generate_dynamodb_item_key()
+    free_key: dict = {"PK": {"S": f"OTHER#{uuid.uuid4()}"}, "SK": {"S": "OTHER"}}
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, held_key)
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, free_key)
+    metrics = InMemoryPessimisticLockMetrics()
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client, dynamodb_table_name, metrics=metrics
+    )
+
+    # Act
+    async with dynamodb_pessimistic_lock(held_key):
+        with pytest.raises(PessimisticLockAcquisitionError):  # noqa: PT012
+            async with dynamodb_pessimistic_lock.acquire_many([held_key, free_key]):
+                pytest.fail(reason="Executed code without acquiring lock")  # pragma: no cover
+
+    # Assert
+    assert metrics.contention == collections.Counter({"ITEM": 1})
+
+
+def test_histogram_should_count_observations_in_buckets() -> None:
+    histogram = Histogram(buckets=(0.01, 0.1, float("inf")))
+
+    histogram.observe(0.005)
+    histogram.observe(0.01)
+    histogram.observe(0.05)
+    histogram.observe(3.0)
+
+    assert histogram.counts == collections.Counter({0.01: 2, 0.1: 1, float("inf"): 1})
+    assert histogram.count == 4
+    assert histogram.total == pytest.approx(3.065)
+
+
+@pytest.mark.asyncio()
+async def test_should_write_fenced_update_without_releasing_lock_in_dedicated_lock_table(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, dynamodb_lock_table_name: str
+) -> None:
+    # Arrange
+    key = generate_dynamodb_item_key()
+    await create_dynamodb_item(localstack_dynamodb_client, dynamodb_table_name, key)
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        fencing_token_attribute="__FencingToken",
+        lock_table_name=dynamodb_lock_table_name,
+    )
+    update: CommitUpdate = {
+        "UpdateExpression": "SET #Name = :Name",
+        "ExpressionAttributeNames": {"#Name": "Name"},
+        "ExpressionAttributeValues": {":Name": {"S": "New Name"}},
+    }
+
+    # Act
+    with pytest.raises(PessimisticLockLostError):  # noqa: PT012
+        async with dynamodb_pessimistic_lock(key) as lease:
+            await dynamodb_pessimistic_lock.fenced_update(lease, update)
+            assert lease.held is True
+            await localstack_dynamodb_client.update_item(
+                TableName=dynamodb_lock_table_name,
+                Key=key,
+                UpdateExpression="ADD #FencingToken :One",
+                ExpressionAttributeNames={"#FencingToken": "__FencingToken"},
+                ExpressionAttributeValues={":One": {"N": "1"}},
+            )
+            await dynamodb_pessimistic_lock.fenced_update(
+                lease, {**update, "ExpressionAttributeValues": {":Name": {"S": "Stale Name"}}}
+            )
+
+    # Assert
+    assert lease.lost is True
+    item = await localstack_dynamodb_client.get_item(TableName=dynamodb_table_name, Key=key)
+    assert item["Item"]["Name"] == {"S": "New Name"}
+
+
+@pytest.mark.asyncio()
+async def test_fenced_updates_should_require_fencing_tokens(localstack_dynamodb_client: DynamoDBClient) -> None:
+    dynamodb_pessimistic_lock = DynamoDBPessimisticLock(localstack_dynamodb_client, "table-name")
+    lease = PessimisticLockLease(key=generate_dynamodb_item_key(), locked_at="2024-01-27T09:00:00+00:00")
+
+    with pytest.raises(ValueError, match="Fenced updates require a fencing_token_attribute"):
+        await dynamodb_pessimistic_lock.fenced_update(lease, {"UpdateExpression": "SET #Name = :Name"})
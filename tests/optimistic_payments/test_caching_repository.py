@@ -0,0 +1,126 @@
+import datetime
+
+import pytest
+from pytest_mock import MockerFixture
+from types_aiobotocore_dynamodb import DynamoDBClient
+
+from optimistic_payments.domain import PaymentIntent, PaymentIntentState, PaymentIntentStateError
+from optimistic_payments.repository import (
+    CachingPaymentIntentRepository,
+    DynamoDBPaymentIntentRepository,
+    OptimisticLockError,
+)
+
+
+@pytest.mark.asyncio()
+async def test_should_serve_reads_from_cache(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    caching_repo = CachingPaymentIntentRepository(repo)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await caching_repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    cached_payment_intent = await caching_repo.get(payment_intent.id)
+    cached_payment_intent.change_amount(200)
+
+    assert await caching_repo.get(payment_intent.id) == payment_intent  # Changes to a returned aggregate aren't cached
+    assert await caching_repo.get_many([payment_intent.id]) == {payment_intent.id: payment_intent}
+    assert get_item.call_count == 0
+    assert await caching_repo.get(payment_intent.id, consistent_read=True) == payment_intent
+    assert get_item.call_count == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_not_serve_reads_from_cache_for_consistent_read_repository(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    caching_repo = CachingPaymentIntentRepository(
+        DynamoDBPaymentIntentRepository(localstack_dynamodb_client, dynamodb_table_name, consistent_read=True)
+    )
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await caching_repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+    batch_get_item = mocker.spy(localstack_dynamodb_client, "batch_get_item")
+
+    assert await caching_repo.get(payment_intent.id) == payment_intent
+    assert await caching_repo.get_many([payment_intent.id]) == {payment_intent.id: payment_intent}
+    assert get_item.call_count == 1
+    assert get_item.call_args.kwargs["ConsistentRead"] is True
+    assert batch_get_item.call_count == 1
+    assert await caching_repo.get(payment_intent.id, consistent_read=False) == payment_intent
+    assert get_item.call_count == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_replace_stale_payment_intent_with_current_version_on_conflict(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    caching_repo = CachingPaymentIntentRepository(repo)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await caching_repo.create(payment_intent)
+    payment_intent.change_amount(200)
+    await repo.update(payment_intent)  # Updated by another process, so the cached payment intent is stale
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    stale_payment_intent = await caching_repo.get(payment_intent.id)
+    assert stale_payment_intent.version == 0
+    stale_payment_intent.change_amount(300)
+    with pytest.raises(OptimisticLockError):
+        await caching_repo.update(stale_payment_intent)
+
+    assert await caching_repo.get(payment_intent.id) == payment_intent
+    assert get_item.call_count == 0
+
+
+@pytest.mark.asyncio()
+async def test_should_cache_only_terminal_payment_intents_after_ttl(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    caching_repo = CachingPaymentIntentRepository(repo, ttl=datetime.timedelta(0))
+    created_payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await caching_repo.create(created_payment_intent)
+    charged_payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await caching_repo.create(charged_payment_intent)
+    charged_payment_intent.request_charge()
+    charged_payment_intent.handle_charge_response("ch_123456", None, None)
+    await caching_repo.update(charged_payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    assert (await caching_repo.get(charged_payment_intent.id)).state == PaymentIntentState.CHARGED
+    assert get_item.call_count == 0
+    assert await caching_repo.get(created_payment_intent.id) == created_payment_intent
+    assert get_item.call_count == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_evict_least_recently_used_payment_intent(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    caching_repo = CachingPaymentIntentRepository(repo, max_size=2)
+    payment_intents = [PaymentIntent.create("cust_123456", 100, "USD") for _ in range(3)]
+    for payment_intent in payment_intents:
+        await caching_repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    await caching_repo.get(payment_intents[2].id)
+    await caching_repo.get(payment_intents[1].id)
+    assert get_item.call_count == 0
+    await caching_repo.get(payment_intents[0].id)
+    assert get_item.call_count == 1
+
+
+@pytest.mark.asyncio()
+async def test_should_invalidate_payment_intent_when_change_amount_fails(
+    repo: DynamoDBPaymentIntentRepository,
+) -> None:
+    caching_repo = CachingPaymentIntentRepository(repo)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await caching_repo.create(payment_intent)
+    payment_intent.request_charge()
+    await repo.update(payment_intent)  # Updated by another process, so the cached payment intent is stale
+
+    with pytest.raises(PaymentIntentStateError):
+        await caching_repo.change_amount(payment_intent.id, 200)
+
+    assert (await caching_repo.get(payment_intent.id)).state == PaymentIntentState.CHARGE_REQUESTED
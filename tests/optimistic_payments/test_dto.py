@@ -0,0 +1,56 @@
+import boto3.dynamodb.types
+import pytest
+
+from optimistic_payments.domain import Charge, PaymentIntent, PaymentIntentState
+from optimistic_payments.events import PaymentIntentChargeRequested
+from optimistic_payments.repository.dynamodb import PaymentIntentDTO, PaymentIntentEventDTO
+
+
+def create_payment_intent_dto(charge: Charge | None) -> PaymentIntentDTO:
+    payment_intent = PaymentIntent(
+        id="pi_123456",
+        state=PaymentIntentState.CHARGE_REQUESTED,
+        customer_id="cust_123456",
+        amount=100,
+        currency="USD",
+        charge=charge,
+        events=[PaymentIntentChargeRequested(payment_intent_id="pi_123456", amount=100, currency="USD")],
+        version=3,
+    )
+    return PaymentIntentDTO.from_entity(payment_intent)
+
+
+@pytest.mark.parametrize("charge", [None, Charge(id="ch_123456", error_code=None, error_message=None)])
+def test_encoded_item_is_the_same_as_boto3_serialized_item(charge: Charge | None) -> None:
+    dto = create_payment_intent_dto(charge)
+    serializer = boto3.dynamodb.types.TypeSerializer()
+
+    assert dto.to_dynamodb_item() == {k: serializer.serialize(v) for k, v in dto.model_dump().items()}
+
+
+@pytest.mark.parametrize("validate", [True, False])
+@pytest.mark.parametrize("charge", [None, Charge(id="ch_123456", error_code=None, error_message=None)])
+def test_decode_encoded_item(charge: Charge | None, validate: bool) -> None:
+    dto = create_payment_intent_dto(charge)
+
+    decoded_dto = PaymentIntentDTO.from_dynamodb_item(dto.to_dynamodb_item(), validate=validate)
+
+    assert decoded_dto == dto
+    assert decoded_dto.State is PaymentIntentState.CHARGE_REQUESTED
+    assert isinstance(decoded_dto.Events[0], PaymentIntentEventDTO)
+
+
+def test_ignores_attributes_not_in_dto() -> None:
+    dto = create_payment_intent_dto(None)
+
+    decoded_dto = PaymentIntentDTO.from_dynamodb_item({**dto.to_dynamodb_item(), "__LockedAt": {"S": "2024-01-01"}})
+
+    assert decoded_dto == dto
+
+
+def test_validates_item() -> None:
+    item = create_payment_intent_dto(None).to_dynamodb_item()
+    item["State"] = {"S": "UNKNOWN"}
+
+    with pytest.raises(ValueError, match="State"):
+        PaymentIntentDTO.from_dynamodb_item(item)
@@ -1,12 +1,23 @@
+import asyncio
+import datetime
 import json
+from typing import cast
 
 import pytest
 from botocore.exceptions import ClientError
+from pytest_mock import MockerFixture
+from types_aiobotocore_dynamodb import DynamoDBClient
 
+from adapters.dynamodb import DynamoDBGroupCommitWriter
+from adapters.retry import RetryPolicy
 from optimistic_payments.domain import Charge, PaymentIntent, PaymentIntentNotFoundError, PaymentIntentState
 from optimistic_payments.events import PaymentIntentChargeRequested
-from optimistic_payments.repository import DynamoDBPaymentIntentRepository, OptimisticLockError
-from optimistic_payments.repository.dynamodb import PaymentIntentEventDTO
+from optimistic_payments.repository import (
+    DynamoDBPaymentIntentRepository,
+    OptimisticLockError,
+    PaymentIntentBatchGetError,
+)
+from optimistic_payments.repository.dynamodb import PaymentIntentDTO, PaymentIntentEventDTO
 
 
 @pytest.mark.asyncio()
@@ -75,8 +86,9 @@ async def test_should_raise_on_not_existing_payment_intent_update_and_not_create
         version=0,
     )
 
-    with pytest.raises(OptimisticLockError, match=payment_intent.id):
+    with pytest.raises(OptimisticLockError, match=payment_intent.id) as exc_info:
         await repo.update(payment_intent)
+    assert exc_info.value.current_payment_intent is None
 
     with pytest.raises(PaymentIntentNotFoundError, match=payment_intent.id):
         await repo.get(payment_intent.id)
@@ -144,6 +156,7 @@ async def test_optimistic_lock_handles_concurrent_payment_intent_updates(repo: D
     await repo.create(payment_intent)
 
     # Act
+    payment_intent.change_amount(200)
     await repo.update(payment_intent)  # Increments version in DynamoDB
 
     payment_intent = PaymentIntent(
@@ -156,15 +169,16 @@ async def test_optimistic_lock_handles_concurrent_payment_intent_updates(repo: D
         events=[],
         version=0,
     )
-    with pytest.raises(OptimisticLockError, match=payment_intent.id):
+    with pytest.raises(OptimisticLockError, match=payment_intent.id) as exc_info:
         await repo.update(payment_intent)
 
     # Assert
+    assert exc_info.value.current_payment_intent == await repo.get(payment_intent.id)
     assert await repo.get(payment_intent.id) == PaymentIntent(
         id="pi_123456",
         state=PaymentIntentState.CREATED,  # Not updated
         customer_id="cust_123456",
-        amount=100,  # Not updated
+        amount=200,  # Updated by the first update
         currency="USD",
         charge=None,
         events=[],
@@ -252,6 +266,24 @@ async def test_publish_payment_intent_events(repo: DynamoDBPaymentIntentReposito
     )
 
 
+@pytest.mark.asyncio()
+async def test_update_same_payment_intent_multiple_times(repo: DynamoDBPaymentIntentRepository) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+
+    payment_intent.request_charge()
+    await repo.update(payment_intent)
+
+    assert payment_intent.version == 1
+    assert payment_intent.events == []
+
+    payment_intent.handle_charge_response("ch_123456", None, None)
+    await repo.update(payment_intent)
+
+    assert payment_intent.version == 2
+    assert await repo.get(payment_intent.id) == payment_intent
+
+
 @pytest.mark.asyncio()
 async def test_should_raise_on_already_existing_event_id(repo: DynamoDBPaymentIntentRepository) -> None:
     payment_intent = PaymentIntent(
@@ -305,3 +337,268 @@ async def test_should_raise_on_already_existing_event_id(repo: DynamoDBPaymentIn
 
     with pytest.raises(ClientError):
         await repo.update(payment_intent)
+
+
+@pytest.mark.asyncio()
+async def test_get_many_payment_intents(repo: DynamoDBPaymentIntentRepository) -> None:
+    payment_intents = [PaymentIntent.create("cust_123456", amount, "USD") for amount in range(150)]
+    await asyncio.gather(*[repo.create(payment_intent) for payment_intent in payment_intents])
+
+    result = await repo.get_many([payment_intent.id for payment_intent in payment_intents] + ["pi_123456"])
+
+    assert result == {payment_intent.id: payment_intent for payment_intent in payment_intents}
+
+
+@pytest.mark.asyncio()
+async def test_get_many_retries_unprocessed_keys(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        batch_get_retry_policy=RetryPolicy(
+            wait_timeout=datetime.timedelta(seconds=5), base_delay=datetime.timedelta(0)
+        ),
+    )
+    payment_intents = [PaymentIntent.create("cust_123456", amount, "USD") for amount in range(3)]
+    await asyncio.gather(*[repo.create(payment_intent) for payment_intent in payment_intents])
+    batch_get_item = localstack_dynamodb_client.batch_get_item
+
+    async def process_one_key_per_request(RequestItems: dict) -> dict:
+        keys = RequestItems[dynamodb_table_name]["Keys"]
+        response = await batch_get_item(RequestItems={dynamodb_table_name: {"Keys": keys[:1]}})
+        if keys[1:]:
+            response["UnprocessedKeys"] = {dynamodb_table_name: {"Keys": keys[1:]}}
+        return cast(dict, response)
+
+    batch_get_item_mock = mocker.patch.object(
+        localstack_dynamodb_client, "batch_get_item", side_effect=process_one_key_per_request
+    )
+
+    result = await repo.get_many([payment_intent.id for payment_intent in payment_intents])
+
+    assert result == {payment_intent.id: payment_intent for payment_intent in payment_intents}
+    assert batch_get_item_mock.call_count == 3
+
+
+@pytest.mark.asyncio()
+async def test_get_many_raises_when_unprocessed_keys_retries_are_exhausted(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(
+        localstack_dynamodb_client, dynamodb_table_name, batch_get_retry_policy=RetryPolicy(max_attempts=1)
+    )
+    mocker.patch.object(
+        localstack_dynamodb_client,
+        "batch_get_item",
+        return_value={
+            "Responses": {},
+            "UnprocessedKeys": {dynamodb_table_name: {"Keys": [PaymentIntentDTO.key("pi_123456")]}},
+        },
+    )
+
+    with pytest.raises(PaymentIntentBatchGetError):
+        await repo.get_many(["pi_123456"])
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_gets_are_coalesced_into_single_batch_request(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(localstack_dynamodb_client, dynamodb_table_name, coalesce_gets=True)
+    payment_intents = [PaymentIntent.create("cust_123456", amount, "USD") for amount in range(3)]
+    await asyncio.gather(*[repo.create(payment_intent) for payment_intent in payment_intents])
+    batch_get_item_spy = mocker.spy(localstack_dynamodb_client, "batch_get_item")
+
+    results = await asyncio.gather(
+        *[repo.get(payment_intent.id) for payment_intent in payment_intents],
+        repo.get(payment_intents[0].id),
+        repo.get("pi_123456"),
+        return_exceptions=True,
+    )
+
+    assert results[:4] == [*payment_intents, payment_intents[0]]
+    assert results[0] is not results[3]  # Callers of the same id don't share a mutable aggregate
+    assert isinstance(results[4], PaymentIntentNotFoundError)
+    assert batch_get_item_spy.call_count == 1
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_creates_are_group_committed(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        group_commit=DynamoDBGroupCommitWriter(localstack_dynamodb_client),
+    )
+    existing_payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(existing_payment_intent)
+    payment_intents = [PaymentIntent.create("cust_123456", 100, "USD") for _ in range(5)]
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    results = await asyncio.gather(
+        *[repo.create(payment_intent) for payment_intent in [*payment_intents, existing_payment_intent]],
+        return_exceptions=True,
+    )
+
+    assert results[:5] == [None] * 5
+    assert isinstance(results[5], ClientError)
+    assert transact_write_items.call_count == 2  # Retried without the item that already exists
+    for payment_intent in payment_intents:
+        assert await repo.get(payment_intent.id) == payment_intent
+
+
+@pytest.mark.asyncio()
+async def test_update_writes_only_changed_attributes(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    payment_intent = await repo.get(payment_intent.id)
+    update_item = mocker.spy(localstack_dynamodb_client, "update_item")
+
+    await repo.update(payment_intent)
+    assert update_item.call_count == 0  # Nothing changed
+
+    payment_intent.change_amount(200)
+    await repo.update(payment_intent)
+
+    assert update_item.call_args.kwargs["UpdateExpression"] == "SET #Amount = :Amount, #Version = :NewVersion"
+    assert await repo.get(payment_intent.id) == payment_intent
+
+
+@pytest.mark.asyncio()
+async def test_change_amount_with_single_write(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+    update_item = mocker.spy(localstack_dynamodb_client, "update_item")
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    changed_payment_intent = await repo.change_amount(payment_intent.id, 200)
+
+    assert changed_payment_intent.amount == 200
+    assert changed_payment_intent.version == 1
+    assert get_item.call_count == 0
+    assert update_item.call_count == 1
+    assert transact_write_items.call_count == 0
+
+
+@pytest.mark.asyncio()
+async def test_update_without_events_does_not_use_transaction(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    stale_payment_intent = await repo.get(payment_intent.id)
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    payment_intent.change_amount(200)
+    await repo.update(payment_intent)
+    stale_payment_intent.change_amount(300)
+    with pytest.raises(OptimisticLockError) as exc_info:
+        await repo.update(stale_payment_intent)
+
+    assert transact_write_items.call_count == 0
+    assert exc_info.value.current_payment_intent == payment_intent
+
+
+@pytest.mark.asyncio()
+async def test_update_rejects_events_exceeding_transaction_limit(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    events = [
+        PaymentIntentChargeRequested(id=f"evt_{i}", payment_intent_id=payment_intent.id, amount=100, currency="USD")
+        for i in range(100)
+    ]
+    payment_intent.events.extend(events)
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    with pytest.raises(ValueError, match="Cannot commit more than 99 events with a single payment intent update"):
+        await repo.update(payment_intent)
+
+    assert transact_write_items.call_count == 0
+    assert payment_intent.version == 0
+    assert await repo.get_event(payment_intent.id, events[0].id) is None
+
+    del payment_intent.events[99:]
+    await repo.update(payment_intent)
+
+    assert payment_intent.version == 1
+    for event in events[:99]:
+        assert await repo.get_event(payment_intent.id, event.id)
+
+
+@pytest.mark.parametrize("consistent_read", [False, True])
+@pytest.mark.asyncio()
+async def test_get_with_configured_read_consistency(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture, consistent_read: bool
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(
+        localstack_dynamodb_client, dynamodb_table_name, consistent_read=consistent_read
+    )
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+    batch_get_item = mocker.spy(localstack_dynamodb_client, "batch_get_item")
+
+    assert await repo.get(payment_intent.id) == payment_intent
+    assert await repo.get(payment_intent.id, consistent_read=not consistent_read) == payment_intent
+    assert await repo.get_many([payment_intent.id]) == {payment_intent.id: payment_intent}
+
+    assert [call.kwargs["ConsistentRead"] for call in get_item.call_args_list] == [consistent_read, not consistent_read]
+    assert batch_get_item.call_args.kwargs["RequestItems"][dynamodb_table_name]["ConsistentRead"] is consistent_read
+
+
+@pytest.mark.asyncio()
+async def test_coalesced_gets_are_batched_by_read_consistency(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(localstack_dynamodb_client, dynamodb_table_name, coalesce_gets=True)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    batch_get_item = mocker.spy(localstack_dynamodb_client, "batch_get_item")
+
+    await asyncio.gather(repo.get(payment_intent.id), repo.get(payment_intent.id, consistent_read=True))
+
+    assert sorted(
+        call.kwargs["RequestItems"][dynamodb_table_name]["ConsistentRead"] for call in batch_get_item.call_args_list
+    ) == [False, True]
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_gets_of_same_payment_intent_share_single_read(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(localstack_dynamodb_client, dynamodb_table_name, singleflight_gets=True)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    payment_intents = await asyncio.gather(*[repo.get(payment_intent.id) for _ in range(10)])
+
+    assert get_item.call_count == 1
+    assert all(p == payment_intent for p in payment_intents)
+    assert len({id(p) for p in payment_intents}) == 10  # Every caller gets its own aggregate
+    with pytest.raises(PaymentIntentNotFoundError):
+        await asyncio.gather(repo.get("pi_123456"), repo.get("pi_123456"))
+    assert get_item.call_count == 2
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_consistent_gets_are_not_shared(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(localstack_dynamodb_client, dynamodb_table_name, singleflight_gets=True)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    await asyncio.gather(*[repo.get(payment_intent.id, consistent_read=True) for _ in range(3)])
+
+    assert get_item.call_count == 3
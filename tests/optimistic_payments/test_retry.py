@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+from adapters.retry import RetryPolicy
+from optimistic_payments.repository import OptimisticLockError
+from optimistic_payments.retry import InMemoryOptimisticLockRetryMetrics, OptimisticLockRetry, RetryBudget
+
+RETRY_POLICY = RetryPolicy(
+    wait_timeout=datetime.timedelta(seconds=1), max_attempts=3, base_delay=datetime.timedelta(milliseconds=1)
+)
+
+
+class ConflictingOperation:
+    def __init__(self, conflicts: int) -> None:
+        self.conflicts = conflicts
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        if self.calls <= self.conflicts:
+            raise OptimisticLockError("pi_123456")
+        return "result"
+
+
+@pytest.mark.asyncio()
+async def test_should_retry_operation_on_optimistic_lock_error() -> None:
+    metrics = InMemoryOptimisticLockRetryMetrics()
+    retry = OptimisticLockRetry(RETRY_POLICY, metrics=metrics)
+    operation = ConflictingOperation(conflicts=2)
+
+    assert await retry.run("use_case", operation) == "result"
+
+    assert operation.calls == 3
+    assert metrics.conflicts == {"use_case": 2}
+    assert metrics.retries == {"use_case": 2}
+    assert not metrics.exhausted_retries
+    assert metrics.conflict_rate("use_case") == pytest.approx(2 / 3)
+
+
+@pytest.mark.asyncio()
+async def test_should_raise_when_max_attempts_exhausted() -> None:
+    metrics = InMemoryOptimisticLockRetryMetrics()
+    retry = OptimisticLockRetry(RETRY_POLICY, metrics=metrics)
+    operation = ConflictingOperation(conflicts=3)
+
+    with pytest.raises(OptimisticLockError, match="pi_123456"):
+        await retry.run("use_case", operation)
+
+    assert operation.calls == 3
+    assert metrics.conflicts == {"use_case": 3}
+    assert metrics.exhausted_retries == {"use_case": 1}
+
+
+@pytest.mark.asyncio()
+async def test_should_not_retry_when_retry_budget_exhausted() -> None:
+    metrics = InMemoryOptimisticLockRetryMetrics()
+    budget = RetryBudget(max_tokens=1, token_ratio=0.5)
+    retry = OptimisticLockRetry(RETRY_POLICY, budget=budget, metrics=metrics)
+
+    assert await retry.run("use_case", ConflictingOperation(conflicts=1)) == "result"
+    assert budget.tokens == 0.5
+
+    with pytest.raises(OptimisticLockError):
+        await retry.run("use_case", ConflictingOperation(conflicts=1))
+
+    assert metrics.exhausted_budget == {"use_case": 1}
+
+
+@pytest.mark.asyncio()
+async def test_should_not_retry_other_errors() -> None:
+    retry = OptimisticLockRetry(RETRY_POLICY)
+    calls = 0
+
+    async def operation() -> None:
+        nonlocal calls
+        calls += 1
+        raise ValueError("Error")
+
+    with pytest.raises(ValueError, match="Error"):
+        await retry.run("use_case", operation)
+
+    assert calls == 1
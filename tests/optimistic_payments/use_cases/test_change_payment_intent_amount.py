@@ -1,7 +1,13 @@
+import asyncio
+import datetime
+
 import pytest
+from pytest_mock import MockerFixture
 
+from adapters.retry import RetryPolicy
 from optimistic_payments.domain import PaymentIntentNotFoundError, PaymentIntentStateError
 from optimistic_payments.repository import PaymentIntentRepository
+from optimistic_payments.retry import InMemoryOptimisticLockRetryMetrics, OptimisticLockRetry
 from optimistic_payments.use_cases import (
     change_payment_intent_amount,
     create_payment_intent,
@@ -10,29 +16,55 @@ from optimistic_payments.use_cases import (
 )
 
 
+@pytest.mark.parametrize("read_free", [False, True])
 @pytest.mark.asyncio()
-async def test_change_not_existing_payment_intent_amount(repo: PaymentIntentRepository) -> None:
+async def test_change_not_existing_payment_intent_amount(repo: PaymentIntentRepository, read_free: bool) -> None:
     with pytest.raises(PaymentIntentNotFoundError, match="pi_123456"):
-        await change_payment_intent_amount("pi_123456", 200, repo)
+        await change_payment_intent_amount("pi_123456", 200, repo, read_free=read_free)
 
 
+@pytest.mark.parametrize("read_free", [False, True])
 @pytest.mark.asyncio()
-async def test_change_created_payment_intent_amount(repo: PaymentIntentRepository) -> None:
+async def test_change_created_payment_intent_amount(repo: PaymentIntentRepository, read_free: bool) -> None:
     payment_intent = await create_payment_intent("cust_123456", 100, "USD", repo)
 
-    await change_payment_intent_amount(payment_intent.id, 200, repo)
+    changed_payment_intent = await change_payment_intent_amount(payment_intent.id, 200, repo, read_free=read_free)
 
-    assert (await get_payment_intent(payment_intent.id, repo)).amount == 200
+    assert changed_payment_intent.amount == 200
+    assert changed_payment_intent.version == 1
+    assert await get_payment_intent(payment_intent.id, repo) == changed_payment_intent
 
 
+@pytest.mark.parametrize("read_free", [False, True])
 @pytest.mark.asyncio()
 async def test_cannot_change_payment_intent_amount_when_payment_intent_is_not_in_created_state(
-    repo: PaymentIntentRepository,
+    repo: PaymentIntentRepository, read_free: bool
 ) -> None:
     payment_intent = await create_payment_intent("cust_123456", 100, "USD", repo)
     await request_payment_request_charge(payment_intent.id, repo)
 
     with pytest.raises(PaymentIntentStateError, match="Cannot change PaymentIntent amount in state: CHARGE_REQUESTED"):
-        await change_payment_intent_amount(payment_intent.id, 200, repo)
+        await change_payment_intent_amount(payment_intent.id, 200, repo, read_free=read_free)
 
     assert (await get_payment_intent(payment_intent.id, repo)).amount == 100
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_payment_intent_amount_changes_are_retried(
+    repo: PaymentIntentRepository, mocker: MockerFixture
+) -> None:
+    payment_intent = await create_payment_intent("cust_123456", 100, "USD", repo)
+    get = mocker.spy(repo, "get")
+    metrics = InMemoryOptimisticLockRetryMetrics()
+    retry = OptimisticLockRetry(
+        RetryPolicy(wait_timeout=datetime.timedelta(seconds=5), max_attempts=10), metrics=metrics
+    )
+
+    await asyncio.gather(
+        *[change_payment_intent_amount(payment_intent.id, amount, repo, retry=retry) for amount in range(200, 205)]
+    )
+
+    assert (await get_payment_intent(payment_intent.id, repo)).amount in range(200, 205)
+    assert metrics.conflicts["change_payment_intent_amount"] > 0
+    assert metrics.retries["change_payment_intent_amount"] == metrics.conflicts["change_payment_intent_amount"]
+    assert get.call_count == 6  # Retries reapply the change to the item returned by the conflicting write
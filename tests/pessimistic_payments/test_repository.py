@@ -1,6 +1,13 @@
+import asyncio
+import datetime
+
 import pytest
 from botocore.exceptions import ClientError
+from pytest_mock import MockerFixture
+from types_aiobotocore_dynamodb import DynamoDBClient
 
+from adapters.dynamodb import DynamoDBGroupCommitWriter
+from database_locks import DynamoDBPessimisticLock, PessimisticLockLostError
 from pessimistic_payments.domain import Charge, PaymentIntent, PaymentIntentNotFoundError, PaymentIntentState
 from pessimistic_payments.repository import DynamoDBPaymentIntentRepository
 
@@ -108,3 +115,235 @@ async def test_should_raise_on_not_existing_payment_intent_update(repo: DynamoDB
 
     with pytest.raises(PaymentIntentNotFoundError, match=payment_intent.id):
         await repo.get(payment_intent.id)
+
+
+@pytest.mark.asyncio()
+async def test_should_reject_update_from_lock_holder_with_stale_fencing_token(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    # Arrange
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+
+    # Act
+    with pytest.raises(PessimisticLockLostError, match=payment_intent.id):  # noqa: PT012
+        async with repo.lock(payment_intent.id) as locked_payment_intent:
+            # Lock expired and was acquired by another holder, which incremented the fencing token
+            await localstack_dynamodb_client.update_item(
+                TableName=dynamodb_table_name,
+                Key={"PK": {"S": f"PAYMENT_INTENT#{payment_intent.id}"}, "SK": {"S": "#PAYMENT_INTENT"}},
+                UpdateExpression="ADD #FencingToken :One",
+                ExpressionAttributeNames={"#FencingToken": "__FencingToken"},
+                ExpressionAttributeValues={":One": {"N": "1"}},
+            )
+
+            locked_payment_intent.change_amount(200)
+            await repo.update(locked_payment_intent)
+
+    # Assert
+    assert (await repo.get(payment_intent.id)).amount == 100
+
+
+@pytest.mark.asyncio()
+async def test_lock_loads_payment_intent_without_separate_read(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    get_item_spy = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    async with repo.lock(payment_intent.id) as locked_payment_intent:
+        assert locked_payment_intent == payment_intent
+
+    get_item_spy.assert_not_called()
+
+
+@pytest.mark.asyncio()
+async def test_update_under_lock_releases_lock_in_the_same_write(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    update_item_spy = mocker.spy(localstack_dynamodb_client, "update_item")
+
+    async with repo.lock(payment_intent.id) as locked_payment_intent:
+        locked_payment_intent.change_amount(200)
+        await repo.update(locked_payment_intent)
+
+    assert update_item_spy.call_count == 2  # Lock acquisition and update with lock release
+    assert (await repo.get(payment_intent.id)).amount == 200
+    async with repo.lock(payment_intent.id):
+        pass
+
+
+@pytest.mark.asyncio()
+async def test_update_from_task_spawned_under_lock_does_not_release_lock(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+
+    async with repo.lock(payment_intent.id) as locked_payment_intent:
+        locked_payment_intent.change_amount(200)
+        await asyncio.create_task(repo.update(locked_payment_intent))
+
+        item = await localstack_dynamodb_client.get_item(
+            TableName=dynamodb_table_name,
+            Key={"PK": {"S": f"PAYMENT_INTENT#{payment_intent.id}"}, "SK": {"S": "#PAYMENT_INTENT"}},
+        )
+        assert item["Item"]["Amount"] == {"N": "200"}
+        assert "__LockedAt" in item["Item"]
+
+
+@pytest.mark.asyncio()
+async def test_update_after_heartbeat_saw_lock_taken_over_is_rejected_without_writing(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    lock = DynamoDBPessimisticLock(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        lock_timeout=datetime.timedelta(milliseconds=300),
+        heartbeat_interval=datetime.timedelta(milliseconds=100),
+        fencing_token_attribute="__FencingToken",
+    )
+    repo = DynamoDBPaymentIntentRepository(localstack_dynamodb_client, dynamodb_table_name, lock=lock)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+
+    with pytest.raises(PessimisticLockLostError, match=payment_intent.id):  # noqa: PT012
+        async with repo.lock(payment_intent.id) as locked_payment_intent:
+            # Another holder took the lock over and wrote its update
+            await localstack_dynamodb_client.update_item(
+                TableName=dynamodb_table_name,
+                Key={"PK": {"S": f"PAYMENT_INTENT#{payment_intent.id}"}, "SK": {"S": "#PAYMENT_INTENT"}},
+                UpdateExpression="SET #LockedAt = :LockedAt, #Amount = :Amount ADD #FencingToken :One",
+                ExpressionAttributeNames={
+                    "#LockedAt": "__LockedAt",
+                    "#Amount": "Amount",
+                    "#FencingToken": "__FencingToken",
+                },
+                ExpressionAttributeValues={":LockedAt": {"S": "9999"}, ":Amount": {"N": "999"}, ":One": {"N": "1"}},
+            )
+            await asyncio.sleep(0.25)
+
+            locked_payment_intent.change_amount(1)
+            await repo.update(locked_payment_intent)
+
+    assert (await repo.get(payment_intent.id)).amount == 999
+
+
+@pytest.mark.asyncio()
+async def test_update_from_task_spawned_under_lock_is_fenced(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+
+    with pytest.raises(PessimisticLockLostError, match=payment_intent.id):  # noqa: PT012
+        async with repo.lock(payment_intent.id) as locked_payment_intent:
+            await localstack_dynamodb_client.update_item(
+                TableName=dynamodb_table_name,
+                Key={"PK": {"S": f"PAYMENT_INTENT#{payment_intent.id}"}, "SK": {"S": "#PAYMENT_INTENT"}},
+                UpdateExpression="ADD #FencingToken :One",
+                ExpressionAttributeNames={"#FencingToken": "__FencingToken"},
+                ExpressionAttributeValues={":One": {"N": "1"}},
+            )
+
+            locked_payment_intent.change_amount(200)
+            await asyncio.create_task(repo.update(locked_payment_intent))
+
+    assert (await repo.get(payment_intent.id)).amount == 100
+
+
+@pytest.mark.asyncio()
+async def test_update_after_lock_was_released_is_fenced(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+
+    async with repo.lock(payment_intent.id) as locked_payment_intent:
+        locked_payment_intent.change_amount(200)
+        await repo.update(locked_payment_intent)  # Releases the lock
+
+        locked_payment_intent.change_amount(300)
+        await repo.update(locked_payment_intent)
+        assert (await repo.get(payment_intent.id)).amount == 300
+
+        # Lock acquired by another holder
+        await localstack_dynamodb_client.update_item(
+            TableName=dynamodb_table_name,
+            Key={"PK": {"S": f"PAYMENT_INTENT#{payment_intent.id}"}, "SK": {"S": "#PAYMENT_INTENT"}},
+            UpdateExpression="ADD #FencingToken :One",
+            ExpressionAttributeNames={"#FencingToken": "__FencingToken"},
+            ExpressionAttributeValues={":One": {"N": "1"}},
+        )
+        locked_payment_intent.change_amount(400)
+        with pytest.raises(PessimisticLockLostError, match=payment_intent.id):
+            await repo.update(locked_payment_intent)
+
+    assert (await repo.get(payment_intent.id)).amount == 300
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_creates_are_group_committed(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(
+        localstack_dynamodb_client,
+        dynamodb_table_name,
+        group_commit=DynamoDBGroupCommitWriter(localstack_dynamodb_client),
+    )
+    existing_payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(existing_payment_intent)
+    payment_intents = [PaymentIntent.create("cust_123456", 100, "USD") for _ in range(5)]
+    transact_write_items = mocker.spy(localstack_dynamodb_client, "transact_write_items")
+
+    results = await asyncio.gather(
+        *[repo.create(payment_intent) for payment_intent in [*payment_intents, existing_payment_intent]],
+        return_exceptions=True,
+    )
+
+    assert results[:5] == [None] * 5
+    assert isinstance(results[5], ClientError)
+    assert transact_write_items.call_count == 2  # Retried without the item that already exists
+    for payment_intent in payment_intents:
+        assert await repo.get(payment_intent.id) == payment_intent
+
+
+@pytest.mark.asyncio()
+async def test_update_writes_only_changed_attributes(
+    repo: DynamoDBPaymentIntentRepository, localstack_dynamodb_client: DynamoDBClient, mocker: MockerFixture
+) -> None:
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    payment_intent = await repo.get(payment_intent.id)
+    update_item = mocker.spy(localstack_dynamodb_client, "update_item")
+
+    await repo.update(payment_intent)
+    assert update_item.call_count == 0  # Nothing changed
+
+    payment_intent.change_amount(200)
+    await repo.update(payment_intent)
+
+    assert update_item.call_args.kwargs["UpdateExpression"] == "SET #Amount = :Amount"
+    assert (await repo.get(payment_intent.id)).amount == 200
+
+
+@pytest.mark.asyncio()
+async def test_concurrent_gets_of_same_payment_intent_share_single_read(
+    localstack_dynamodb_client: DynamoDBClient, dynamodb_table_name: str, mocker: MockerFixture
+) -> None:
+    repo = DynamoDBPaymentIntentRepository(localstack_dynamodb_client, dynamodb_table_name, singleflight_gets=True)
+    payment_intent = PaymentIntent.create("cust_123456", 100, "USD")
+    await repo.create(payment_intent)
+    get_item = mocker.spy(localstack_dynamodb_client, "get_item")
+
+    payment_intents = await asyncio.gather(*[repo.get(payment_intent.id) for _ in range(10)])
+
+    assert get_item.call_count == 1
+    assert all(p == payment_intent for p in payment_intents)
+    assert len({id(p) for p in payment_intents}) == 10  # Every caller gets its own aggregate
+    with pytest.raises(PaymentIntentNotFoundError):
+        await asyncio.gather(repo.get("pi_123456"), repo.get("pi_123456"))
+    assert get_item.call_count == 2